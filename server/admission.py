@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Queue statistics and admission control for the processing pipeline.
+
+Workers publish their capacity to the ``workers`` collection and the
+current admission limits to ``pipelinestatus`` (``_id: "admission"``).
+The upload route reads those limits and compares them with a fresh count
+of queued jobs, so a burst of uploads is queued, degraded to a smaller
+Whisper model, or rejected with Retry-After instead of overwhelming the
+host.
+
+Examples:
+    python admission.py              # print current queue statistics as JSON
+"""
+import os
+import json
+import math
+import datetime
+import logging
+from typing import Dict, Optional
+
+from jobqueue import JOBS_COLLECTION, utcnow
+
+logger = logging.getLogger(__name__)
+
+
+WORKERS_COLLECTION = "workers"
+STATUS_COLLECTION = "pipelinestatus"
+STATUS_ID = "admission"
+WORKER_TTL_SECONDS = 60
+
+# Processing seconds per second of audio, used until real timings exist
+DEFAULT_REALTIME_FACTOR = 0.5
+DEFAULT_JOB_SECONDS = 180.0
+TIMING_SAMPLE = 50
+
+MAX_QUEUE_DEPTH = 200
+DEGRADE_DRAIN_SECONDS = 15 * 60
+REJECT_DRAIN_SECONDS = 60 * 60
+DEGRADED_MODEL = "tiny"
+
+
+def publish_worker(db, worker_id: str, slots: int, active: int) -> None:
+    db[WORKERS_COLLECTION].update_one(
+        {"_id": worker_id},
+        {"$set": {"slots": slots, "active": active, "updatedAt": utcnow()}},
+        upsert=True
+    )
+
+
+def remove_worker(db, worker_id: str) -> None:
+    db[WORKERS_COLLECTION].delete_one({"_id": worker_id})
+
+
+def realtime_factor(db, sample: int = TIMING_SAMPLE) -> float:
+    """Measured processing seconds per audio second over recently finished jobs."""
+    recent = db[JOBS_COLLECTION].find(
+        {"status": "done", "estimatedSeconds": {"$gt": 0}},
+        {"estimatedSeconds": 1, "stages": 1},
+        sort=[("completedAt", -1)],
+        limit=sample
+    )
+    audio = work = 0.0
+    for job in recent:
+        seconds = sum((stage or {}).get("seconds", 0) for stage in (job.get("stages") or {}).values())
+        if seconds:
+            audio += job["estimatedSeconds"]
+            work += seconds
+    return work / audio if audio else DEFAULT_REALTIME_FACTOR
+
+
+def queue_stats(db) -> Dict:
+    """
+    Snapshot of pipeline load.
+
+    Returns:
+        Dict with queue depth, in-flight jobs, live capacity (slots across
+        workers seen in the last minute) and the estimated time to drain
+        everything queued or running at the measured processing speed
+    """
+    now = utcnow()
+    rows = db[JOBS_COLLECTION].aggregate([
+        {"$match": {"status": {"$in": ["queued", "leased"]}}},
+        {"$group": {
+            "_id": "$status",
+            "count": {"$sum": 1},
+            "audioSeconds": {"$sum": {"$ifNull": ["$estimatedSeconds", DEFAULT_JOB_SECONDS]}}
+        }}
+    ])
+    by_status = {row["_id"]: row for row in rows}
+    queued = by_status.get("queued", {})
+    leased = by_status.get("leased", {})
+
+    cutoff = now - datetime.timedelta(seconds=WORKER_TTL_SECONDS)
+    capacity = sum(
+        w.get("slots", 0) for w in db[WORKERS_COLLECTION].find({"updatedAt": {"$gte": cutoff}}, {"slots": 1})
+    )
+
+    factor = realtime_factor(db)
+    backlog_audio = queued.get("audioSeconds", 0.0) + leased.get("audioSeconds", 0.0)
+    drain = backlog_audio * factor / capacity if capacity else None
+
+    return {
+        "queueDepth": queued.get("count", 0),
+        "inFlight": leased.get("count", 0),
+        "capacity": capacity,
+        "backlogAudioSeconds": round(backlog_audio, 1),
+        "realtimeFactor": round(factor, 3),
+        "estimatedDrainSeconds": round(drain, 1) if drain is not None else None,
+        "updatedAt": now
+    }
+
+
+class AdmissionPolicy:
+    """
+    Bounded admission for new uploads.
+
+    Limits are expressed as drain time (how long until the pipeline would
+    catch up) and converted to queue depths using the average cost of a
+    queued job, so the upload route only has to count jobs:
+
+    - below ``degrade_drain_seconds``: accept normally
+    - below ``reject_drain_seconds``: accept, but transcribe with ``degraded_model``
+    - beyond that, or at ``max_queue_depth``: reject with a Retry-After
+    """
+
+    def __init__(self, max_queue_depth: int = MAX_QUEUE_DEPTH,
+                 degrade_drain_seconds: float = DEGRADE_DRAIN_SECONDS,
+                 reject_drain_seconds: float = REJECT_DRAIN_SECONDS,
+                 degraded_model: str = DEGRADED_MODEL):
+        self.max_queue_depth = max_queue_depth
+        self.degrade_drain_seconds = degrade_drain_seconds
+        self.reject_drain_seconds = reject_drain_seconds
+        self.degraded_model = degraded_model
+
+    def seconds_per_job(self, stats: Dict) -> float:
+        """Drain time one more queued job adds, spread over the live capacity."""
+        jobs = stats["queueDepth"] + stats["inFlight"]
+        audio_per_job = stats["backlogAudioSeconds"] / jobs if jobs else DEFAULT_JOB_SECONDS
+        return audio_per_job * stats["realtimeFactor"] / max(1, stats["capacity"])
+
+    def limits(self, stats: Dict) -> Dict:
+        per_job = max(self.seconds_per_job(stats), 1e-3)
+        reject_depth = min(self.max_queue_depth, max(1, int(self.reject_drain_seconds / per_job)))
+        degrade_depth = min(reject_depth, max(1, int(self.degrade_drain_seconds / per_job)))
+        return {
+            "degradeDepth": degrade_depth,
+            "rejectDepth": reject_depth,
+            "secondsPerJob": round(per_job, 2),
+            "degradedModel": self.degraded_model
+        }
+
+    def decide(self, depth: int, limits: Dict) -> Dict:
+        """
+        Admission decision for one upload given the queued plus running job count.
+
+        Mirrors the check in routes/upload.js so simulations and the live
+        route agree.
+        """
+        if depth >= limits["rejectDepth"]:
+            # Come back once the backlog is down to the normal-service level
+            over = depth - limits["degradeDepth"] + 1
+            return {"action": "reject", "retryAfter": max(1, math.ceil(over * limits["secondsPerJob"]))}
+        if depth >= limits["degradeDepth"]:
+            return {"action": "degrade", "modelName": limits["degradedModel"]}
+        return {"action": "accept"}
+
+
+def publish_status(db, policy: Optional[AdmissionPolicy] = None) -> Dict:
+    """Compute stats and limits and store them where the upload route reads them."""
+    policy = policy or AdmissionPolicy()
+    stats = queue_stats(db)
+    status = {**stats, "limits": policy.limits(stats)}
+    db[STATUS_COLLECTION].update_one({"_id": STATUS_ID}, {"$set": status}, upsert=True)
+    return status
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    try:
+        status = publish_status(client["finsense-ai"])
+        print(json.dumps(status, indent=2, default=str))
+    finally:
+        client.close()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Columnar export of extracted call data for offline analysis.
+
+Calls are exported incrementally (everything extracted since the last run)
+to Parquet files partitioned by upload day::
+
+    analytics/calls/day=2026-01-31/part-<run>.parquet
+
+Each run appends one file per day it touched, so the exporter can run from
+cron or after every batch of jobs. ``compact`` rewrites a day into a single
+file and drops superseded rows for re-extracted calls; queries drop them too,
+so compaction only matters for file count.
+
+Requires ``pyarrow`` (imported when an export or query actually runs).
+
+Examples:
+    python analytics_export.py export
+    python analytics_export.py compact --day 2026-01-31
+    python analytics_export.py query --by intent --from 2026-01-01
+"""
+import os
+import json
+import argparse
+import datetime
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+EXPORT_DIR = Path(os.getenv('ANALYTICS_DIR', Path(__file__).resolve().parent.parent / 'analytics' / 'calls'))
+STATE_COLLECTION = "pipelinestatus"
+STATE_ID = "analyticsExport"
+BATCH_SIZE = 5000
+# extractedAt is stamped before the write commits, so a call can become visible
+# after a later one was exported; each run re-reads this far behind the watermark
+EXPORT_LAG_SECONDS = float(os.getenv('ANALYTICS_EXPORT_LAG', '300'))
+
+# (column, arrow type name, keyDetails field) for the extracted fields
+DETAIL_COLUMNS = [
+    ("intent", "string", "intent"),
+    ("amount", "float64", "amount"),
+    ("payment_method", "string", "payment_method"),
+    ("payment_date", "string", "payment_date"),
+    ("sentiment", "string", "sentiment"),
+    ("satisfaction", "string", "satisfaction"),
+    ("mood", "string", "mood"),
+    ("fraud", "bool", "fraud"),
+    ("risk_flag", "bool", "risk_flag"),
+    ("duration", "float64", "duration"),
+    ("size", "int64", "size"),
+    ("mimetype", "string", "mimetype"),
+]
+
+TRUE_VALUES = {"yes", "true", "1"}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        import pyarrow.dataset as ds
+        import pyarrow.compute as pc
+    except ImportError as e:
+        raise ImportError("Analytics export requires pyarrow: pip install pyarrow") from e
+    return pa, pq, ds, pc
+
+
+def schema():
+    pa = _pyarrow()[0]
+    fields = [
+        pa.field("file_id", pa.string(), nullable=False),
+        pa.field("created_at", pa.timestamp("ms", tz="UTC")),
+        pa.field("extracted_at", pa.timestamp("ms", tz="UTC")),
+        pa.field("voice_id", pa.string()),
+    ]
+    fields += [pa.field(column, pa.type_for_alias(type_name)) for column, type_name, _ in DETAIL_COLUMNS]
+    return pa.schema(fields)
+
+
+def _coerce(value, type_name: str):
+    if value is None or value == "":
+        return None
+    try:
+        if type_name == "float64":
+            return float(value)
+        if type_name == "int64":
+            return int(value)
+        if type_name == "bool":
+            return str(value).lower() in TRUE_VALUES
+        return str(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def to_row(file_doc: Dict) -> Dict:
+    """Flatten one FileInfo document into a typed export row."""
+    details = file_doc.get("keyDetails") or {}
+    row = {
+        "file_id": str(file_doc["_id"]),
+        "created_at": _utc(file_doc.get("createdAt")),
+        "extracted_at": _utc(file_doc.get("extractedAt")),
+        "voice_id": _coerce(file_doc.get("voiceID"), "string"),
+    }
+    for column, type_name, field in DETAIL_COLUMNS:
+        row[column] = _coerce(details.get(field), type_name)
+    return row
+
+
+def write_rows(rows: List[Dict], out_dir: Path = EXPORT_DIR, run_id: Optional[str] = None) -> List[Path]:
+    """
+    Append rows as one new Parquet file per upload day.
+
+    Returns:
+        Paths of the files written
+    """
+    pa, pq, _, _ = _pyarrow()
+    run_id = run_id or datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+    by_day: Dict[str, List[Dict]] = {}
+    for row in rows:
+        created = row["created_at"] or row["extracted_at"]
+        by_day.setdefault(created.strftime("%Y-%m-%d"), []).append(row)
+
+    written = []
+    for day, day_rows in sorted(by_day.items()):
+        day_dir = Path(out_dir) / f"day={day}"
+        day_dir.mkdir(parents=True, exist_ok=True)
+        path = day_dir / f"part-{run_id}.parquet"
+        pq.write_table(pa.Table.from_pylist(day_rows, schema=schema()), path, compression="zstd")
+        written.append(path)
+    return written
+
+
+def export_calls(files, state, out_dir: Path = EXPORT_DIR, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Export every call extracted since the previous run.
+
+    The watermark (``extractedAt`` of the last exported call) is stored in
+    ``pipelinestatus`` and only advanced after the files are written, so an
+    interrupted run re-exports rather than loses calls. Each run also
+    re-reads ``EXPORT_LAG_SECONDS`` behind the watermark, for calls whose
+    write committed late; the calls already exported from that window are
+    remembered in the marker and skipped.
+
+    Returns:
+        Number of calls exported
+    """
+    marker = state.find_one({"_id": STATE_ID}) or {}
+    since = _utc(marker.get("extractedAt"))
+    recent = {(entry["fileId"], _utc(entry["extractedAt"])) for entry in marker.get("recent", [])}
+    lag = datetime.timedelta(seconds=EXPORT_LAG_SECONDS)
+    query = {"extractedAt": {"$gt": since - lag} if since else {"$exists": True}}
+    projection = {"createdAt": 1, "extractedAt": 1, "voiceID": 1, "keyDetails": 1}
+
+    exported = 0
+    batch = []
+    cursor = files.find(query, projection).sort("extractedAt", 1)
+    for doc in cursor:
+        row = to_row(doc)
+        if (row["file_id"], row["extracted_at"]) in recent:
+            continue
+        batch.append(row)
+        if len(batch) >= batch_size:
+            exported, since = exported + len(batch), _flush(batch, state, out_dir, since, recent)
+            batch = []
+    if batch:
+        exported, since = exported + len(batch), _flush(batch, state, out_dir, since, recent)
+
+    logger.info(f"Exported {exported} call(s) to {out_dir}")
+    return exported
+
+
+def _flush(batch: List[Dict], state, out_dir: Path, since: Optional[datetime.datetime], recent: set):
+    """Write a batch, then advance the watermark and the set of calls exported within the lag window."""
+    write_rows(batch, out_dir)
+    watermark = max([row["extracted_at"] for row in batch] + ([since] if since else []))
+    horizon = watermark - datetime.timedelta(seconds=EXPORT_LAG_SECONDS)
+    recent.update((row["file_id"], row["extracted_at"]) for row in batch)
+    recent.intersection_update({pair for pair in recent if pair[1] > horizon})
+    state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {
+            "extractedAt": watermark,
+            "recent": [{"fileId": file_id, "extractedAt": at} for file_id, at in sorted(recent, key=lambda p: p[1])],
+            "updatedAt": datetime.datetime.now(datetime.timezone.utc)
+        }},
+        upsert=True
+    )
+    return watermark
+
+
+def latest_per_call(table):
+    """Keep only the newest export of each call (calls can be re-extracted, and a late commit re-read)."""
+    if table.num_rows == 0:
+        return table
+    table = table.sort_by([("file_id", "ascending"), ("extracted_at", "descending")])
+    ids = table.column("file_id").to_numpy(zero_copy_only=False)
+    keep = np.ones(len(ids), dtype=bool)
+    keep[1:] = ids[1:] != ids[:-1]
+    return table.filter(keep)
+
+
+def load(out_dir: Path = EXPORT_DIR, columns: Optional[Iterable[str]] = None,
+         start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Read the export as one Arrow table, pruning day partitions outside
+    ``start``..``end`` (inclusive, YYYY-MM-DD) before any file is opened.
+    """
+    _, _, ds, pc = _pyarrow()
+    dataset = ds.dataset(str(out_dir), format="parquet", partitioning="hive")
+
+    expression = None
+    for op, bound in ((pc.greater_equal, start), (pc.less_equal, end)):
+        if bound:
+            condition = op(ds.field("day"), bound)
+            expression = condition if expression is None else expression & condition
+
+    wanted = None
+    if columns is not None:
+        wanted = sorted(set(columns) | {"file_id", "extracted_at"})
+    return latest_per_call(dataset.to_table(columns=wanted, filter=expression))
+
+
+def summarize(table, by: str = "intent"):
+    """Portfolio summary per ``by`` value: calls, total and mean amount, mean duration, fraud and risk counts."""
+    pc = _pyarrow()[3]
+    table = table.append_column("fraud_count", pc.cast(pc.fill_null(table["fraud"], False), "int64"))
+    table = table.append_column("risk_count", pc.cast(pc.fill_null(table["risk_flag"], False), "int64"))
+    return table.group_by(by).aggregate([
+        ("file_id", "count"),
+        ("amount", "sum"),
+        ("amount", "mean"),
+        ("duration", "mean"),
+        ("fraud_count", "sum"),
+        ("risk_count", "sum"),
+    ]).sort_by([("file_id_count", "descending")])
+
+
+def compact(day: str, out_dir: Path = EXPORT_DIR) -> int:
+    """
+    Rewrite one day partition as a single file without superseded rows.
+
+    Returns:
+        Rows kept
+    """
+    _, pq, ds, _ = _pyarrow()
+    day_dir = Path(out_dir) / f"day={day}"
+    parts = sorted(day_dir.glob("part-*.parquet"))
+    if len(parts) <= 1:
+        return pq.read_metadata(parts[0]).num_rows if parts else 0
+
+    table = latest_per_call(ds.dataset([str(p) for p in parts], schema=schema(), format="parquet").to_table())
+    run_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    # Readers skip "_" files; until the old parts are gone, queries dedupe the overlap
+    staging = day_dir / f"_compact-{run_id}.parquet"
+    pq.write_table(table, staging, compression="zstd")
+    staging.rename(day_dir / f"part-{run_id}-compacted.parquet")
+    for part in parts:
+        part.unlink()
+    return table.num_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar analytics export of extracted calls")
+    parser.add_argument("--dir", default=str(EXPORT_DIR), help="Export root directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("export", help="Append calls extracted since the last export")
+
+    compact_parser = sub.add_parser("compact", help="Merge a day's files into one")
+    compact_parser.add_argument("--day", required=True, help="Day to compact (YYYY-MM-DD)")
+
+    query_parser = sub.add_parser("query", help="Summarize the export")
+    query_parser.add_argument("--by", default="intent", help="Column to group by")
+    query_parser.add_argument("--from", dest="start", help="First day (YYYY-MM-DD)")
+    query_parser.add_argument("--to", dest="end", help="Last day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    out_dir = Path(args.dir)
+
+    if args.command == "export":
+        from pymongo import MongoClient
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+        try:
+            db = client["finsense-ai"]
+            export_calls(db["fileinfos"], db[STATE_COLLECTION], out_dir)
+        finally:
+            client.close()
+    elif args.command == "compact":
+        print(json.dumps({"day": args.day, "rows": compact(args.day, out_dir)}))
+    else:
+        table = load(out_dir, start=args.start, end=args.end)
+        for row in summarize(table, args.by).to_pylist():
+            print(json.dumps(row, default=str))
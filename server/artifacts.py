@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Content-addressed artifact store shared by workers on any number of nodes.
+
+Uploads and stage outputs used to be plain paths on the machine that made
+them (``fileAddress``, ``_cleaned.wav``, ``_diarization.seg``,
+``_transcript.json``), so every stage of a job had to run where the upload
+landed. Here they are blobs keyed by the SHA-256 of their bytes plus the
+file extension (``<sha256>.wav``):
+
+* ``local`` backend: a directory tree (``ARTIFACT_DIR``), for one machine
+  or a mounted volume;
+* ``s3`` backend: any S3-compatible service (``ARTIFACT_BUCKET``,
+  ``ARTIFACT_S3_ENDPOINT``; boto3 must be installed). ``s3_stub.py`` is
+  a local stand-in for development.
+
+A key never changes meaning, so a blob is uploaded once however many jobs
+produce it, and a copy can be verified against its key. Reads are
+streamed in byte ranges: :meth:`ArtifactStore.open` gives a seekable file
+object that fetches only what is read (enough for an audio header), and
+:class:`ReadThroughCache` keeps whole blobs on local disk for the stages
+that need a path, evicting the least recently used beyond
+``ARTIFACT_CACHE_MB``.
+
+Examples:
+    python artifacts.py put ./files/1700000000000.mp3
+    python artifacts.py get 3f...9a.mp3 /tmp/call.mp3
+    python artifacts.py stat 3f...9a.mp3
+    python artifacts.py init            # create the bucket (s3 backend)
+"""
+import io
+import os
+import re
+import json
+import shutil
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+STORE_BACKEND = os.getenv('ARTIFACT_STORE', 'local')
+ARTIFACT_DIR = Path(os.getenv('ARTIFACT_DIR', Path(__file__).resolve().parent.parent / 'artifacts'))
+CACHE_DIR = Path(os.getenv('ARTIFACT_CACHE_DIR', Path(__file__).resolve().parent / 'artifact_cache'))
+CACHE_BYTES = int(float(os.getenv('ARTIFACT_CACHE_MB', '2048')) * (1 << 20))
+S3_BUCKET = os.getenv('ARTIFACT_BUCKET', 'finsense-artifacts')
+S3_ENDPOINT = os.getenv('ARTIFACT_S3_ENDPOINT')
+S3_PREFIX = os.getenv('ARTIFACT_S3_PREFIX', '')
+CHUNK_BYTES = 1 << 20
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$")
+
+
+def hash_file(path: str, block_size: int = CHUNK_BYTES) -> Tuple[str, int]:
+    """SHA-256 hex digest and size of a file, read in blocks."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def content_key(digest: str, ext: str = "") -> str:
+    return f"{digest}{ext.lower()}"
+
+
+def check_key(key: str) -> str:
+    if not KEY_PATTERN.match(key):
+        raise ValueError(f"Not an artifact key: {key!r}")
+    return key
+
+
+def shard(key: str) -> str:
+    """Relative location of a key; two-character directories keep listings short."""
+    return f"{key[:2]}/{key}"
+
+
+class ArtifactStore:
+    """Blobs addressed by content. Backends implement the underscore methods."""
+
+    name = "base"
+
+    def put_file(self, path: str, ext: Optional[str] = None) -> Dict:
+        """
+        Store a file (once) under its content key.
+
+        Returns:
+            ``{"key", "size"}`` to record on the job or file document
+        """
+        digest, size = hash_file(path)
+        key = content_key(digest, Path(path).suffix if ext is None else ext)
+        if not self.exists(key):
+            self._upload(path, key)
+            logger.info(f"Stored {Path(path).name} as {key} ({size} bytes, {self.name})")
+        return {"key": key, "size": size}
+
+    def put_bytes(self, data: bytes, ext: str = "") -> Dict:
+        key = content_key(hashlib.sha256(data).hexdigest(), ext)
+        if not self.exists(key):
+            self._upload_bytes(data, key)
+        return {"key": key, "size": len(data)}
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        """Up to ``length`` bytes from ``start`` (fewer at the end of the blob)."""
+        if length <= 0:
+            return b""
+        return self._read_range(check_key(key), start, start + length)
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+        """Stream ``[start, end)`` of a blob in chunks."""
+        end = self.size(key) if end is None else end
+        for offset in range(start, end, chunk_bytes):
+            yield self._read_range(check_key(key), offset, min(end, offset + chunk_bytes))
+
+    def open(self, key: str, buffer_bytes: int = 64 * 1024) -> io.BufferedReader:
+        """Seekable, read-only file object that fetches byte ranges on demand."""
+        return io.BufferedReader(ArtifactReader(self, check_key(key)), buffer_size=buffer_bytes)
+
+    def download(self, key: str, dest: str) -> None:
+        with open(dest, "wb") as f:
+            for chunk in self.iter_range(key):
+                f.write(chunk)
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the blob itself when the backend is a local filesystem, else None."""
+        return None
+
+    # Backend interface
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _upload(self, path: str, key: str) -> None:
+        raise NotImplementedError
+
+    def _upload_bytes(self, data: bytes, key: str) -> None:
+        raise NotImplementedError
+
+    def _read_range(self, key: str, start: int, end: int) -> bytes:
+        raise NotImplementedError
+
+
+class LocalStore(ArtifactStore):
+    """Blobs under a directory; writes go through a staging file and an atomic rename."""
+
+    name = "local"
+
+    def __init__(self, root: Path = ARTIFACT_DIR):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / shard(check_key(key))
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def size(self, key: str) -> int:
+        return self._path(key).stat().st_size
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return str(path) if path.exists() else None
+
+    def _staging(self, key: str) -> Path:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+    def _upload(self, path: str, key: str) -> None:
+        staging = self._staging(key)
+        shutil.copyfile(path, staging)
+        os.replace(staging, self._path(key))
+
+    def _upload_bytes(self, data: bytes, key: str) -> None:
+        staging = self._staging(key)
+        staging.write_bytes(data)
+        os.replace(staging, self._path(key))
+
+    def _read_range(self, key: str, start: int, end: int) -> bytes:
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            return f.read(max(0, end - start))
+
+
+class S3Store(ArtifactStore):
+    """Blobs in an S3-compatible bucket (AWS, MinIO, ``s3_stub.py``)."""
+
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT,
+                 prefix: str = S3_PREFIX, client=None):
+        if client is None:
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError as e:
+                raise ImportError("The s3 artifact store needs boto3: pip install boto3") from e
+            client = boto3.client("s3", endpoint_url=endpoint_url,
+                                  config=Config(s3={"addressing_style": "path"}, retries={"mode": "standard"}))
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _object(self, key: str) -> str:
+        return f"{self.prefix}{shard(check_key(key))}"
+
+    def _head(self, key: str) -> Optional[Dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def ensure_bucket(self) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError:
+            self.client.create_bucket(Bucket=self.bucket)
+            logger.info(f"Created bucket {self.bucket}")
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return int(head["ContentLength"])
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def _upload(self, path: str, key: str) -> None:
+        # Multipart for large files, streamed from disk
+        self.client.upload_file(path, self.bucket, self._object(key))
+
+    def _upload_bytes(self, data: bytes, key: str) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._object(key), Body=data)
+
+    def _read_range(self, key: str, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object(key),
+                                          Range=f"bytes={start}-{end - 1}")
+        return response["Body"].read()
+
+    def download(self, key: str, dest: str) -> None:
+        # Parallel ranged GETs for large objects
+        self.client.download_file(self.bucket, self._object(key), dest)
+
+
+class ArtifactReader(io.RawIOBase):
+    """Raw seekable reader over a blob; each read is one range request (wrap in a buffer)."""
+
+    def __init__(self, store: ArtifactStore, key: str):
+        self.store = store
+        self.key = key
+        self.length = store.size(key)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        data = self.store.read_range(self.key, self.position, min(len(buffer), self.length - self.position))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class ReadThroughCache:
+    """
+    Local copies of blobs for stages that need a file path.
+
+    Downloads stream to a staging file and are checked against the key
+    before they become visible. Files are touched on every hit, and the
+    least recently used are evicted once the cache passes ``max_bytes``.
+    """
+
+    def __init__(self, store: ArtifactStore, directory: Path = CACHE_DIR, max_bytes: int = CACHE_BYTES):
+        self.store = store
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, key: str) -> str:
+        local = self.store.local_path(key)
+        if local:
+            return local
+
+        cached = self.directory / shard(check_key(key))
+        if cached.exists():
+            os.utime(cached)
+            return str(cached)
+
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        staging = cached.with_name(f"{cached.name}.{os.getpid()}.part")
+        try:
+            self.store.download(key, str(staging))
+            digest, _ = hash_file(str(staging))
+            if content_key(digest, Path(key).suffix) != key:
+                raise IOError(f"Artifact {key} failed verification after download")
+            os.replace(staging, cached)
+        finally:
+            staging.unlink(missing_ok=True)
+        self.evict(keep=cached)
+        return str(cached)
+
+    def has(self, key: str) -> bool:
+        """Whether the blob can be read without going to a remote store."""
+        return bool(self.store.local_path(key)) or (self.directory / shard(check_key(key))).exists()
+
+    def materialize(self, key: str, dest: str) -> str:
+        """Put a blob at ``dest``: a hard link to the cached copy where possible, else a copy."""
+        source = self.path(key)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() and os.path.samefile(source, dest):
+            return str(dest)
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(source, dest)
+        except OSError:
+            shutil.copyfile(source, dest)
+        return str(dest)
+
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """Remove least recently used copies beyond ``max_bytes``; returns bytes freed."""
+        if not self.directory.exists():
+            return 0
+        files = [(path.stat(), path) for path in self.directory.glob("*/*") if not path.name.endswith((".part", ".tmp"))]
+        total = sum(stat.st_size for stat, _ in files)
+        freed = 0
+        for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+            if total - freed <= self.max_bytes:
+                break
+            if keep is not None and path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            freed += stat.st_size
+        if freed:
+            logger.info(f"Artifact cache evicted {freed / (1 << 20):.1f} MB")
+        return freed
+
+
+def open_store(backend: Optional[str] = None) -> ArtifactStore:
+    backend = (backend or STORE_BACKEND).lower()
+    if backend == "local":
+        return LocalStore()
+    if backend == "s3":
+        return S3Store()
+    raise ValueError(f"Unknown artifact store {backend!r} (expected local or s3)")
+
+
+_default_cache = None
+
+
+def default_cache() -> ReadThroughCache:
+    """The process's cache over the configured store."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ReadThroughCache(open_store())
+    return _default_cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed artifact store")
+    parser.add_argument("--backend", choices=["local", "s3"], default=STORE_BACKEND)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    put_parser = sub.add_parser("put", help="Store a file and print its key")
+    put_parser.add_argument("path")
+
+    get_parser = sub.add_parser("get", help="Fetch a blob through the local cache")
+    get_parser.add_argument("key")
+    get_parser.add_argument("dest")
+
+    stat_parser = sub.add_parser("stat", help="Size of a blob")
+    stat_parser.add_argument("key")
+
+    sub.add_parser("init", help="Create the bucket (s3 backend)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = open_store(args.backend)
+
+    if args.command == "put":
+        print(json.dumps(store.put_file(args.path)))
+    elif args.command == "get":
+        print(ReadThroughCache(store).materialize(args.key, args.dest))
+    elif args.command == "stat":
+        print(json.dumps({"key": args.key, "exists": store.exists(args.key),
+                          "size": store.size(args.key) if store.exists(args.key) else None}))
+    elif isinstance(store, S3Store):
+        store.ensure_bucket()
@@ -2,29 +2,71 @@ import os
 import argparse
 import logging
 import numpy as np
-import librosa
-import soundfile as sf
-import noisereduce as nr
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
-from scipy.signal import butter, sosfilt
 from pymongo import MongoClient
 from bson import ObjectId
 from dotenv import load_dotenv
 
+from stereo import is_channel_split
+
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-AudioSegment.converter = os.path.join(os.getcwd(), "ffmpeg.exe")
 
 # MongoDB Configuration
 MONGO_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
 DB_NAME = "finsense-ai"
 COLLECTION_NAME = "fileinfos"
 
+# Cleaned audio is kept compressed: flac (lossless) or opus (lossy, several times smaller)
+CLEANED_AUDIO_FORMAT = os.getenv('CLEANED_AUDIO_FORMAT', 'flac')
+# (soundfile format, subtype, extension)
+AUDIO_CODECS = {
+    "flac": ("FLAC", "PCM_16", ".flac"),
+    "opus": ("OGG", "OPUS", ".opus"),
+}
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+ENCODE_BLOCK_FRAMES = 1 << 16
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+def _audio_segment():
+    """Import pydub on first use (it is slow to import) and point it at the bundled ffmpeg."""
+    from pydub import AudioSegment
+    
+    AudioSegment.converter = os.path.join(os.getcwd(), "ffmpeg.exe")
+    return AudioSegment
+
+
+def compress_audio(wav_path, fmt=CLEANED_AUDIO_FORMAT, block_frames=ENCODE_BLOCK_FRAMES):
+    """
+    Re-encode a WAV as FLAC or Opus one block at a time, so memory stays flat
+    however long the call. The WAV is removed once the encoded file is in place.
+    
+    Returns:
+        Path of the encoded file (``<name>.flac`` or ``<name>.opus``)
+    """
+    import soundfile as sf
+    
+    with sf.SoundFile(wav_path) as src:
+        if fmt == "opus" and src.samplerate not in OPUS_SAMPLE_RATES:
+            logger.warning(f"Opus does not support {src.samplerate} Hz, storing FLAC instead")
+            fmt = "flac"
+        container, subtype, ext = AUDIO_CODECS[fmt]
+        output_path = f"{os.path.splitext(wav_path)[0]}{ext}"
+        staging = f"{output_path}.{os.getpid()}.tmp"
+        with sf.SoundFile(staging, "w", samplerate=src.samplerate, channels=src.channels,
+                          format=container, subtype=subtype) as dst:
+            # FLAC stores the 16-bit samples exactly; Opus encodes from float
+            for block in src.blocks(blocksize=block_frames, dtype="int16" if fmt == "flac" else "float32"):
+                dst.write(block)
+    
+    os.replace(staging, output_path)
+    os.remove(wav_path)
+    return output_path
+
+
 class AudioPreprocessor:
     def __init__(self, target_sr=16000):
         self.target_sr = target_sr
@@ -65,7 +107,8 @@ class AudioPreprocessor:
                     "filename": file_doc.get("keyDetails", {}).get("filename", "Unknown"),
                     "originalname": file_doc.get("keyDetails", {}).get("originalname", "Unknown"),
                     "mimetype": file_doc.get("keyDetails", {}).get("mimetype", "audio/mpeg"),
-                    "size": file_doc.get("keyDetails", {}).get("size", 0)
+                    "size": file_doc.get("keyDetails", {}).get("size", 0),
+                    "lineId": file_doc.get("lineId")
                 }
             else:
                 logger.error(f"File not found in MongoDB with {'ID: ' + file_id if file_id else 'filename: ' + filename}")
@@ -74,16 +117,20 @@ class AudioPreprocessor:
             logger.error(f"Error fetching file from MongoDB: {e}")
             return None
 
-    def load_audio(self, file_path):
+    def load_audio(self, file_path, mono=True):
+        import librosa
+
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         try:
-            y, sr = librosa.load(file_path, sr=self.target_sr, mono=True)
+            y, sr = librosa.load(file_path, sr=self.target_sr, mono=mono)
             return y, sr
         except Exception as e:
             raise RuntimeError(f"Failed to load audio: {e}")
 
     def apply_high_pass_filter(self, y, sr, cutoff=50):
+        from scipy.signal import butter, sosfilt
+
         try:
             sos = butter(5, cutoff, 'hp', fs=sr, output='sos')
             filtered_y = sosfilt(sos, y)
@@ -92,6 +139,8 @@ class AudioPreprocessor:
             return y
 
     def apply_low_pass_filter(self, y, sr, cutoff=8000):
+        from scipy.signal import butter, sosfilt
+
         try:
             sos = butter(5, cutoff, 'lp', fs=sr, output='sos')
             filtered_y = sosfilt(sos, y)
@@ -99,22 +148,80 @@ class AudioPreprocessor:
         except Exception as e:
             return y
 
-    def reduce_noise(self, y, sr):
+    def reduce_noise(self, y, sr, line_id=None):
+        """Spectral gating (denoise.py); ``line_id`` shares a cached noise profile across calls on that line."""
+        from denoise import reduce_noise as spectral_gate
+
         try:
-            reduced_y = nr.reduce_noise(y=y, sr=sr, stationary=True, prop_decrease=0.25, n_std_thresh_stationary=1.5)
-            return reduced_y
+            return spectral_gate(y, sr, line_id=line_id, prop_decrease=0.25, n_std=1.5)
         except Exception as e:
+            logger.warning(f"Noise reduction failed, keeping the filtered signal: {e}")
             return y
 
     def normalize_volume(self, audio_segment, target_dBFS=-20.0):
         change_in_dBFS = target_dBFS - audio_segment.dBFS
         return audio_segment.apply_gain(change_in_dBFS)
 
-    def process_pipeline(self, input_path):
+    def to_segment(self, y, sr):
+        y_int16 = (np.clip(y, -1.0, 1.0) * 32767).astype(np.int16)
+        return _audio_segment()(y_int16.tobytes(), frame_rate=sr, sample_width=2, channels=1)
+
+    def process_channels(self, channels, sr, keep_silence=500, line_id=None):
+        """
+        Clean each channel of a channel-split recording on its own.
+
+        Silence is cut where both channels are silent, using the same ranges
+        for both, so the channels stay time-aligned for diarization.
+        """
+        from pydub.silence import detect_nonsilent
+
+        AudioSegment = _audio_segment()
+        # Agent and customer legs have different noise, so each keeps its own profile
+        cleaned = [
+            self.to_segment(self.reduce_noise(
+                self.apply_high_pass_filter(y, sr), sr, line_id=f"{line_id}-ch{i}" if line_id else None
+            ), sr)
+            for i, y in enumerate(channels)
+        ]
+        mix = AudioSegment.from_mono_audiosegments(*cleaned).set_channels(1)
+        ranges = detect_nonsilent(mix, min_silence_len=800, silence_thresh=-50)
+
+        merged = []
+        for start, end in ranges:
+            start, end = max(0, start - keep_silence), min(len(mix), end + keep_silence)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        if merged:
+            cleaned = [sum((segment[s:e] for s, e in merged), AudioSegment.empty()) for segment in cleaned]
+
+        # Each side is levelled separately; the customer leg is often much quieter
+        cleaned = [self.normalize_volume(segment, target_dBFS=-20.0) for segment in cleaned]
+        return AudioSegment.from_mono_audiosegments(*cleaned)
+
+    def process_pipeline(self, input_path, line_id=None, output_path=None):
+        from pydub.silence import split_on_silence
+
+        AudioSegment = _audio_segment()
         try:
-            y, sr = self.load_audio(input_path)
+            y, sr = self.load_audio(input_path, mono=False)
+            if output_path is None:
+                filename, ext = os.path.splitext(input_path)
+                output_path = f"{filename}_cleaned.wav"
+
+            # Agent and customer on separate channels: keep them apart for channel-split diarization
+            if y.ndim == 2 and len(y) == 2 and is_channel_split(y, sr):
+                final_audio = self.process_channels(y, sr, line_id=line_id)
+                final_audio.export(output_path, format="wav", parameters=["-ac", "2"])
+                logger.info(f"✓ Audio processing complete (channel-split stereo): {output_path}")
+                return output_path
+
+            if y.ndim == 2:
+                y = np.mean(y, axis=0)
             y_filtered = self.apply_high_pass_filter(y, sr)
-            y_denoised = self.reduce_noise(y_filtered, sr)
+            y_denoised = self.reduce_noise(y_filtered, sr, line_id=line_id)
 
             y_int16 = (y_denoised * 32767).astype(np.int16)
             audio_segment = AudioSegment(
@@ -137,9 +244,6 @@ class AudioPreprocessor:
                 processed_audio = sum(chunks)
 
             final_audio = self.normalize_volume(processed_audio, target_dBFS=-20.0)
-
-            filename, ext = os.path.splitext(input_path)
-            output_path = f"{filename}_cleaned.wav"
             
             final_audio.export(output_path, format="wav", parameters=["-ac", "1"])
             logger.info(f"✓ Audio processing complete: {output_path}")
@@ -178,7 +282,7 @@ class AudioPreprocessor:
         logger.info(f"   Size: {file_info['size']} bytes")
         
         # Process the audio file
-        result = self.process_pipeline(file_address)
+        result = self.process_pipeline(file_address, line_id=file_info.get("lineId"))
         
         return result
     
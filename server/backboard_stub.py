@@ -0,0 +1,312 @@
+"""
+Offline stand-ins for the Backboard client used by getStructuresData.
+
+- ``StubBackboardClient`` implements ``create_assistant``, ``create_thread``,
+  ``add_message`` and ``submit_tool_outputs`` locally. It answers every
+  message with a ``submit_clean_report`` tool call built from the
+  transcript (rules plus the pre-filter's regex fields), after a
+  configurable latency, and can inject errors and enforce a rate limit.
+- ``RecordingClient`` wraps any client and appends each exchange to a JSONL
+  cassette; ``ReplayClient`` answers from a cassette, so a benchmark over
+  recorded real responses is deterministic and needs no network.
+
+``create_backboard_client`` picks the client from ``BACKBOARD_MODE``
+(``live`` | ``stub`` | ``record`` | ``replay``) and ``BACKBOARD_CASSETTE``.
+"""
+import os
+import json
+import uuid
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from prefilter import plain_text, prefill_fields
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(__file__), 'backboard_cassette.jsonl')
+
+INTENT_RULES = [
+    ("dispute", ("dispute", "wrong charge", "not my loan", "never took", "fraudulent")),
+    ("refusal", ("won't pay", "will not pay", "not going to pay", "refuse")),
+    ("hardship", ("lost my job", "hospital", "no income", "salary not", "medical")),
+    ("settlement", ("settle", "settlement", "one time", "waive")),
+    ("payment_promise", ("will pay", "i'll pay", "i will transfer", "by tomorrow", "promise")),
+]
+RISK_TERMS = ("lawyer", "sue", "police", "rbi", "court", "harass", "complaint")
+
+
+class BackboardAPIError(Exception):
+    """Error raised by the stub, shaped like an HTTP API failure."""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def content_key(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+
+def fake_report(content: str) -> Dict:
+    """A plausible, deterministic submit_clean_report payload for a transcript."""
+    text = plain_text(content).lower()
+    intent = "query"
+    for candidate, phrases in INTENT_RULES:
+        if any(phrase in text for phrase in phrases):
+            intent = candidate
+            break
+    fields = prefill_fields(text)
+    risk = any(term in text for term in RISK_TERMS)
+    report = {
+        "clean_text": f"Customer call classified as {intent.replace('_', ' ')}.",
+        "summary": f"Stub extraction: {intent.replace('_', ' ')} with {len(text.split())} words of conversation.",
+        "intent": intent,
+        "payment_method": fields.get("payment_method", "NOT_SPECIFIED"),
+        "risk_flag": risk,
+        "sentiment": "upset" if risk else "neutral",
+        "satisfaction": "dissatisfied" if intent in ("dispute", "refusal") else "neutral",
+        "mood": "frustrated" if risk else "calm",
+        "fraud": False,
+        "file_name": "",
+        "file_address": "",
+        "org_file_name": "",
+        "mimetype": "audio/wav",
+    }
+    if "amount" in fields:
+        report["amount"] = fields["amount"]
+    if "payment_date" in fields:
+        report["payment_date"] = fields["payment_date"]
+    return report
+
+
+def _tool_call(name: str, arguments: Dict, call_id: Optional[str] = None):
+    return SimpleNamespace(
+        id=call_id or f"call_{uuid.uuid4().hex[:12]}",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments), parsed_arguments=arguments)
+    )
+
+
+def _message_response(status: str = "COMPLETED", content: str = "", tool_calls: Optional[List] = None,
+                      run_id: Optional[str] = None, total_tokens: Optional[int] = None,
+                      model_provider: str = "stub", model_name: str = "stub"):
+    return SimpleNamespace(
+        status=status,
+        content=content,
+        tool_calls=tool_calls or [],
+        run_id=run_id,
+        total_tokens=total_tokens,
+        model_provider=model_provider,
+        model_name=model_name
+    )
+
+
+def response_to_dict(response) -> Dict:
+    """Serialize an add_message response (stub or SDK object) for a cassette."""
+    tool_calls = []
+    for call in getattr(response, "tool_calls", None) or []:
+        arguments = getattr(call.function, "parsed_arguments", None)
+        if arguments is None:
+            arguments = json.loads(call.function.arguments)
+        tool_calls.append({"id": call.id, "name": call.function.name, "arguments": arguments})
+    return {
+        "status": getattr(response, "status", None),
+        "content": getattr(response, "content", None),
+        "tool_calls": tool_calls,
+        "run_id": getattr(response, "run_id", None),
+        "total_tokens": getattr(response, "total_tokens", None),
+        "model_provider": getattr(response, "model_provider", None),
+        "model_name": getattr(response, "model_name", None),
+    }
+
+
+def response_from_dict(data: Dict):
+    return _message_response(
+        status=data.get("status") or "COMPLETED",
+        content=data.get("content") or "",
+        tool_calls=[_tool_call(c["name"], c["arguments"], c.get("id")) for c in data.get("tool_calls", [])],
+        run_id=data.get("run_id"),
+        total_tokens=data.get("total_tokens"),
+        model_provider=data.get("model_provider") or "replay",
+        model_name=data.get("model_name") or "replay"
+    )
+
+
+class StubBackboardClient:
+    """
+    Local stand-in for ``backboard.BackboardClient``.
+
+    Args:
+        latency: Mean seconds per ``add_message`` (other calls take a tenth of it)
+        jitter: Uniform +/- fraction applied to each latency
+        error_rate: Probability a call raises a 500 BackboardAPIError
+        failed_rate: Probability ``add_message`` returns status FAILED
+        rate_limit: Allowed requests per second across the client (None for unlimited);
+            excess requests raise a 429 with ``retry_after``
+        seed: Seed for latency and error sampling
+    """
+
+    def __init__(self, api_key: Optional[str] = None, latency: float = 1.0, jitter: float = 0.2,
+                 error_rate: float = 0.0, failed_rate: float = 0.0, rate_limit: Optional[float] = None,
+                 seed: Optional[int] = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.failed_rate = failed_rate
+        self.rate_limit = rate_limit
+        self.rng = random.Random(seed)
+        self.calls = {"create_assistant": 0, "create_thread": 0, "add_message": 0, "submit_tool_outputs": 0}
+        self.errors = 0
+        self._tokens = rate_limit or 0.0
+        self._refilled = time.monotonic()
+
+    def _take_token(self) -> None:
+        if not self.rate_limit:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens < 1:
+            self.errors += 1
+            raise BackboardAPIError(429, "Rate limit exceeded", retry_after=(1 - self._tokens) / self.rate_limit)
+        self._tokens -= 1
+
+    async def _call(self, method: str, scale: float = 1.0) -> None:
+        self.calls[method] += 1
+        self._take_token()
+        delay = self.latency * scale * (1 + self.rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(max(0.0, delay))
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise BackboardAPIError(500, f"Injected error in {method}")
+
+    async def create_assistant(self, name: str = "", system_prompt: str = "", tools: Optional[List] = None, **kwargs):
+        await self._call("create_assistant", 0.1)
+        return SimpleNamespace(assistant_id=f"asst_{uuid.uuid4().hex[:12]}", name=name)
+
+    async def create_thread(self, assistant_id: str, **kwargs):
+        await self._call("create_thread", 0.1)
+        return SimpleNamespace(thread_id=f"thread_{uuid.uuid4().hex[:12]}", assistant_id=assistant_id)
+
+    async def add_message(self, thread_id: str, content: str = "", **kwargs):
+        await self._call("add_message")
+        tokens = len(content or "") // 4
+        if self.rng.random() < self.failed_rate:
+            return _message_response(status="FAILED", content="Injected failure", total_tokens=tokens)
+        return _message_response(
+            tool_calls=[_tool_call("submit_clean_report", fake_report(content))],
+            run_id=f"run_{uuid.uuid4().hex[:12]}",
+            total_tokens=tokens + 250
+        )
+
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict], **kwargs):
+        await self._call("submit_tool_outputs", 0.5)
+        return SimpleNamespace(status="COMPLETED", content="Report saved.")
+
+
+class RecordingClient:
+    """Pass calls through to ``inner`` and append each add_message exchange to a JSONL cassette."""
+
+    def __init__(self, inner, cassette_path: str = DEFAULT_CASSETTE):
+        self.inner = inner
+        self.cassette_path = cassette_path
+
+    async def create_assistant(self, *args, **kwargs):
+        return await self.inner.create_assistant(*args, **kwargs)
+
+    async def create_thread(self, *args, **kwargs):
+        return await self.inner.create_thread(*args, **kwargs)
+
+    async def add_message(self, thread_id: str, content: str = "", **kwargs):
+        started = time.monotonic()
+        response = await self.inner.add_message(thread_id=thread_id, content=content, **kwargs)
+        record = {
+            "key": content_key(content),
+            "latency": round(time.monotonic() - started, 3),
+            "response": response_to_dict(response)
+        }
+        with open(self.cassette_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        return response
+
+    async def submit_tool_outputs(self, *args, **kwargs):
+        return await self.inner.submit_tool_outputs(*args, **kwargs)
+
+
+class ReplayClient:
+    """
+    Answer add_message from a cassette recorded by ``RecordingClient``.
+
+    Responses are matched on the message content, so replay does not depend
+    on assistant or thread IDs. ``use_recorded_latency`` sleeps for the
+    recorded time, making throughput runs reflect the real service; a miss
+    raises KeyError unless ``fallback`` (e.g. a stub) is given.
+    """
+
+    def __init__(self, cassette_path: str = DEFAULT_CASSETTE, use_recorded_latency: bool = False,
+                 fallback=None):
+        self.records = {}
+        with open(cassette_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.records[record["key"]] = record
+        self.use_recorded_latency = use_recorded_latency
+        self.fallback = fallback
+        self.served = 0
+        self.misses = 0
+
+    async def create_assistant(self, name: str = "", **kwargs):
+        return SimpleNamespace(assistant_id=f"asst_replay_{uuid.uuid4().hex[:8]}", name=name)
+
+    async def create_thread(self, assistant_id: str, **kwargs):
+        return SimpleNamespace(thread_id=f"thread_replay_{uuid.uuid4().hex[:8]}", assistant_id=assistant_id)
+
+    async def add_message(self, thread_id: str, content: str = "", **kwargs):
+        self.served += 1
+        record = self.records.get(content_key(content))
+        if record is None:
+            self.misses += 1
+            if self.fallback is None:
+                raise KeyError("No recorded response for this message")
+            return await self.fallback.add_message(thread_id=thread_id, content=content, **kwargs)
+        if self.use_recorded_latency:
+            await asyncio.sleep(record.get("latency", 0))
+        return response_from_dict(record["response"])
+
+    async def submit_tool_outputs(self, thread_id: str, run_id: str, tool_outputs: List[Dict], **kwargs):
+        return SimpleNamespace(status="COMPLETED", content="Report saved.")
+
+
+def create_backboard_client(api_key: Optional[str] = None, mode: Optional[str] = None,
+                            cassette_path: Optional[str] = None):
+    """
+    Build the client getStructuresData talks to.
+
+    Args:
+        api_key: Backboard API key (live and record modes)
+        mode: ``live`` (default), ``stub``, ``record`` or ``replay``; defaults to ``BACKBOARD_MODE``
+        cassette_path: Cassette for record/replay; defaults to ``BACKBOARD_CASSETTE``
+    """
+    mode = (mode or os.getenv('BACKBOARD_MODE', 'live')).lower()
+    cassette_path = cassette_path or os.getenv('BACKBOARD_CASSETTE', DEFAULT_CASSETTE)
+
+    if mode == "stub":
+        return StubBackboardClient(latency=float(os.getenv('BACKBOARD_STUB_LATENCY', 1.0)))
+    if mode == "replay":
+        return ReplayClient(cassette_path)
+
+    from backboard import BackboardClient
+
+    client = BackboardClient(api_key=api_key)
+    if mode == "record":
+        return RecordingClient(client, cassette_path)
+    if mode != "live":
+        raise ValueError(f"Unknown BACKBOARD_MODE: {mode}")
+    return client
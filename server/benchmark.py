@@ -0,0 +1,908 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the FinSense AI audio pipeline.
+
+Each measured run happens in a fresh child process so peak memory is not
+polluted by earlier runs or by models loaded in this process.
+
+Examples:
+    python benchmark.py diarization --audio ./files/call_cleaned.wav --minutes 60
+    python benchmark.py diarization --audio ./files/call_cleaned.wav --modes chunked --workers 4
+    python benchmark.py diarization --audio ./files/call_cleaned.wav --modes full fast
+    python benchmark.py admission --uploads 500 --slots 8
+    python benchmark.py extraction --calls 200 --concurrency 20 --error-rate 0.05
+    python benchmark.py extraction --client replay --cassette ./backboard_cassette.jsonl
+    python benchmark.py denoise --minutes 10 --snr 5
+    python benchmark.py fingerprint --calls 500
+    python benchmark.py voices --vectors 1000000 --dim 192 --nprobe 1 4 16 64
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+sys.path.append(os.path.dirname(__file__))
+
+
+def peak_rss_mb(who="self"):
+    """Peak resident memory in MB for this process or its largest reaped child."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+
+def tile_audio(audio_path, minutes, output_path, block_seconds=30):
+    """Repeat a recording until it is ``minutes`` long, streaming block by block."""
+    import soundfile as sf
+
+    with sf.SoundFile(audio_path) as src:
+        if src.frames == 0:
+            raise ValueError(f"Cannot tile an empty recording: {audio_path}")
+        sr = src.samplerate
+        target = int(minutes * 60 * sr)
+        written = 0
+        with sf.SoundFile(output_path, "w", samplerate=sr, channels=src.channels, subtype="PCM_16") as dst:
+            while written < target:
+                src.seek(0)
+                for block in src.blocks(blocksize=block_seconds * sr, dtype="float32"):
+                    block = block[:target - written]
+                    dst.write(block)
+                    written += len(block)
+                    if written >= target:
+                        break
+    return output_path
+
+
+def run_child(args):
+    """Run one benchmark child and return the JSON it prints last."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + args,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Benchmark child failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), *(len(str(r.get(c, ""))) for r in rows)) for c in columns]
+    print("  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(w) for c, w in zip(columns, widths)))
+
+
+# ---------------------------------------------------------------- diarization
+
+def diarization_error_rate(reference, hypothesis, step=0.01):
+    """
+    Frame-based diarization error rate (missed + false alarm + confusion).
+
+    Hypothesis speakers are mapped onto reference speakers with the
+    overlap-maximising one-to-one assignment, so label names do not matter.
+    No forgiveness collar is applied.
+
+    Args:
+        reference: Segments treated as ground truth ({speaker, start, end})
+        hypothesis: Segments to score
+        step: Frame size in seconds
+
+    Returns:
+        DER as a fraction of reference speech time
+    """
+    import numpy as np
+    from scipy.optimize import linear_sum_assignment
+
+    def to_matrix(segments, n_frames):
+        speakers = sorted({seg["speaker"] for seg in segments})
+        matrix = np.zeros((max(len(speakers), 1), n_frames), dtype=bool)
+        index = {spk: i for i, spk in enumerate(speakers)}
+        for seg in segments:
+            matrix[index[seg["speaker"]], int(round(seg["start"] / step)):int(round(seg["end"] / step))] = True
+        return matrix
+
+    end = max([seg["end"] for seg in reference + hypothesis] or [0.0])
+    n_frames = int(np.ceil(end / step)) + 1
+    ref = to_matrix(reference, n_frames)
+    hyp = to_matrix(hypothesis, n_frames)
+
+    overlap = ref.astype(np.int32) @ hyp.T.astype(np.int32)
+    rows, cols = linear_sum_assignment(-overlap)
+
+    n_ref = ref.sum(axis=0)
+    n_hyp = hyp.sum(axis=0)
+    n_correct = np.zeros(n_frames, dtype=np.int64)
+    for r, c in zip(rows, cols):
+        n_correct += ref[r] & hyp[c]
+
+    total = n_ref.sum()
+    if total == 0:
+        return 0.0
+    return float((np.maximum(n_ref, n_hyp) - n_correct).sum() / total)
+
+
+def _child_diarization(args):
+    from diarization import FastSpeakerDiarizer, SpeakerDiarizer
+
+    if args.mode == "fast":
+        diarizer = FastSpeakerDiarizer(num_speakers=args.num_speakers)
+    else:
+        diarizer = SpeakerDiarizer(num_speakers=args.num_speakers)
+    start = time.perf_counter()
+    if args.mode == "chunked":
+        segments = diarizer.diarize_chunked(
+            args.audio,
+            chunk_duration=args.chunk_duration,
+            overlap=args.overlap,
+            max_workers=args.workers
+        )
+    elif args.mode == "full":
+        segments = diarizer.diarize_full(args.audio)
+    else:
+        segments = diarizer.diarize(args.audio)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "mode": args.mode,
+        "seconds": round(elapsed, 2),
+        "segments": len(segments),
+        "speakers": len(set(segments.speakers)),
+        "peak_mb": peak_rss_mb("self"),
+        "worker_peak_mb": peak_rss_mb("children"),
+        "result": segments.to_records() if args.keep_segments else None
+    }))
+
+
+def bench_diarization(args):
+    import soundfile as sf
+
+    audio_path = args.audio
+    tmp_dir = None
+    if args.minutes:
+        tmp_dir = tempfile.mkdtemp(prefix="finsense_bench_")
+        audio_path = tile_audio(args.audio, args.minutes, os.path.join(tmp_dir, "tiled.wav"))
+
+    duration = sf.info(audio_path).duration
+    print("=" * 70)
+    print(f"Diarization benchmark: {duration / 60:.1f} min of audio")
+    print("=" * 70)
+
+    rows = []
+    try:
+        for mode in args.modes:
+            child_args = [
+                "_diarization", "--audio", audio_path, "--mode", mode,
+                "--num-speakers", str(args.num_speakers),
+                "--chunk-duration", str(args.chunk_duration),
+                "--overlap", str(args.overlap)
+            ]
+            if args.workers:
+                child_args += ["--workers", str(args.workers)]
+            if "full" in args.modes:
+                child_args.append("--keep-segments")
+            print(f"⏳ Running {mode}...")
+            result = run_child(child_args)
+            result["x_realtime"] = round(duration / result["seconds"], 1) if result["seconds"] else ""
+            rows.append(result)
+    finally:
+        if tmp_dir:
+            os.remove(audio_path)
+            os.rmdir(tmp_dir)
+
+    # The full pyannote run is the reference for accuracy and speed
+    reference = next((row for row in rows if row["mode"] == "full"), None)
+    if reference:
+        for row in rows:
+            row["der_vs_full"] = f"{100 * diarization_error_rate(reference['result'], row['result']):.1f}%"
+            row["speedup"] = f"{reference['seconds'] / row['seconds']:.1f}x" if row["seconds"] else ""
+
+    print()
+    print_table(rows, ["mode", "seconds", "x_realtime", "speedup", "der_vs_full",
+                       "peak_mb", "worker_peak_mb", "segments", "speakers"])
+
+
+# ---------------------------------------------------------------- admission
+
+def simulate_uploads(args, policy=None):
+    """
+    Discrete-event load test of upload admission.
+
+    Uploads arrive uniformly over ``burst_seconds``; accepted ones are served
+    FIFO by ``slots`` workers. With ``policy=None`` every upload starts
+    processing at once, which is what spawning one process per upload did.
+    Rejected clients retry after the advertised Retry-After.
+    """
+    import heapq
+    import random
+
+    rng = random.Random(args.seed)
+    events = []  # (time, seq, kind, payload)
+    seq = 0
+    for i in range(args.uploads):
+        audio = rng.lognormvariate(0, 1) * args.mean_audio / 1.65
+        heapq.heappush(events, (rng.uniform(0, args.burst_seconds), seq, "arrive", {"audio": audio, "tries": 0}))
+        seq += 1
+
+    slots = args.slots if policy else args.uploads
+    queue = []
+    running = 0
+    limits = None
+    next_publish = 0.0
+    counts = {"accept": 0, "degrade": 0, "reject": 0}
+    gave_up = 0
+    waits = []
+    peak_depth = peak_running = 0
+    finished_at = 0.0
+    done_audio = done_work = 0.0
+
+    def start_jobs(now):
+        nonlocal running, seq, peak_running
+        while queue and running < slots:
+            job = queue.pop(0)
+            work = job["audio"] * args.realtime_factor * (args.degraded_speedup if job["degraded"] else 1.0)
+            running += 1
+            peak_running = max(peak_running, running)
+            waits.append(now - job["queued_at"])
+            heapq.heappush(events, (now + work, seq, "finish", {"audio": job["audio"], "work": work}))
+            seq += 1
+
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+
+        if kind == "finish":
+            running -= 1
+            finished_at = now
+            done_audio += payload["audio"]
+            done_work += payload["work"]
+            start_jobs(now)
+            continue
+
+        depth = len(queue) + running
+        if policy:
+            if limits is None or now >= next_publish:
+                # What the worker would publish every few seconds
+                backlog = sum(j["audio"] for j in queue) + running * args.mean_audio
+                stats = {
+                    "queueDepth": len(queue),
+                    "inFlight": running,
+                    "capacity": args.slots,
+                    "backlogAudioSeconds": backlog,
+                    "realtimeFactor": done_work / done_audio if done_audio else args.realtime_factor
+                }
+                limits = policy.limits(stats)
+                next_publish = now + args.publish_interval
+            decision = policy.decide(depth, limits)
+        else:
+            decision = {"action": "accept"}
+
+        counts[decision["action"]] += 1
+        if decision["action"] == "reject":
+            payload["tries"] += 1
+            if payload["tries"] <= args.max_retries:
+                # Clients add jitter so rejected uploads do not return in lockstep
+                delay = decision["retryAfter"] * rng.uniform(1.0, 1.5)
+                heapq.heappush(events, (now + delay, seq, "arrive", payload))
+                seq += 1
+            else:
+                gave_up += 1
+            continue
+
+        queue.append({"audio": payload["audio"], "queued_at": now, "degraded": decision["action"] == "degrade"})
+        peak_depth = max(peak_depth, depth + 1)
+        start_jobs(now)
+
+    waits.sort()
+    pct = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))], 1) if waits else 0
+    return {
+        "policy": "admission" if policy else "unbounded",
+        "accepted": counts["accept"],
+        "degraded": counts["degrade"],
+        "rejected": counts["reject"],
+        "gave_up": gave_up,
+        "processed": len(waits),
+        "peak_in_flight": peak_running,
+        "peak_depth": peak_depth,
+        "p50_wait_s": pct(0.5),
+        "p95_wait_s": pct(0.95),
+        "drained_after_s": round(finished_at, 1)
+    }
+
+
+def bench_admission(args):
+    from admission import AdmissionPolicy
+
+    policy = AdmissionPolicy(
+        max_queue_depth=args.max_queue_depth,
+        degrade_drain_seconds=args.degrade_drain,
+        reject_drain_seconds=args.reject_drain
+    )
+
+    print("=" * 70)
+    print(f"Admission load test: {args.uploads} uploads in {args.burst_seconds:.0f}s, {args.slots} slot(s)")
+    print("=" * 70)
+    rows = [simulate_uploads(args, None), simulate_uploads(args, policy)]
+    print()
+    print_table(rows, ["policy", "accepted", "degraded", "rejected", "gave_up", "processed", "peak_in_flight",
+                       "peak_depth", "p50_wait_s", "p95_wait_s", "drained_after_s"])
+    print("\nUnbounded = one process per upload (previous behaviour). Its timings ignore CPU contention;")
+    print("peak_in_flight is how many pipelines had to fit in RAM at once.")
+
+
+# ---------------------------------------------------------------- extraction
+
+CALL_TEMPLATES = [
+    "[SPEAKER_00]: Hello, this is {agent} from the collections team. Your EMI of Rs {amount} is overdue. "
+    "[SPEAKER_01]: Yes, I know. I will pay {amount} by {method} {date}.",
+    "[SPEAKER_00]: Good morning, calling about your loan account. [SPEAKER_01]: I lost my job last month, "
+    "I cannot pay the full {amount} now. Can we settle for {half}?",
+    "[SPEAKER_00]: Sir, the payment of {amount} rupees is pending. [SPEAKER_01]: This is not my loan, "
+    "I never took it. I will file a complaint with the RBI and talk to my lawyer.",
+    "[SPEAKER_00]: Hello? Hello? [SPEAKER_01]: Sorry, wrong number.",
+    "[SPEAKER_00]: Hi, is this {agent}? [SPEAKER_01]: Yes, who is this? [SPEAKER_00]: Okay, bye.",
+]
+
+
+def synthetic_transcripts(count, seed=0):
+    """Deterministic mix of promise, hardship, dispute and irrelevant calls."""
+    import random
+
+    rng = random.Random(seed)
+    transcripts = []
+    for i in range(count):
+        amount = rng.choice([2500, 5000, 12000, 45000, 150000])
+        transcripts.append(rng.choice(CALL_TEMPLATES).format(
+            agent=rng.choice(["Priya", "Rahul", "Anita", "Vikram"]),
+            amount=f"{amount:,}",
+            half=f"{amount // 2:,} rupees",
+            method=rng.choice(["UPI", "NEFT", "cheque", "cash"]),
+            date=rng.choice(["tomorrow", "next Monday", "by the 15th", "end of the month"]),
+        ) + f" [SPEAKER_00]: Reference {i}.")
+    return transcripts
+
+
+def bench_extraction(args):
+    """
+    Throughput of the extraction stage against an offline Backboard.
+
+    Runs ``getStructuresData.main`` for every synthetic call with at most
+    ``concurrency`` in flight, retrying 429/5xx errors with backoff the way a
+    worker retry would. Reports, stats and pre-filter counters go to an
+    in-memory database (mongomock), never to ``MONGODB_URI``; the LLM side
+    is the stub or a recorded cassette.
+    """
+    import asyncio
+    import contextlib
+    import io
+    import random
+    try:
+        import mongomock
+    except ImportError:
+        raise ImportError("The extraction benchmark keeps its reports in memory: pip install mongomock")
+
+    from backboard_stub import BackboardAPIError, ReplayClient, RecordingClient, StubBackboardClient
+
+    stub = StubBackboardClient(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               failed_rate=args.failed_rate, rate_limit=args.rate_limit, seed=args.seed)
+    if args.client == "replay":
+        client = ReplayClient(args.cassette, use_recorded_latency=args.recorded_latency)
+    elif args.client == "record":
+        client = RecordingClient(stub, args.cassette)
+    else:
+        client = stub
+
+    import getStructuresData
+
+    transcripts = synthetic_transcripts(args.calls, args.seed)
+    database = mongomock.MongoClient()["finsense-ai"]
+    file_ids = [str(database["fileinfos"].insert_one({"keyDetails": {"filename": f"call-{i}.mp3"}}).inserted_id)
+                for i in range(len(transcripts))]
+    rng = random.Random(args.seed)
+    latencies, attempts_used = [], []
+    failures = 0
+
+    async def one(text, file_id, semaphore):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            for attempt in range(1, args.retries + 2):
+                try:
+                    await getStructuresData.main(transcript_text=text, client=client,
+                                                 file_id=file_id, database=database)
+                    latencies.append(time.perf_counter() - started)
+                    attempts_used.append(attempt)
+                    return
+                except BackboardAPIError as e:
+                    if attempt > args.retries:
+                        break
+                    delay = e.retry_after or args.backoff * 2 ** (attempt - 1)
+                    await asyncio.sleep(delay * rng.uniform(1.0, 1.5))
+            failures += 1
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        await asyncio.gather(*(one(text, file_id, semaphore) for text, file_id in zip(transcripts, file_ids)))
+        await getStructuresData.drain_acknowledgments()
+
+    print("=" * 70)
+    print(f"Extraction throughput: {args.calls} calls, concurrency {args.concurrency}, client {args.client}")
+    print("=" * 70)
+    started = time.perf_counter()
+    # The extraction stage narrates every call; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(run_all())
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else 0
+    print()
+    print_table([{
+        "calls": args.calls,
+        "ok": len(latencies),
+        "failed": failures,
+        "retries": sum(a - 1 for a in attempts_used),
+        "llm_calls": client.served if args.client == "replay" else stub.calls["add_message"],
+        "seconds": round(elapsed, 2),
+        "calls_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "p50_s": pct(0.5),
+        "p95_s": pct(0.95),
+    }], ["calls", "ok", "failed", "retries", "llm_calls", "seconds", "calls_per_s", "p50_s", "p95_s"])
+    print("\nllm_calls is below calls when the local pre-filter skips irrelevant calls.")
+
+
+# ---------------------------------------------------------------- denoise
+
+def synthetic_call(seconds, sr=16000, seed=0):
+    """Alternating harmonic "speech" bursts with pauses, as a clean reference."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    position = 0
+    while position < len(y):
+        length = min(int(sr * rng.uniform(0.8, 3.0)), len(y) - position)
+        t = np.arange(length) / sr
+        f0 = rng.uniform(100, 220)
+        burst = sum(np.sin(2 * np.pi * f0 * h * t + rng.uniform(0, 6.28)) / h for h in range(1, 12))
+        y[position:position + length] = 0.2 * burst * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+        position += length + int(sr * rng.uniform(0.3, 1.5))
+    return y
+
+
+def line_noise(length, sr=16000, seed=1):
+    """Stationary line noise: hiss plus mains hum."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(length) / sr
+    return (rng.standard_normal(length) + 3 * np.sin(2 * np.pi * 50 * t)).astype(np.float32)
+
+
+def snr_db(clean, estimate):
+    import numpy as np
+
+    error = np.sum((np.asarray(estimate, dtype=np.float64) - clean) ** 2)
+    return round(float(10 * np.log10(np.sum(clean.astype(np.float64) ** 2) / max(error, 1e-20))), 2)
+
+
+def bench_denoise(args):
+    """
+    Spectral gate (denoise.py) against noisereduce on noisy synthetic calls.
+
+    Noise is added to a clean signal at ``--snr`` dB, so output SNR can be
+    measured against the clean reference. noisereduce runs only when it is
+    installed.
+    """
+    import numpy as np
+    import soundfile as sf
+    from denoise import NoiseProfile, SpectralGate, reduce_noise
+
+    sr = 16000
+    if args.audio:
+        clean, file_sr = sf.read(args.audio, dtype="float32", always_2d=True)
+        clean = clean.mean(axis=1)
+        if file_sr != sr:
+            import librosa
+            clean = librosa.resample(clean, orig_sr=file_sr, target_sr=sr)
+        clean = np.tile(clean, int(np.ceil(args.minutes * 60 * sr / len(clean))))[:int(args.minutes * 60 * sr)]
+    else:
+        clean = synthetic_call(args.minutes * 60, sr, args.seed)
+    noise = line_noise(len(clean), sr, args.seed + 1)
+    noise *= np.sqrt(np.mean(clean ** 2) / np.mean(noise ** 2) / 10 ** (args.snr / 10))
+    noisy = clean + noise
+
+    def gate_only():
+        profile = NoiseProfile.estimate(noisy, sr)
+        return lambda: SpectralGate(profile, prop_decrease=args.prop_decrease).process(noisy)
+
+    def streaming():
+        gate = SpectralGate(NoiseProfile.estimate(noisy, sr), prop_decrease=args.prop_decrease)
+        pieces = (noisy[i:i + sr] for i in range(0, len(noisy), sr))
+        return np.concatenate(list(gate.stream(pieces)))
+
+    methods = {
+        "spectral_gate": lambda: reduce_noise(noisy, sr, prop_decrease=args.prop_decrease),
+        "gate_cached_profile": gate_only(),
+        "gate_streaming_1s": streaming,
+    }
+    try:
+        import noisereduce as nr
+        methods["noisereduce"] = lambda: nr.reduce_noise(y=noisy, sr=sr, stationary=True,
+                                                         prop_decrease=args.prop_decrease,
+                                                         n_std_thresh_stationary=1.5)
+    except ImportError:
+        print("noisereduce is not installed; skipping it")
+
+    print("=" * 70)
+    print(f"Noise reduction: {args.minutes} min at {args.snr} dB SNR, prop_decrease {args.prop_decrease}")
+    print("=" * 70)
+    rows = [{"method": "input", "snr_db": snr_db(clean, noisy)}]
+    for name, run in methods.items():
+        started = time.perf_counter()
+        out = run()
+        elapsed = time.perf_counter() - started
+        rows.append({
+            "method": name,
+            "seconds": round(elapsed, 3),
+            "x_realtime": round(len(clean) / sr / elapsed, 1) if elapsed else "",
+            "snr_db": snr_db(clean, out[:len(clean)]),
+        })
+    print()
+    print_table(rows, ["method", "seconds", "x_realtime", "snr_db"])
+
+
+# ---------------------------------------------------------------- fingerprint
+
+def synthetic_speech(seconds, sr=8000, seed=0):
+    """Syllable-like bursts: gliding pitch, random formants, short gaps and longer pauses."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    position = 0
+    while position < len(y) - sr:
+        n = int(sr * rng.uniform(0.08, 0.3))
+        t = np.arange(n) / sr
+        f0 = rng.uniform(90, 250) * np.linspace(1, rng.uniform(0.8, 1.2), n)
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        formants = rng.uniform(300, 2500, 3)[:, None]
+        voiced = sum(np.sin(h * phase) * np.exp(-((h * f0 - formants) ** 2).min(axis=0) / (2 * 200 ** 2))
+                     for h in range(1, 25))
+        envelope = (t / t[-1]) ** 0.3 * np.exp(-4 * t / t[-1])
+        y[position:position + n] += 0.3 * voiced * envelope
+        gap = rng.uniform(0.02, 0.1) if rng.random() < 0.8 else rng.uniform(0.3, 1.2)
+        position += n + int(sr * gap)
+    y += 0.003 * rng.standard_normal(len(y)).astype(np.float32)
+    return y / np.abs(y).max()
+
+
+def mu_law(y, mu=255):
+    """8-bit mu-law round trip, as on a telephone trunk."""
+    import numpy as np
+
+    scale = np.log1p(mu)
+    code = np.round(np.sign(y) * np.log1p(mu * np.abs(y)) / scale * 127) / 127
+    return (np.sign(code) * np.expm1(np.abs(code) * scale) / mu).astype(np.float32)
+
+
+def bench_fingerprint(args):
+    """
+    Duplicate detection against a scratch fingerprint index in MongoDB.
+
+    Indexes ``--calls`` synthetic calls, then looks up altered copies of
+    some of them (trimmed, resampled, mu-law, added noise) and unrelated
+    calls. Reports fingerprinting speed, lookup latency and how often each
+    kind of copy is linked to its original or only flagged as a possible
+    duplicate. Uses ``MONGODB_URI`` and drops
+    its scratch collection afterwards.
+    """
+    import numpy as np
+    from pymongo import MongoClient
+    from scipy.signal import resample_poly
+    from fingerprint import LINKABLE_MATCHES, SAMPLE_RATE, FingerprintIndex, fingerprint_signal
+
+    sr = SAMPLE_RATE
+    variants = {
+        "trimmed": lambda y, rng: y[int(sr * rng.uniform(1, 15)):],
+        "resampled": lambda y, rng: resample_poly(resample_poly(y, 11, 8), 8, 11).astype(np.float32),
+        "mulaw": lambda y, rng: mu_law(y),
+        # Roughly 20 dB SNR
+        "noisy": lambda y, rng: y + np.float32(0.01) * rng.standard_normal(len(y)).astype(np.float32),
+    }
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+    collection = client["finsense-ai"]["fingerprints_benchmark"]
+    collection.drop()
+    index = FingerprintIndex(collection)
+    index.ensure_indexes()
+    try:
+        calls, fingerprint_seconds = [], []
+        for i in range(args.calls):
+            y = synthetic_speech(args.seconds, sr, seed=args.seed + i)
+            started = time.perf_counter()
+            fingerprint = fingerprint_signal(y)
+            fingerprint_seconds.append(time.perf_counter() - started)
+            index.add(i, fingerprint)
+            if i < args.queries:
+                calls.append(y)
+
+        rng = np.random.default_rng(args.seed)
+        rows, latencies = [], []
+        kinds = list(variants.items()) + [("unrelated", None)]
+        for kind, alter in kinds:
+            linked, flagged, scores = 0, 0, []
+            for i, y in enumerate(calls):
+                if alter is None:
+                    query = synthetic_speech(args.seconds, sr, seed=args.seed + args.calls + i)
+                else:
+                    query = alter(y, rng)
+                fingerprint = fingerprint_signal(query)
+                started = time.perf_counter()
+                match = index.find_duplicate(fingerprint)
+                latencies.append(time.perf_counter() - started)
+                if match:
+                    scores.append(match["similarity"])
+                    found = match["fileId"] == i if alter else 1
+                    if match["match"] in LINKABLE_MATCHES:
+                        linked += found
+                    else:
+                        flagged += found
+            rows.append({
+                "copy": kind,
+                "queries": len(calls),
+                "linked": linked,
+                "flagged": flagged,
+                "mean_similarity": round(float(np.mean(scores)), 3) if scores else "",
+            })
+    finally:
+        collection.drop()
+        client.close()
+
+    latencies = sorted(latencies)
+    pct = lambda values, q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+    print("=" * 70)
+    print(f"Fingerprint index: {args.calls} calls of {args.seconds:.0f}s, {args.queries} queries per copy kind")
+    print("=" * 70)
+    print(f"fingerprint: {np.mean(fingerprint_seconds) * 1000:.1f} ms per call "
+          f"({args.seconds / np.mean(fingerprint_seconds):.0f}x realtime)")
+    print(f"lookup: p50 {pct(latencies, 0.5)} ms, p95 {pct(latencies, 0.95)} ms")
+    print()
+    print_table(rows, ["copy", "queries", "linked", "flagged", "mean_similarity"])
+    print("\nFor unrelated calls, linked and flagged count false matches.")
+
+
+# ---------------------------------------------------------------- voices
+
+def bench_voices(args):
+    """
+    Voiceprint index (voiceindex.py): recall against exact search versus query latency.
+
+    Stores ``--vectors`` synthetic voiceprints (several noisy samples per
+    voice, voices spread over ``--intrinsic-dim`` directions) in a scratch
+    on-disk index, then queries fresh samples of stored
+    voices at each ``--nprobe``. Recall is the share of queries whose best
+    voice matches exhaustive search over the same vectors.
+    """
+    import numpy as np
+    from voiceindex import VoiceIndex
+
+    rng = np.random.default_rng(args.seed)
+    n_voices = max(1, args.vectors // args.samples_per_voice)
+
+    def samples(voices):
+        noise = rng.standard_normal((len(voices), args.dim)).astype(np.float32) * np.float32(args.noise)
+        vectors = centers[voices] + noise
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Speaker embeddings occupy a low-rank part of their space; isotropic voices are IVF's worst case
+    basis = rng.standard_normal((args.intrinsic_dim or args.dim, args.dim)).astype(np.float32)
+    centers = rng.standard_normal((n_voices, len(basis))).astype(np.float32) @ basis
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = np.repeat(np.arange(n_voices), args.samples_per_voice)[:args.vectors]
+    stored = samples(labels)
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = VoiceIndex(directory)
+        started = time.perf_counter()
+        index.add(stored, labels)
+        if args.nlist or not index.meta["trained"]:
+            index.train(args.nlist)
+        build_seconds = time.perf_counter() - started
+
+        truth_voices = rng.integers(0, n_voices, size=args.queries)
+        queries = samples(truth_voices)
+        exact, exact_latency = [], []
+        for query in queries:
+            started = time.perf_counter()
+            exact.append(int(labels[np.argmax(stored @ query)]))
+            exact_latency.append(time.perf_counter() - started)
+
+        def ms(values, q):
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+
+        rows = [{"search": "exact (in memory)", "recall": 1.0,
+                 "voice_accuracy": round(float(np.mean(np.array(exact) == truth_voices)), 3),
+                 "p50_ms": ms(exact_latency, 0.5), "p95_ms": ms(exact_latency, 0.95)}]
+        for nprobe in args.nprobe:
+            found, latency = [], []
+            for query in queries:
+                started = time.perf_counter()
+                hits = index.search(query, k=1, nprobe=nprobe)
+                latency.append(time.perf_counter() - started)
+                found.append(hits[0][0] if hits else -1)
+            found = np.array(found)
+            rows.append({
+                "search": f"ivf nprobe={nprobe}",
+                "recall": round(float(np.mean(found == np.array(exact))), 3),
+                "voice_accuracy": round(float(np.mean(found == truth_voices)), 3),
+                "p50_ms": ms(latency, 0.5),
+                "p95_ms": ms(latency, 0.95),
+            })
+
+        print("=" * 70)
+        print(f"Voice index: {args.vectors} vectors ({n_voices} voices), dim {args.dim}, "
+              f"{index.meta['nlist']} lists, built in {build_seconds:.1f}s")
+        print("=" * 70)
+        print()
+        print_table(rows, ["search", "recall", "voice_accuracy", "p50_ms", "p95_ms"])
+
+
+# ---------------------------------------------------------------- segments
+
+def bench_segments(args):
+    """
+    Segment table (segments.py) against the JSON list of turn dicts it replaced.
+
+    Times saving and loading ``--turns`` synthetic turns both ways, plus the
+    table operations the pipeline runs on them. Every figure is the median
+    of ``--repeats`` runs.
+    """
+    import json
+    import statistics
+    import numpy as np
+    from segments import SegmentTable
+
+    rng = np.random.default_rng(args.seed)
+    durations = rng.exponential(2.0, args.turns) + 0.1
+    gaps = rng.exponential(0.3, args.turns)
+    starts = np.cumsum(gaps + durations) - durations
+    table = SegmentTable.from_arrays(starts, starts + durations, rng.integers(0, args.speakers, args.turns),
+                                     [f"SPEAKER_{i:02d}" for i in range(args.speakers)])
+    records = table.to_records()
+    word_starts = np.sort(rng.uniform(0, float(table.end[-1]), args.turns * 8))
+
+    def timed(fn):
+        runs = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - started)
+        return statistics.median(runs) * 1e6
+
+    binary = table.to_bytes()
+    text = json.dumps(records, indent=2)
+    rows = [
+        {"operation": "serialize", "json_us": round(timed(lambda: json.dumps(records, indent=2))),
+         "table_us": round(timed(table.to_bytes), 1)},
+        {"operation": "deserialize", "json_us": round(timed(lambda: json.loads(text))),
+         "table_us": round(timed(lambda: SegmentTable.from_bytes(binary)), 1)},
+        {"operation": "size_kb", "json_us": round(len(text) / 1024, 1), "table_us": round(len(binary) / 1024, 1)},
+        {"operation": "filter_duration", "json_us": round(timed(lambda: [r for r in records if r["duration"] >= 0.5])),
+         "table_us": round(timed(lambda: table.filter_duration(0.5)), 1)},
+        {"operation": "merge_adjacent", "json_us": None, "table_us": round(timed(table.merge_adjacent), 1)},
+        {"operation": "relabel", "json_us": None, "table_us": round(timed(table.relabel), 1)},
+        {"operation": f"join {len(word_starts)} words", "json_us": None,
+         "table_us": round(timed(lambda: table.join(word_starts, word_starts + 0.3)), 1)},
+    ]
+
+    print("=" * 70)
+    print(f"Segment table: {args.turns} turns, {args.speakers} speakers (median of {args.repeats}, size rows in KB)")
+    print("=" * 70)
+    print()
+    print_table(rows, ["operation", "json_us", "table_us"])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="FinSense AI pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("diarization", help="Full, chunked and fast diarization: speed, memory and DER")
+    p.add_argument("--audio", required=True, help="Cleaned audio file to diarize")
+    p.add_argument("--minutes", type=float, help="Tile the audio to this length first")
+    p.add_argument("--modes", nargs="+", default=["full", "chunked", "fast"], choices=["full", "chunked", "fast"])
+    p.add_argument("--num-speakers", type=int, default=2)
+    p.add_argument("--chunk-duration", type=float, default=600.0)
+    p.add_argument("--overlap", type=float, default=30.0)
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=bench_diarization)
+
+    p = sub.add_parser("admission", help="Simulated upload burst with and without admission control")
+    p.add_argument("--uploads", type=int, default=500)
+    p.add_argument("--burst-seconds", type=float, default=60.0)
+    p.add_argument("--slots", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--mean-audio", type=float, default=180.0, help="Mean call length in seconds")
+    p.add_argument("--realtime-factor", type=float, default=0.5, help="Processing seconds per audio second")
+    p.add_argument("--degraded-speedup", type=float, default=0.5, help="Work multiplier on the degraded model")
+    p.add_argument("--publish-interval", type=float, default=5.0)
+    p.add_argument("--max-retries", type=int, default=10)
+    p.add_argument("--max-queue-depth", type=int, default=200)
+    p.add_argument("--degrade-drain", type=float, default=15 * 60)
+    p.add_argument("--reject-drain", type=float, default=60 * 60)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_admission)
+
+    p = sub.add_parser("extraction", help="Extraction-stage throughput against the offline Backboard stand-in")
+    p.add_argument("--calls", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=20)
+    p.add_argument("--client", choices=["stub", "record", "replay"], default="stub")
+    p.add_argument("--cassette", default=os.path.join(os.path.dirname(__file__), "backboard_cassette.jsonl"))
+    p.add_argument("--recorded-latency", action="store_true", help="Replay with the recorded response times")
+    p.add_argument("--latency", type=float, default=1.0, help="Stub seconds per message")
+    p.add_argument("--jitter", type=float, default=0.2)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--failed-rate", type=float, default=0.0)
+    p.add_argument("--rate-limit", type=float, help="Stub requests per second")
+    p.add_argument("--retries", type=int, default=3)
+    p.add_argument("--backoff", type=float, default=0.5)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_extraction)
+
+    p = sub.add_parser("denoise", help="In-house spectral gate vs noisereduce: speed and output SNR")
+    p.add_argument("--audio", help="Clean recording to add noise to (default: synthetic call)")
+    p.add_argument("--minutes", type=float, default=5.0)
+    p.add_argument("--snr", type=float, default=5.0, help="Input SNR in dB")
+    p.add_argument("--prop-decrease", type=float, default=0.25)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_denoise)
+
+    p = sub.add_parser("fingerprint", help="Duplicate-upload detection: fingerprint speed, lookup latency, recall")
+    p.add_argument("--calls", type=int, default=500, help="Calls in the index")
+    p.add_argument("--queries", type=int, default=50, help="Altered copies looked up per kind")
+    p.add_argument("--seconds", type=float, default=120.0, help="Length of each synthetic call")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_fingerprint)
+
+    p = sub.add_parser("voices", help="Voiceprint index: recall versus query latency")
+    p.add_argument("--vectors", type=int, default=200000)
+    p.add_argument("--dim", type=int, default=192)
+    p.add_argument("--samples-per-voice", type=int, default=4)
+    p.add_argument("--noise", type=float, default=0.06, help="Per-dimension noise around each voice")
+    p.add_argument("--intrinsic-dim", type=int, default=32, help="Rank of the voice distribution (0: full)")
+    p.add_argument("--nlist", type=int, help="Lists (default: 4 * sqrt(vectors))")
+    p.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_voices)
+
+    p = sub.add_parser("segments", help="Segment table vs JSON turns: serialize, load and vectorized operations")
+    p.add_argument("--turns", type=int, default=3000)
+    p.add_argument("--speakers", type=int, default=2)
+    p.add_argument("--repeats", type=int, default=20)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_segments)
+
+    # Internal child entry point: one measured run per fresh process
+    p = sub.add_parser("_diarization")
+    p.add_argument("--audio", required=True)
+    p.add_argument("--mode", required=True)
+    p.add_argument("--num-speakers", type=int, default=2)
+    p.add_argument("--chunk-duration", type=float, default=600.0)
+    p.add_argument("--overlap", type=float, default=30.0)
+    p.add_argument("--workers", type=int)
+    p.add_argument("--keep-segments", action="store_true")
+    p.set_defaults(func=_child_diarization)
+
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
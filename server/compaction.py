@@ -0,0 +1,150 @@
+"""
+Shrink a combined transcript before it is sent for extraction.
+
+LLM latency and cost scale with input length, and most of a long
+collections call is small talk, hold announcements and fillers. The
+compactor:
+
+1. merges consecutive turns of the same speaker (one ``[SPEAKER]:`` tag each)
+2. removes fillers and transcription artifacts locally (Phase 1 of the
+   extraction prompt asks the model to do the same)
+3. if the result is still over the token budget, keeps only windows of
+   turns around finance-relevant ones (amounts, payment terms), plus
+   the opening and closing turns, and marks what was dropped
+
+Corrections such as "ten... I mean fifteen thousand" are left alone, since
+the model needs them to pick the final amount.
+"""
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from prefilter import FINANCE_TERMS, extract_amounts
+
+logger = logging.getLogger(__name__)
+
+
+# Rough English average for GPT-style tokenizers
+CHARS_PER_TOKEN = 4
+TOKEN_BUDGET = 3000
+CONTEXT_TURNS = 2
+EDGE_TURNS = 2
+
+TURN = re.compile(r'\[([^\]]*)\]:\s*')
+FILLERS = re.compile(
+    r'\b(?:u+m+|u+h+|h+m+|e+r+m*|a+h+|mm+|you know)\b[,.]?\s*|\[(?:inaudible|laughter|music|noise|silence)\]\s*',
+    re.IGNORECASE
+)
+REPEATED_WORD = re.compile(r'\b(\w+)(?:[\s,]+\1\b)+', re.IGNORECASE)
+SPACES = re.compile(r'\s+')
+SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([,.?!])')
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def parse_turns(transcript_text: str) -> List[Tuple[str, str]]:
+    """Split ``[SPEAKER]: text [SPEAKER]: text`` into (speaker, text) pairs."""
+    parts = TURN.split(transcript_text or '')
+    if len(parts) == 1:
+        return [("Unknown", parts[0].strip())] if parts[0].strip() else []
+    return [(parts[i], parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2)]
+
+
+def merge_turns(turns: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    merged = []
+    for speaker, text in turns:
+        if not text:
+            continue
+        if merged and merged[-1][0] == speaker:
+            merged[-1] = (speaker, f"{merged[-1][1]} {text}")
+        else:
+            merged.append((speaker, text))
+    return merged
+
+
+def strip_fillers(text: str) -> str:
+    text = FILLERS.sub('', text)
+    text = REPEATED_WORD.sub(r'\1', text)
+    text = SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+    return SPACES.sub(' ', text).strip(' ,')
+
+
+def is_relevant(text: str) -> bool:
+    # Dates alone ("next week") are too common; they are kept as context around finance turns
+    return bool(FINANCE_TERMS.search(text) or extract_amounts(text))
+
+
+def render(turns: List[Tuple[str, str]]) -> str:
+    return " ".join(f"[{speaker}]: {text}" for speaker, text in turns)
+
+
+def select_windows(turns: List[Tuple[str, str]], context: int = CONTEXT_TURNS,
+                   edges: int = EDGE_TURNS) -> List[Tuple[str, str]]:
+    """Keep relevant turns with ``context`` neighbours each side, plus the first and last ``edges`` turns."""
+    keep = [False] * len(turns)
+    for i in list(range(min(edges, len(turns)))) + list(range(max(0, len(turns) - edges), len(turns))):
+        keep[i] = True
+    for i, (_, text) in enumerate(turns):
+        if is_relevant(text):
+            for j in range(max(0, i - context), min(len(turns), i + context + 1)):
+                keep[j] = True
+
+    selected = []
+    omitted = 0
+    for turn, kept in zip(turns, keep):
+        if kept:
+            if omitted:
+                selected.append(("...", f"{omitted} turn(s) omitted"))
+                omitted = 0
+            selected.append(turn)
+        else:
+            omitted += 1
+    if omitted:
+        selected.append(("...", f"{omitted} turn(s) omitted"))
+    return selected
+
+
+def compact_transcript(transcript_text: str, token_budget: Optional[int] = TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """
+    Compact a combined transcript for LLM extraction.
+
+    Args:
+        transcript_text: ``[SPEAKER]: text`` transcript from build_combined_text
+        token_budget: Approximate input token limit; None disables windowing
+
+    Returns:
+        Tuple of (compacted text, stats with token estimates, compression
+        ratio and how many merged turns were kept)
+    """
+    turns = merge_turns([(speaker, strip_fillers(text)) for speaker, text in parse_turns(transcript_text)])
+    text = render(turns)
+    kept = len(turns)
+    windowed = False
+
+    if token_budget and estimate_tokens(text) > token_budget:
+        # Narrow the windows until the call fits; relevant turns themselves are never dropped
+        for context in range(CONTEXT_TURNS, -1, -1):
+            selected = select_windows(turns, context=context)
+            text = render(selected)
+            kept = sum(1 for speaker, _ in selected if speaker != "...")
+            windowed = True
+            if estimate_tokens(text) <= token_budget:
+                break
+
+    before = estimate_tokens(transcript_text or '')
+    after = estimate_tokens(text)
+    stats = {
+        "tokensBefore": before,
+        "tokensAfter": after,
+        "compressionRatio": round(before / after, 2) if after else 0.0,
+        "turns": len(turns),
+        "keptTurns": kept,
+        "windowed": windowed
+    }
+    logger.info(
+        f"Compacted transcript from ~{before} to ~{after} tokens "
+        f"({stats['compressionRatio']}x{', windowed' if windowed else ''})"
+    )
+    return text, stats
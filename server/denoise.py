@@ -0,0 +1,300 @@
+"""
+Spectral-gating noise reduction for call audio.
+
+Replaces noisereduce's stationary mode in preprocessing:
+
+1. The noise profile (per-bin mean and spread of the log magnitude) is
+   measured only on frames the VAD marks as non-speech, i.e. the same
+   stretches silence removal later cuts. Only those frames are transformed.
+2. One streaming STFT pass attenuates every bin below
+   ``mean + n_std * std`` and overlap-adds the inverse transform into a
+   float32 buffer. Memory depends on the block size, not the call length,
+   and the same code serves live chunks.
+
+Lines (trunks, dialers) keep their noise from call to call, so profiles
+can be cached per line and blended with each new call's estimate. Short
+calls with little silence then still get a stable profile.
+"""
+import os
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from vad import FRAME_MS, detect_speech, frame_signal
+from tuning import tuned
+
+logger = logging.getLogger(__name__)
+
+
+N_FFT = 512
+HOP = 128
+# Same strength as the previous noisereduce settings
+N_STD = 1.5
+PROP_DECREASE = 0.25
+# Width of the soft threshold; a hard gate makes "musical noise"
+SOFTNESS_DB = 1.0
+FREQ_SMOOTH_BINS = 3
+MIN_NOISE_FRAMES = 50
+MAX_PROFILE_FRAMES = 4000
+# A cached profile counts as at most this many frames when blended with a new call
+MAX_PROFILE_WEIGHT = 20000
+BLOCK_SAMPLES = tuned("denoise", "block_samples", 16000 * 30)
+PROFILE_DIR = Path(os.getenv('NOISE_PROFILE_DIR', Path(__file__).resolve().parent / 'noise_profiles'))
+
+
+def _window(n_fft: int) -> np.ndarray:
+    # Periodic Hann: its squares sum to a constant at hop = n_fft / 4
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+
+
+class NoiseProfile:
+    """Per-frequency mean and standard deviation of the noise log magnitude (dB)."""
+
+    def __init__(self, mean_db: np.ndarray, std_db: np.ndarray, frames: int, sr: int, n_fft: int = N_FFT):
+        self.mean_db = np.asarray(mean_db, dtype=np.float32)
+        self.std_db = np.asarray(std_db, dtype=np.float32)
+        self.frames = int(frames)
+        self.sr = int(sr)
+        self.n_fft = int(n_fft)
+
+    @classmethod
+    def estimate(cls, y: np.ndarray, sr: int, n_fft: int = N_FFT,
+                 speech_mask: Optional[np.ndarray] = None) -> Optional["NoiseProfile"]:
+        """
+        Measure the noise on the non-speech frames of ``y``.
+
+        Falls back to the quietest tenth of the call when the VAD finds too
+        little silence. Returns None for signals shorter than one frame.
+        """
+        y = np.asarray(y, dtype=np.float32)
+        frame_length = int(sr * FRAME_MS / 1000)
+        if len(y) < max(n_fft, frame_length):
+            return None
+
+        if speech_mask is None:
+            speech_mask = detect_speech(y, sr)
+        starts = np.flatnonzero(~speech_mask) * frame_length
+        starts = starts[starts + n_fft <= len(y)]
+        if len(starts) < MIN_NOISE_FRAMES:
+            energy = np.mean(frame_signal(y, frame_length, frame_length) ** 2, axis=1)
+            quietest = np.argsort(energy)[:max(MIN_NOISE_FRAMES, len(energy) // 10)]
+            starts = np.sort(quietest) * frame_length
+            starts = starts[starts + n_fft <= len(y)]
+        if len(starts) == 0:
+            return None
+        if len(starts) > MAX_PROFILE_FRAMES:
+            starts = starts[np.linspace(0, len(starts) - 1, MAX_PROFILE_FRAMES).astype(int)]
+
+        from scipy import fft as sp_fft
+
+        frames = y[starts[:, None] + np.arange(n_fft)] * _window(n_fft)
+        magnitude_db = 20.0 * np.log10(np.abs(sp_fft.rfft(frames, axis=1)) + 1e-10)
+        return cls(magnitude_db.mean(axis=0), magnitude_db.std(axis=0), len(starts), sr, n_fft)
+
+    def compatible(self, sr: int, n_fft: int = N_FFT) -> bool:
+        return self.sr == sr and self.n_fft == n_fft
+
+    def blend(self, other: "NoiseProfile") -> "NoiseProfile":
+        """Frame-weighted combination of two profiles; the older one's weight is capped."""
+        w_self = min(self.frames, MAX_PROFILE_WEIGHT)
+        w_other = other.frames
+        total = w_self + w_other
+        mean = (self.mean_db * w_self + other.mean_db * w_other) / total
+        # Pool the variances around the combined mean
+        var = (w_self * (self.std_db ** 2 + (self.mean_db - mean) ** 2)
+               + w_other * (other.std_db ** 2 + (other.mean_db - mean) ** 2)) / total
+        return NoiseProfile(mean, np.sqrt(var), total, self.sr, self.n_fft)
+
+    def to_dict(self) -> Dict:
+        return {
+            "meanDb": [round(float(v), 3) for v in self.mean_db],
+            "stdDb": [round(float(v), 3) for v in self.std_db],
+            "frames": self.frames,
+            "sr": self.sr,
+            "nFft": self.n_fft,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "NoiseProfile":
+        return cls(data["meanDb"], data["stdDb"], data["frames"], data["sr"], data["nFft"])
+
+
+class NoiseProfileCache:
+    """Noise profiles per line, one JSON file each, shared by all workers on the host."""
+
+    def __init__(self, directory: Path = PROFILE_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, line_id: str) -> Path:
+        return self.directory / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(line_id))}.json"
+
+    def get(self, line_id: str) -> Optional[NoiseProfile]:
+        path = self._path(line_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return NoiseProfile.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable noise profile {path}: {e}")
+            return None
+
+    def put(self, line_id: str, profile: NoiseProfile) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(line_id)
+        staging = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump(profile.to_dict(), f)
+        os.replace(staging, path)
+
+
+class SpectralGate:
+    """
+    Attenuate time-frequency bins that do not rise above a noise profile.
+
+    Bins get a soft gain between ``1 - prop_decrease`` (at the noise level)
+    and 1 (well above it), smoothed across neighbouring frequencies. All
+    spectra stay in float32 / complex64.
+    """
+
+    def __init__(self, profile: NoiseProfile, n_std: float = N_STD, prop_decrease: float = PROP_DECREASE,
+                 hop: int = HOP, softness_db: float = SOFTNESS_DB):
+        if profile.n_fft % hop:
+            raise ValueError("n_fft must be a multiple of the hop length")
+        from scipy import fft as sp_fft
+        from scipy.ndimage import uniform_filter1d
+
+        self._fft = sp_fft
+        self._smooth = uniform_filter1d
+        self.n_fft = profile.n_fft
+        self.hop = hop
+        self.prop_decrease = np.float32(prop_decrease)
+        self.softness_db = np.float32(softness_db)
+        self.threshold_db = (profile.mean_db + n_std * profile.std_db).astype(np.float32)
+        self.window = _window(self.n_fft)
+        self.norm = np.float32((self.window ** 2).sum() / hop)
+
+    def _gate(self, frames: np.ndarray) -> np.ndarray:
+        spectrum = self._fft.rfft(frames * self.window, axis=1)
+        magnitude_db = 20.0 * np.log10(np.abs(spectrum) + np.float32(1e-10))
+        below = (self.threshold_db - magnitude_db) / self.softness_db
+        np.minimum(below, 50.0, out=below)
+        gain = 1.0 / (1.0 + np.exp(below))
+        gain = self._smooth(gain, FREQ_SMOOTH_BINS, axis=1, mode="nearest")
+        gain = 1.0 - self.prop_decrease * (1.0 - gain)
+        spectrum *= gain
+        return self._fft.irfft(spectrum, n=self.n_fft, axis=1, overwrite_x=True) * self.window
+
+    def _run(self, buffer: np.ndarray, tail: np.ndarray):
+        """Gate every whole frame in ``buffer``; return finished samples, leftover input and the new carry."""
+        if len(buffer) < self.n_fft:
+            return buffer[:0], buffer, tail
+        n_frames = (len(buffer) - self.n_fft) // self.hop + 1
+        frames = frame_signal(buffer, self.n_fft, self.hop)[:n_frames]
+        processed = self._gate(frames)
+
+        overlap = self.n_fft - self.hop
+        out = np.zeros(n_frames * self.hop + overlap, dtype=np.float32)
+        out[:overlap] += tail
+        for k in range(self.n_fft // self.hop):
+            piece = processed[:, k * self.hop:(k + 1) * self.hop].reshape(-1)
+            out[k * self.hop:k * self.hop + len(piece)] += piece
+
+        done = n_frames * self.hop
+        finished = out[:done]
+        finished /= self.norm
+        return finished, buffer[done:], out[done:]
+
+    def stream(self, chunks: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """
+        Denoise a signal arriving in chunks of any size.
+
+        Yields float32 pieces that concatenate to exactly the input length;
+        output lags the input by less than one frame.
+        """
+        stream = GateStream(self)
+        for chunk in chunks:
+            finished = stream.push(chunk)
+            if len(finished):
+                yield finished
+        finished = stream.flush()
+        if len(finished):
+            yield finished
+
+    def process(self, y: np.ndarray, block: int = BLOCK_SAMPLES) -> np.ndarray:
+        """Denoise a whole signal in ``block``-sample pieces into one preallocated buffer."""
+        y = np.asarray(y, dtype=np.float32)
+        out = np.empty(len(y), dtype=np.float32)
+        position = 0
+        for piece in self.stream(y[i:i + block] for i in range(0, len(y), block)):
+            out[position:position + len(piece)] = piece
+            position += len(piece)
+        return out
+
+
+class GateStream:
+    """Push-based form of :meth:`SpectralGate.stream`, for audio that arrives from a socket."""
+
+    def __init__(self, gate: SpectralGate):
+        self.gate = gate
+        overlap = gate.n_fft - gate.hop
+        # Pre-roll so the first samples get the same window overlap as the rest
+        self.buffer = np.zeros(overlap, dtype=np.float32)
+        self.tail = np.zeros(overlap, dtype=np.float32)
+        self.skip = overlap
+        self.received = self.emitted = 0
+
+    def push(self, chunk: np.ndarray) -> np.ndarray:
+        """Gate the next chunk; returns the samples finished so far (possibly none)."""
+        chunk = np.asarray(chunk, dtype=np.float32)
+        self.received += len(chunk)
+        finished, self.buffer, self.tail = self.gate._run(np.concatenate((self.buffer, chunk)), self.tail)
+        dropped = min(self.skip, len(finished))
+        finished = finished[dropped:]
+        self.skip -= dropped
+        self.emitted += len(finished)
+        return finished
+
+    def flush(self) -> np.ndarray:
+        """The remaining samples, once the input has ended."""
+        padding = np.zeros(self.gate.n_fft, dtype=np.float32)
+        finished, _, _ = self.gate._run(np.concatenate((self.buffer, padding)), self.tail)
+        finished = finished[self.skip:][:self.received - self.emitted]
+        self.emitted += len(finished)
+        return finished
+
+
+def reduce_noise(y: np.ndarray, sr: int, line_id: Optional[str] = None,
+                 cache: Optional[NoiseProfileCache] = None, speech_mask: Optional[np.ndarray] = None,
+                 n_std: float = N_STD, prop_decrease: float = PROP_DECREASE) -> np.ndarray:
+    """
+    Spectral-gate a signal with its own noise profile, blended with the line's cached one.
+
+    Args:
+        y: Mono signal
+        sr: Sample rate
+        line_id: Trunk or dialer the call came in on; enables the profile cache
+        cache: Profile cache (default: PROFILE_DIR)
+        speech_mask: VAD mask of ``y`` if already computed
+
+    Returns:
+        Denoised float32 signal of the same length (``y`` unchanged if no
+        profile could be measured)
+    """
+    profile = NoiseProfile.estimate(y, sr, speech_mask=speech_mask)
+
+    if line_id:
+        cache = cache or NoiseProfileCache()
+        cached = cache.get(line_id)
+        if cached is not None and cached.compatible(sr):
+            profile = cached if profile is None else cached.blend(profile)
+        if profile is not None:
+            cache.put(line_id, profile)
+
+    if profile is None:
+        return np.asarray(y, dtype=np.float32)
+    return SpectralGate(profile, n_std=n_std, prop_decrease=prop_decrease).process(y)
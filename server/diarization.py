@@ -1,74 +1,611 @@
 import os
 import json
-import torch
-from pyannote.audio import Pipeline
-from huggingface_hub import login
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import soundfile as sf
 from dotenv import load_dotenv
 
+from vad import FRAME_MS, detect_speech, _runs
+from stereo import CHANNEL_SPLIT, analyze_channels, channel_segments, load_channels
+from segments import SegmentTable
+
 # Load environment variables from .env file
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+logger = logging.getLogger(__name__)
+
+# "pyannote" (full pipeline) or "fast" (MFCC + k-means, CPU only, no HF token)
+DIARIZATION_BACKEND = os.getenv('DIARIZATION_BACKEND', 'pyannote')
+PIPELINE_NAME = "pyannote/speaker-diarization-3.1"
+CHUNK_DURATION = 600.0
+# "auto": pyannote diarizes calls longer than CHUNK_DURATION in parallel windows; "off": always whole-file
+DIARIZATION_CHUNKED = os.getenv('DIARIZATION_CHUNKED', 'auto')
+CHUNK_OVERLAP = 30.0
+# Cosine distance above which a chunk speaker is treated as a new voice
+NEW_SPEAKER_DISTANCE = 0.7
+# Speakers with less speech than this get no voiceprint (too noisy to identify them by)
+MIN_VOICEPRINT_SECONDS = 3.0
+
+# Per-process pipeline used by chunk workers
+_worker_pipeline = None
+
+
+def _init_chunk_worker(device, num_threads):
+    import torch
+    from pyannote.audio import Pipeline
+    
+    global _worker_pipeline
+    torch.set_num_threads(num_threads)
+    _worker_pipeline = Pipeline.from_pretrained(PIPELINE_NAME)
+    _worker_pipeline.to(torch.device(device))
+
+
+def _diarize_window(audio_path, start, end, max_speakers):
+    """
+    Diarize one window of a file and return its turns and speaker embeddings.
+
+    Only the window's frames are read from disk, so worker memory depends on
+    the chunk length rather than the length of the call.
+    """
+    import torch
+    
+    with sf.SoundFile(audio_path) as f:
+        sr = f.samplerate
+        f.seek(int(start * sr))
+        y = f.read(int((end - start) * sr), dtype="float32", always_2d=True)
+
+    waveform = torch.from_numpy(y.mean(axis=1))[None, :]
+    diarization, embeddings = _worker_pipeline(
+        {"waveform": waveform, "sample_rate": sr},
+        min_speakers=1,
+        max_speakers=max_speakers,
+        return_embeddings=True
+    )
+
+    labels = diarization.labels()
+    turns = [
+        (speaker, start + turn.start, start + turn.end)
+        for turn, _, speaker in diarization.itertracks(yield_label=True)
+    ]
+    return turns, {label: embeddings[i] for i, label in enumerate(labels)}
+
+
+def plan_chunks(total_duration, chunk_duration=CHUNK_DURATION, overlap=CHUNK_OVERLAP):
+    """
+    Split ``[0, total_duration)`` into overlapping windows.
+
+    Returns:
+        List of (start, end, keep_start, keep_end). Each chunk only keeps turns
+        inside its keep range, which meets the neighbours halfway through the
+        overlap, so every instant is owned by exactly one chunk.
+    """
+    step = chunk_duration - overlap
+    if step <= 0:
+        raise ValueError("Chunk duration must be larger than the overlap")
+
+    chunks = []
+    start = 0.0
+    while True:
+        end = min(start + chunk_duration, total_duration)
+        chunks.append([start, end, start + overlap / 2 if start > 0 else 0.0, end])
+        if end >= total_duration:
+            break
+        start += step
+    for previous, current in zip(chunks, chunks[1:]):
+        previous[3] = current[2]
+    return [tuple(c) for c in chunks]
+
+
+def stitch_speakers(chunk_speakers, num_speakers, new_speaker_distance=NEW_SPEAKER_DISTANCE):
+    """
+    Map chunk-local speaker labels onto global speakers.
+
+    Chunks are visited in order; each chunk's speakers are matched to the
+    running global centroids with a Hungarian assignment on cosine distance,
+    so two voices from the same chunk can never collapse into one speaker.
+    Centroids are duration-weighted means of the matched embeddings.
+
+    Args:
+        chunk_speakers: Per chunk, a dict of local label -> (embedding, speech seconds)
+        num_speakers: Maximum number of global speakers
+
+    Returns:
+        Per chunk, a dict of local label -> global speaker index
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    centroids = []
+    weights = []
+    mappings = []
+
+    for speakers in chunk_speakers:
+        labels = [
+            label for label, (emb, _) in speakers.items()
+            if emb is not None and np.all(np.isfinite(emb))
+        ]
+        mapping = {}
+
+        if labels:
+            vectors = np.stack([speakers[label][0] for label in labels]).astype(np.float64)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+            if centroids:
+                normed = np.stack(centroids)
+                normed = normed / (np.linalg.norm(normed, axis=1, keepdims=True) + 1e-12)
+                cost = 1.0 - vectors @ normed.T
+                rows, cols = linear_sum_assignment(cost)
+                for r, c in zip(rows, cols):
+                    if cost[r, c] <= new_speaker_distance or len(centroids) >= num_speakers:
+                        mapping[labels[r]] = int(c)
+
+            for r, label in enumerate(labels):
+                if label not in mapping:
+                    if len(centroids) < num_speakers:
+                        centroids.append(np.zeros(vectors.shape[1]))
+                        weights.append(0.0)
+                        mapping[label] = len(centroids) - 1
+                    else:
+                        # Every global speaker was claimed in this chunk; fall back to the nearest
+                        normed = np.stack(centroids)
+                        normed = normed / (np.linalg.norm(normed, axis=1, keepdims=True) + 1e-12)
+                        mapping[label] = int(np.argmax(normed @ vectors[r]))
+
+                g = mapping[label]
+                w = max(speakers[label][1], 1e-3)
+                centroids[g] = (centroids[g] * weights[g] + vectors[r] * w) / (weights[g] + w)
+                weights[g] += w
+
+        # Speakers without a usable embedding (too little speech) fall back to the first global speaker
+        for label in speakers:
+            if label not in mapping:
+                mapping[label] = 0
+
+        mappings.append(mapping)
+
+    return mappings
+
+
+def speaker_centroids(chunk_speakers, mappings):
+    """Duration-weighted mean embedding of each global speaker after ``stitch_speakers``."""
+    sums, seconds = {}, {}
+    for speakers, mapping in zip(chunk_speakers, mappings):
+        for label, (emb, speech) in speakers.items():
+            if emb is None or not np.all(np.isfinite(emb)):
+                continue
+            name = f"SPEAKER_{mapping[label]:02d}"
+            unit = np.asarray(emb, dtype=np.float64) / (np.linalg.norm(emb) + 1e-12)
+            sums[name] = sums.get(name, 0.0) + unit * speech
+            seconds[name] = seconds.get(name, 0.0) + speech
+    return {name: sums[name] / seconds[name] for name in sums if seconds[name] >= MIN_VOICEPRINT_SECONDS}
+
+
+def mfcc_voiceprints(y, sr, segments, n_mfcc=20):
+    """
+    Voiceprint per speaker from MFCC statistics over that speaker's turns.
+
+    A CPU-only stand-in for a neural speaker embedding: the mean and spread
+    of MFCCs 1..n-1 without per-call normalization, so the same voice on
+    the same kind of line lands close by. Used by the fast and channel-split
+    diarizers. Different voices on one line land close by too, so these
+    voiceprints are kept with the call but never used to assign a voiceID
+    or flag fraud (see ``voiceindex.IDENTIFYING_MODELS``).
+
+    Returns:
+        Dict of speaker label -> vector, for speakers with at least
+        MIN_VOICEPRINT_SECONDS of speech
+    """
+    import librosa
+
+    table = SegmentTable.coerce(segments)
+    hop_length = sr // 100
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc, n_fft=int(sr * 0.025), hop_length=hop_length)[1:]
+    n_frames = mfcc.shape[1]
+    starts = np.clip((table.start * 100).astype(int), 0, n_frames)
+    ends = np.clip((table.end * 100).astype(int), 0, n_frames)
+
+    voiceprints = {}
+    for code, speaker in enumerate(table.speakers):
+        own = table.rows["speaker"] == code
+        # Frames inside any of the speaker's turns (turns may overlap)
+        edges = np.zeros(n_frames + 1, dtype=np.int64)
+        np.add.at(edges, starts[own], 1)
+        np.add.at(edges, ends[own], -1)
+        feats = mfcc[:, np.cumsum(edges[:-1]) > 0]
+        if feats.shape[1] * hop_length / sr >= MIN_VOICEPRINT_SECONDS:
+            voiceprints[speaker] = np.concatenate([feats.mean(axis=1), feats.std(axis=1)])
+    return voiceprints
+
+
+def save_voiceprints(diarizer, audio_path):
+    """
+    Write the last call's per-speaker embeddings next to the diarization output.
+
+    Returns:
+        Path of ``<audio>_voiceprints.json``, or None if the diarizer produced none
+    """
+    embeddings = getattr(diarizer, "speaker_embeddings", None)
+    if not embeddings:
+        return None
+    json_path = f"{os.path.splitext(audio_path)[0]}_voiceprints.json"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": diarizer.embedding_model,
+            "speakers": {speaker: [float(v) for v in vector] for speaker, vector in embeddings.items()}
+        }, f)
+    return json_path
+
+
 class SpeakerDiarizer:
+    embedding_model = "pyannote"
+    
     def __init__(self, num_speakers=2):
+        import torch
+        
         self.num_speakers = num_speakers
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # Per-speaker embeddings of the last call, for voice identification (see voiceindex.py)
+        self.speaker_embeddings = {}
         
     def diarize(self, audio_path):
-        pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1")
+        """Diarize a call, in parallel windows when it is longer than CHUNK_DURATION (see DIARIZATION_CHUNKED)."""
+        if DIARIZATION_CHUNKED.lower() != "off" and sf.info(audio_path).duration > CHUNK_DURATION:
+            return self.diarize_chunked(audio_path)
+        return self.diarize_full(audio_path)
+    
+    def diarize_full(self, audio_path):
+        from pyannote.audio import Pipeline
+        
+        pipeline = Pipeline.from_pretrained(PIPELINE_NAME)
         pipeline.to(self.device)
         
-        diarization = pipeline(audio_path, num_speakers=self.num_speakers)
+        diarization, embeddings = pipeline(audio_path, num_speakers=self.num_speakers, return_embeddings=True)
+        
+        speech = {label: diarization.label_duration(label) for label in diarization.labels()}
+        self.speaker_embeddings = {
+            label: embeddings[i] for i, label in enumerate(diarization.labels())
+            if speech[label] >= MIN_VOICEPRINT_SECONDS and np.all(np.isfinite(embeddings[i]))
+        }
         
         segments = []
         for turn, _, speaker in diarization.itertracks(yield_label=True):
             segments.append({
                 "speaker": speaker,
                 "start": round(turn.start, 2),
-                "end": round(turn.end, 2),
-                "duration": round(turn.end - turn.start, 2)
+                "end": round(turn.end, 2)
             })
         
-        return segments
+        return SegmentTable.from_records(segments)
+    
+    def diarize_chunked(self, audio_path, chunk_duration=CHUNK_DURATION, overlap=CHUNK_OVERLAP, max_workers=None):
+        """
+        Diarize a long recording in overlapping windows across worker processes.
+        
+        Each window is diarized independently; speaker labels are then
+        reconciled across windows by clustering the per-window speaker
+        embeddings (see ``stitch_speakers``). Output matches ``diarize``.
+        
+        Args:
+            audio_path: Path to the (cleaned) audio file
+            chunk_duration: Window length in seconds
+            overlap: Seconds shared by neighbouring windows
+            max_workers: Worker processes (default: one per core, capped by chunk count)
+            
+        Returns:
+            SegmentTable of turns
+        """
+        total_duration = sf.info(audio_path).duration
+        if total_duration <= chunk_duration:
+            return self.diarize_full(audio_path)
+        
+        chunks = plan_chunks(total_duration, chunk_duration, overlap)
+        # Inside a worker job, stay within the job's thread budget
+        cores = int(os.getenv("OMP_NUM_THREADS") or 0) or os.cpu_count() or 1
+        workers = max(1, min(max_workers or cores, len(chunks)))
+        threads = max(1, cores // workers)
+        
+        logger.info(f"Diarizing {total_duration:.0f}s in {len(chunks)} chunks with {workers} worker(s)")
+        
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_chunk_worker,
+            initargs=(str(self.device), threads)
+        ) as pool:
+            futures = [
+                pool.submit(_diarize_window, audio_path, start, end, self.num_speakers)
+                for start, end, _, _ in chunks
+            ]
+            results = [future.result() for future in futures]
+        
+        chunk_speakers = []
+        for turns, embeddings in results:
+            speech = {}
+            for speaker, start, end in turns:
+                speech[speaker] = speech.get(speaker, 0.0) + (end - start)
+            chunk_speakers.append({label: (embeddings.get(label), speech[label]) for label in speech})
+        
+        mappings = stitch_speakers(chunk_speakers, self.num_speakers)
+        self.speaker_embeddings = speaker_centroids(chunk_speakers, mappings)
+        
+        segments = []
+        for (_, _, keep_start, keep_end), (turns, _), mapping in zip(chunks, results, mappings):
+            for speaker, start, end in turns:
+                start, end = max(start, keep_start), min(end, keep_end)
+                if end <= start:
+                    continue
+                segments.append({
+                    "speaker": f"SPEAKER_{mapping[speaker]:02d}",
+                    "start": round(start, 2),
+                    "end": round(end, 2)
+                })
+        
+        # Join turns of one speaker cut by a chunk boundary
+        return SegmentTable.from_records(segments).merge_adjacent()
     
     def save_results(self, segments, audio_path):
+        """
+        Write the turns for the next stages.
+        
+        ``<audio>_diarization.seg`` is what transcription reads; the JSON
+        export (for the standalone scripts) and a readable ``.txt`` are
+        written alongside.
+        
+        Returns:
+            Tuple of (txt path, segment table path)
+        """
+        table = SegmentTable.coerce(segments)
         base_name = os.path.splitext(audio_path)[0]
         txt_path = f"{base_name}_diarization.txt"
-        json_path = f"{base_name}_diarization.json"
         
         with open(txt_path, "w", encoding="utf-8") as f:
-            for seg in segments:
-                line = f"[{seg['start']:.2f} - {seg['end']:.2f}] {seg['speaker']}\n"
-                f.write(line)
+            f.writelines(
+                f"[{start:.2f} - {end:.2f}] {speaker}\n"
+                for start, end, speaker in zip(table.start, table.end, table.labels)
+            )
+        
+        table.save_json(f"{base_name}_diarization.json")
+        return txt_path, table.save(f"{base_name}_diarization.seg")
+
+
+class FastSpeakerDiarizer:
+    """
+    Lightweight CPU diarizer for calls with a known, small number of speakers.
+    
+    Speech regions come from the energy VAD; each region is cut into short
+    sliding windows described by the mean and spread of their MFCCs, and
+    the windows are split into ``num_speakers`` groups with k-means. No
+    neural model or HuggingFace token is needed, and an hour of audio takes
+    seconds rather than minutes on CPU.
+    """
+    embedding_model = "mfcc"
+    
+    def __init__(self, num_speakers=2, window=1.5, hop=0.75, n_mfcc=20, seed=0):
+        self.num_speakers = num_speakers
+        self.window = window
+        self.hop = hop
+        self.n_mfcc = n_mfcc
+        self.seed = seed
+        self.hop_length = 160  # 10 ms MFCC frames at 16 kHz
+        self.speaker_embeddings = {}
+    
+    def diarize(self, audio_path):
+        import librosa
+        
+        y, sr = librosa.load(audio_path, sr=16000, mono=True)
+        return self.diarize_array(y, sr)
+    
+    def _window_embeddings(self, y, sr):
+        """MFCC mean/std embeddings for sliding windows over the VAD speech regions."""
+        import librosa
+        
+        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=self.n_mfcc, n_fft=400, hop_length=self.hop_length)[1:]
+        mfcc = (mfcc - mfcc.mean(axis=1, keepdims=True)) / (mfcc.std(axis=1, keepdims=True) + 1e-8)
+        feats = mfcc.T.astype(np.float64)
+        
+        # Prefix sums give every window's mean and variance in O(1)
+        csum = np.vstack([np.zeros(feats.shape[1]), np.cumsum(feats, axis=0)])
+        csq = np.vstack([np.zeros(feats.shape[1]), np.cumsum(feats ** 2, axis=0)])
+        
+        frames_per_second = sr / self.hop_length
+        win = max(1, int(self.window * frames_per_second))
+        hop = max(1, int(self.hop * frames_per_second))
+        vad_to_mfcc = (FRAME_MS / 1000.0) * frames_per_second
+        
+        windows = []
+        region_ids = []
+        mask = detect_speech(y, sr)
+        for region, (s, e) in enumerate(zip(*_runs(mask))):
+            rs = int(s * vad_to_mfcc)
+            re = min(int(e * vad_to_mfcc), len(feats))
+            if re <= rs:
+                continue
+            for p in range(rs, max(rs + 1, re - win + 1), hop):
+                windows.append((p, min(p + win, re)))
+                region_ids.append(region)
+            # Cover the tail of the region with one last window
+            if windows[-1][1] < re:
+                windows.append((max(rs, re - win), re))
+                region_ids.append(region)
+        
+        if not windows:
+            return np.zeros((0, 2 * feats.shape[1])), np.zeros((0, 2), dtype=int), np.zeros(0, dtype=int)
+        
+        bounds = np.array(windows)
+        n = (bounds[:, 1] - bounds[:, 0])[:, None]
+        mean = (csum[bounds[:, 1]] - csum[bounds[:, 0]]) / n
+        var = (csq[bounds[:, 1]] - csq[bounds[:, 0]]) / n - mean ** 2
+        embeddings = np.hstack([mean, np.sqrt(np.maximum(var, 0.0))])
+        return embeddings, bounds, np.array(region_ids)
+    
+    def _cluster(self, embeddings):
+        from scipy.cluster.vq import kmeans2
+        
+        if len(embeddings) < self.num_speakers:
+            return np.zeros(len(embeddings), dtype=int)
+        
+        scaled = (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-8)
+        best_labels, best_inertia = None, np.inf
+        for attempt in range(5):
+            centroids, labels = kmeans2(scaled, self.num_speakers, minit='++', seed=self.seed + attempt)
+            inertia = np.sum((scaled - centroids[labels]) ** 2)
+            if inertia < best_inertia:
+                best_labels, best_inertia = labels, inertia
+        return best_labels
+    
+    def diarize_array(self, y, sr):
+        """
+        Diarize an in-memory mono signal.
+        
+        Returns:
+            SegmentTable of turns, like ``SpeakerDiarizer``
+        """
+        embeddings, bounds, region_ids = self._window_embeddings(y, sr)
+        labels = self._cluster(embeddings)
         
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(segments, f, indent=2)
+        # Single-window flips inside a region are almost always clustering noise
+        if len(labels) > 2:
+            same_region = (region_ids[:-2] == region_ids[1:-1]) & (region_ids[1:-1] == region_ids[2:])
+            flips = same_region & (labels[:-2] == labels[2:]) & (labels[1:-1] != labels[:-2])
+            labels[1:-1][flips] = labels[:-2][flips]
         
-        return txt_path, json_path
+        # Name speakers in order of first appearance, like pyannote output reads
+        order = {}
+        for label in labels:
+            order.setdefault(int(label), len(order))
+        
+        to_seconds = self.hop_length / sr
+        segments = []
+        for i, (label, region) in enumerate(zip(labels, region_ids)):
+            # Each window owns the stretch between the midpoints to its neighbours
+            first = i == 0 or region_ids[i - 1] != region
+            last = i == len(labels) - 1 or region_ids[i + 1] != region
+            start = bounds[i, 0] if first else (bounds[i - 1, 0] + bounds[i - 1, 1] + bounds[i, 0] + bounds[i, 1]) / 4
+            end = bounds[i, 1] if last else (bounds[i, 0] + bounds[i, 1] + bounds[i + 1, 0] + bounds[i + 1, 1]) / 4
+            start, end = float(start), float(end)
+            speaker = f"SPEAKER_{order[int(label)]:02d}"
+            
+            if segments and not first and segments[-1]["speaker"] == speaker:
+                segments[-1]["end"] = round(end * to_seconds, 2)
+                segments[-1]["duration"] = round(segments[-1]["end"] - segments[-1]["start"], 2)
+                continue
+            
+            segments.append({
+                "speaker": speaker,
+                "start": round(start * to_seconds, 2),
+                "end": round(end * to_seconds, 2),
+                "duration": round((end - start) * to_seconds, 2)
+            })
+        
+        table = SegmentTable.from_records(segments)
+        self.speaker_embeddings = mfcc_voiceprints(y, sr, table)
+        return table
+    
+    save_results = SpeakerDiarizer.save_results
+
+
+class ChannelSplitDiarizer:
+    """
+    Diarize stereo recordings by channel, and everything else with ``fallback``.
+    
+    When agent and customer are on separate channels (see stereo.py) the
+    per-channel VAD already says who spoke when, so the fallback diarizer
+    is not even constructed. ``channel_split`` tells whether the last call
+    took the fast path.
+    """
+    
+    def __init__(self, fallback_factory, num_speakers=2):
+        self.num_speakers = num_speakers
+        self.channel_split = False
+        self.speaker_embeddings = {}
+        self.embedding_model = "mfcc"
+        self._fallback_factory = fallback_factory
+        self._fallback = None
+    
+    @property
+    def fallback(self):
+        if self._fallback is None:
+            self._fallback = self._fallback_factory()
+        return self._fallback
+    
+    def diarize(self, audio_path):
+        try:
+            stereo = sf.info(audio_path).channels == 2
+        except RuntimeError:
+            # Not a format soundfile reads; let librosa decide
+            stereo = True
+        
+        if stereo:
+            channels, sr = load_channels(audio_path)
+            info = analyze_channels(channels, sr)
+            if info["split"]:
+                self.channel_split = True
+                self.embedding_model = "mfcc"
+                segments = channel_segments(info["masks"])
+                self.speaker_embeddings = {}
+                for channel, y in enumerate(channels):
+                    self.speaker_embeddings.update(mfcc_voiceprints(y, sr, segments[segments.channel == channel]))
+                logger.info(f"Channel-split diarization: {len(segments)} segments, no model needed")
+                return segments
+        
+        self.channel_split = False
+        segments = self.fallback.diarize(audio_path)
+        self.speaker_embeddings = self.fallback.speaker_embeddings
+        self.embedding_model = self.fallback.embedding_model
+        return segments
+    
+    save_results = SpeakerDiarizer.save_results
+
+
+def create_diarizer(backend=None, num_speakers=2, channel_split=None):
+    """
+    Build the diarizer selected by ``backend`` or the DIARIZATION_BACKEND setting.
+    
+    Two-speaker diarizers are wrapped in ChannelSplitDiarizer unless
+    ``channel_split`` (default CHANNEL_SPLIT) is "off".
+    """
+    backend = (backend or DIARIZATION_BACKEND).lower()
+    if backend == "fast":
+        factory = lambda: FastSpeakerDiarizer(num_speakers=num_speakers)
+    elif backend == "pyannote":
+        factory = lambda: SpeakerDiarizer(num_speakers=num_speakers)
+    else:
+        raise ValueError(f"Unknown diarization backend: {backend}")
+    
+    if num_speakers == 2 and (channel_split or CHANNEL_SPLIT).lower() != "off":
+        return ChannelSplitDiarizer(factory, num_speakers=num_speakers)
+    return factory()
+
 
 if __name__ == "__main__":
     AUDIO_FILE = r".\\audio_files\\file1_cleaned.wav"
     HF_TOKEN = os.getenv('HUGGINGFACE_TOKEN')
     NUM_SPEAKERS = 2
     
-    if not HF_TOKEN:
-        print("❌ Error: HUGGINGFACE_TOKEN not found in environment variables")
-        print("   Please add it to the .env file in the project root")
-        exit(1)
-    
-    login(token=HF_TOKEN)
+    if DIARIZATION_BACKEND == "pyannote":
+        import torch
+        from huggingface_hub import login
+        
+        if not HF_TOKEN:
+            print("❌ Error: HUGGINGFACE_TOKEN not found in environment variables")
+            print("   Please add it to the .env file in the project root")
+            exit(1)
+        
+        login(token=HF_TOKEN)
+        print(f"Using device: {'CUDA' if torch.cuda.is_available() else 'CPU'}")
+    else:
+        print(f"Using {DIARIZATION_BACKEND} diarization backend (CPU)")
     
-    print(f"Using device: {'CUDA' if torch.cuda.is_available() else 'CPU'}")
     print(f"Processing: {AUDIO_FILE}")
     
-    diarizer = SpeakerDiarizer(num_speakers=NUM_SPEAKERS)
+    diarizer = create_diarizer(num_speakers=NUM_SPEAKERS)
     
     segments = diarizer.diarize(AUDIO_FILE)
     
-    txt_file, json_file = diarizer.save_results(segments, AUDIO_FILE)
+    txt_file, table_file = diarizer.save_results(segments, AUDIO_FILE)
     
     print(f"\nDiarization complete!")
     print(f"Total segments: {len(segments)}")
-    print(f"Speakers found: {len(set(seg['speaker'] for seg in segments))}")
+    print(f"Speakers found: {len(set(segments.speakers))}")
     print(f"\nFiles saved:")
     print(f"  {txt_file}")
-    print(f"  {json_file}")
\ No newline at end of file
+    print(f"  {table_file}")
\ No newline at end of file
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Audio fingerprints for spotting duplicate uploads before they are processed.
+
+The same recording often arrives more than once (another agent's upload,
+a dialer re-sync), sometimes re-encoded or trimmed. Each copy used to go
+through preprocessing, diarization, Whisper and the LLM again.
+
+A fingerprint has two parts:
+
+* ``sha256`` of the file bytes: an exact copy is found with one indexed lookup.
+* a MinHash signature over spectral-peak pair hashes, as in landmark-based
+  audio ID. Peaks are local maxima of the log spectrogram over a
+  time-frequency neighbourhood that stand out from the loudest sound of the
+  surrounding seconds (quiet peaks are the first to move under noise or a
+  codec). Each peak is paired with a few following peaks, giving hashes of
+  (f1, f2, dt), which do not depend on where the copy starts. Re-encoding
+  moves few peaks, so copies share most hashes. The signature is split
+  into LSH bands; any shared band makes a candidate, and candidates are
+  scored by their estimated Jaccard similarity.
+
+Only an exact copy, or a near copy that is unambiguously the same recording
+(high similarity, matching durations, fingerprints that cover nearly all of
+both files), takes over the original's results. Weaker matches, such as a
+trimmed copy or a call sharing a long hold message with another, are only
+recorded as a possible duplicate and the upload is processed as usual.
+
+Fingerprints live in the ``fingerprints`` collection (one document per
+file, indexed on ``sha256`` and the multikey ``bands``). A lookup is one or
+two indexed queries over at most a handful of candidates.
+
+Examples:
+    python fingerprint.py check ./files/call.mp3
+    python fingerprint.py compare ./files/a.mp3 ./files/b.wav
+"""
+import os
+import json
+import hashlib
+import argparse
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+FINGERPRINTS_COLLECTION = "fingerprints"
+SAMPLE_RATE = 8000
+N_FFT = 512
+HOP = 64
+# Lowest FFT bin considered (skips DC and rumble)
+MIN_BIN = 2
+# A peak is the maximum over this many frames (~200 ms) and bins (~190 Hz) either side
+PEAK_TIME_NEIGHBORHOOD = 25
+PEAK_FREQ_NEIGHBORHOOD = 12
+# ...within this many dB of the loudest bin of the recording
+PEAK_RANGE_DB = 50.0
+# ...and of the loudest bin within the surrounding frames (~2 s)
+LOUDNESS_WINDOW = 250
+PEAK_LOCAL_RANGE_DB = 20.0
+FAN_OUT = 5
+# Peak pairs store their distance in steps of this many frames, so a copy cut
+# at a different sample (shifting the frame grid) still yields the same hashes
+DT_QUANTUM = 4
+MAX_DT = 63
+NUM_PERMUTATIONS = 64
+ROWS_PER_BAND = 2
+# Estimated Jaccard similarity of the peak-pair hash sets above which an upload is a possible duplicate
+NEAR_DUPLICATE_JACCARD = 0.2
+# ...and above which it is the same recording, given the checks below
+LINK_JACCARD = 0.6
+# Seconds the two files' durations may differ by (codec padding, resampling)
+LINK_DURATION_TOLERANCE = 1.0
+# Share of each file its fingerprint must cover (only MAX_SECONDS are fingerprinted)
+LINK_MIN_COVERAGE = 0.9
+# Only the start of long calls is fingerprinted
+MAX_SECONDS = 600.0
+MAX_CANDIDATES = 50
+
+_seeds = np.random.default_rng(0x5EED).integers(1, 2 ** 63, size=(2, NUM_PERMUTATIONS), dtype=np.uint64)
+PERMUTATION_A = _seeds[0] | np.uint64(1)
+PERMUTATION_B = _seeds[1]
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def spectral_peaks(y: np.ndarray) -> np.ndarray:
+    """
+    Landmark peaks of a mono 8 kHz signal.
+
+    Returns:
+        (n, 2) int array of (frame, bin) sorted by frame
+    """
+    from scipy.ndimage import maximum_filter, maximum_filter1d
+    from vad import frame_signal
+
+    frames = frame_signal(np.asarray(y, dtype=np.float32), N_FFT, HOP)
+    if len(frames) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    window = np.hanning(N_FFT).astype(np.float32)
+    magnitude_db = 20.0 * np.log10(np.abs(np.fft.rfft(frames * window, axis=1)) + 1e-10)[:, MIN_BIN:]
+    neighborhood = maximum_filter(
+        magnitude_db, size=(2 * PEAK_TIME_NEIGHBORHOOD + 1, 2 * PEAK_FREQ_NEIGHBORHOOD + 1),
+        mode="constant", cval=-np.inf
+    )
+    loudest = maximum_filter1d(magnitude_db.max(axis=1), LOUDNESS_WINDOW, mode="nearest")
+    t, f = np.nonzero(
+        (magnitude_db == neighborhood)
+        & (magnitude_db > magnitude_db.max() - PEAK_RANGE_DB)
+        & (magnitude_db > loudest[:, None] - PEAK_LOCAL_RANGE_DB)
+    )
+    # np.nonzero already orders by frame, then bin
+    return np.column_stack((t, f + MIN_BIN)).astype(np.int64)
+
+
+def peak_hashes(peaks: np.ndarray, fan_out: int = FAN_OUT, max_dt: int = MAX_DT) -> np.ndarray:
+    """Unique 24-bit (f1, f2, dt) hashes pairing each peak with the next ``fan_out`` peaks."""
+    hashes = []
+    for k in range(1, fan_out + 1):
+        if len(peaks) <= k:
+            break
+        anchor, target = peaks[:-k], peaks[k:]
+        dt = np.rint((target[:, 0] - anchor[:, 0]) / DT_QUANTUM).astype(np.int64)
+        keep = (dt > 0) & (dt <= max_dt)
+        hashes.append((anchor[keep, 1] << 15) | (target[keep, 1] << 6) | dt[keep])
+    if not hashes:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(np.concatenate(hashes).astype(np.uint64))
+
+
+def minhash(hashes: np.ndarray) -> np.ndarray:
+    """MinHash signature (multiply-shift permutations) of a hash set; all ones for an empty set."""
+    if len(hashes) == 0:
+        return np.full(NUM_PERMUTATIONS, 0xFFFFFFFF, dtype=np.uint64)
+    permuted = (PERMUTATION_A[:, None] * hashes[None, :] + PERMUTATION_B[:, None]) >> np.uint64(32)
+    return permuted.min(axis=1)
+
+
+def lsh_bands(signature: np.ndarray, rows: int = ROWS_PER_BAND) -> List[int]:
+    """One signed 64-bit key per band of ``rows`` signature values (BSON has no unsigned ints)."""
+    keys = []
+    for band, start in enumerate(range(0, len(signature), rows)):
+        digest = hashlib.blake2b(signature[start:start + rows].tobytes(), digest_size=8, key=bytes([band]))
+        keys.append(int.from_bytes(digest.digest(), "big", signed=True))
+    return keys
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(np.asarray(a, dtype=np.uint64) == np.asarray(b, dtype=np.uint64)))
+
+
+def fingerprint_signal(y: np.ndarray) -> Dict:
+    """Fingerprint of an 8 kHz mono signal, without the file hash."""
+    hashes = peak_hashes(spectral_peaks(y))
+    signature = minhash(hashes)
+    duration = round(len(y) / SAMPLE_RATE, 2)
+    return {
+        "signature": [int(v) for v in signature],
+        "bands": lsh_bands(signature),
+        "hashes": int(len(hashes)),
+        # Seconds fingerprinted, and the length of the whole recording
+        "duration": duration,
+        "fileDuration": duration,
+    }
+
+
+def fingerprint_file(path: str, max_seconds: float = MAX_SECONDS) -> Dict:
+    """Fingerprint the first ``max_seconds`` of an audio file."""
+    import librosa
+
+    y, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True, duration=max_seconds)
+    fingerprint = fingerprint_signal(y)
+    fingerprint["sha256"] = file_sha256(path)
+    if fingerprint["duration"] >= max_seconds - 1:
+        fingerprint["fileDuration"] = round(librosa.get_duration(path=path), 2)
+    return fingerprint
+
+
+def same_recording(a: Dict, b: Dict, score: float) -> bool:
+    """Whether a near match is safe to treat as a copy: similar, equally long and fully fingerprinted."""
+    if score < LINK_JACCARD or not a.get("fileDuration") or not b.get("fileDuration"):
+        return False
+    if abs(a["fileDuration"] - b["fileDuration"]) > LINK_DURATION_TOLERANCE:
+        return False
+    return all(f["duration"] >= LINK_MIN_COVERAGE * f["fileDuration"] for f in (a, b))
+
+
+class FingerprintIndex:
+    """Fingerprints of processed uploads in MongoDB, looked up by file hash and LSH band."""
+
+    def __init__(self, collection, threshold: float = NEAR_DUPLICATE_JACCARD):
+        self.collection = collection
+        self.threshold = threshold
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index("sha256")
+        self.collection.create_index("bands")
+
+    def add(self, file_id, fingerprint: Dict) -> None:
+        self.collection.update_one(
+            {"_id": file_id},
+            {"$set": {**fingerprint, "createdAt": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True
+        )
+
+    def remove(self, file_id) -> None:
+        self.collection.delete_one({"_id": file_id})
+
+    def find_duplicate(self, fingerprint: Dict, exclude=None) -> Optional[Dict]:
+        """
+        Best earlier upload of the same recording.
+
+        ``match`` is "exact" for the same file bytes, "near" for a copy that
+        passes :func:`same_recording`, and "possible" for any other candidate
+        above the threshold. Only the first two may be linked.
+
+        Returns:
+            ``{"fileId", "match": "exact"|"near"|"possible", "similarity"}`` or None
+        """
+        not_self = {"_id": {"$ne": exclude}} if exclude is not None else {}
+
+        if fingerprint.get("sha256"):
+            exact = self.collection.find_one({"sha256": fingerprint["sha256"], **not_self}, {"_id": 1})
+            if exact:
+                return {"fileId": exact["_id"], "match": "exact", "similarity": 1.0}
+
+        if not fingerprint.get("hashes"):
+            return None
+        candidates = self.collection.find(
+            {"bands": {"$in": fingerprint["bands"]}, **not_self},
+            {"signature": 1, "duration": 1, "fileDuration": 1}
+        ).limit(MAX_CANDIDATES)
+
+        best, best_rank = None, None
+        for candidate in candidates:
+            score = similarity(fingerprint["signature"], candidate["signature"])
+            if score < self.threshold:
+                continue
+            match = "near" if same_recording(fingerprint, candidate, score) else "possible"
+            rank = (match == "near", score)
+            if best is None or rank > best_rank:
+                best, best_rank = {"fileId": candidate["_id"], "match": match, "similarity": round(score, 3)}, rank
+        return best
+
+
+# Upload metadata that stays with each copy; everything else in keyDetails is extracted
+UPLOAD_FIELDS = ("filename", "originalname", "mimetype", "size")
+# Matches that may take over the original's results
+LINKABLE_MATCHES = ("exact", "near")
+
+
+def link_duplicate(files, file_id, original: Dict) -> bool:
+    """
+    Copy an already-extracted original's results onto a duplicate upload.
+
+    Returns:
+        False if the match is not linkable or the original has no results yet
+        (the duplicate is then processed normally)
+    """
+    if original["match"] not in LINKABLE_MATCHES:
+        return False
+    source = files.find_one({"_id": original["fileId"], "extractedAt": {"$exists": True}})
+    if not source:
+        return False
+
+    update = {
+        f"keyDetails.{key}": value
+        for key, value in (source.get("keyDetails") or {}).items()
+        if key not in UPLOAD_FIELDS
+    }
+    for field in ("summary", "voiceID", "voiceMatch"):
+        if source.get(field) is not None:
+            update[field] = source[field]
+    update.update({
+        "duplicateOf": {"fileId": source["_id"], "match": original["match"], "similarity": original["similarity"]},
+        "extractedAt": datetime.datetime.now(datetime.timezone.utc),
+        "status": "extracted",
+        "progress": 100,
+    })
+    return files.update_one({"_id": file_id}, {"$set": update, "$unset": {"possibleDuplicateOf": ""}}).matched_count > 0
+
+
+def flag_possible_duplicate(files, file_id, original: Dict) -> None:
+    """Record a match too weak to link, for review; the upload is processed as usual."""
+    files.update_one({"_id": file_id}, {"$set": {"possibleDuplicateOf": {
+        "fileId": original["fileId"], "match": original["match"], "similarity": original["similarity"]
+    }}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audio fingerprints for duplicate upload detection")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = sub.add_parser("check", help="Look a file up in the fingerprint index")
+    check_parser.add_argument("path")
+
+    compare_parser = sub.add_parser("compare", help="Similarity of two files")
+    compare_parser.add_argument("paths", nargs=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "compare":
+        a, b = (fingerprint_file(path) for path in args.paths)
+        score = similarity(a["signature"], b["signature"])
+        print(json.dumps({
+            "exact": a["sha256"] == b["sha256"],
+            "similarity": score,
+            "sameRecording": a["sha256"] == b["sha256"] or same_recording(a, b, score),
+            "hashes": [a["hashes"], b["hashes"]],
+            "durations": [a["fileDuration"], b["fileDuration"]],
+        }))
+    else:
+        from pymongo import MongoClient
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+        try:
+            index = FingerprintIndex(client["finsense-ai"][FINGERPRINTS_COLLECTION])
+            print(json.dumps(index.find_duplicate(fingerprint_file(args.path)), default=str))
+        finally:
+            client.close()
@@ -17,6 +17,11 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 # DON'T import transcript here - it will be imported when needed to avoid dependency issues
 sys.path.append(os.path.dirname(__file__))
 
+from rollups import STATS_COLLECTION, refresh_call_stats
+from prefilter import STATUS_COLLECTION, analyze, fill_missing, local_report, record_outcome
+from compaction import compact_transcript
+from backboard_stub import create_backboard_client
+
 """
 TO ADD:
 file name
@@ -42,7 +47,18 @@ COLLECTION_NAME = "fileinfos"
 mongo_client = MongoClient(MONGO_URI)
 db = mongo_client[DB_NAME]
 collection = db[COLLECTION_NAME]
+stats_collection = db[STATS_COLLECTION]
+status_collection = db[STATUS_COLLECTION]
 BACKBOARD_API_KEY = os.getenv('BACKBOARD_API_KEY')
+# Reply to the submit_clean_report tool call: "none" (the report is already
+# stored, so skip the round trip), "background" (sent while the caller moves
+# on, then drained before the event loop closes) or "wait"
+TOOL_OUTPUT_ACK = os.getenv('BACKBOARD_ACK', 'none')
+# Seconds to wait for background acknowledgments when draining them
+ACK_DRAIN_TIMEOUT = float(os.getenv('BACKBOARD_ACK_DRAIN_TIMEOUT', '30'))
+
+# Background acknowledgments still in flight; see drain_acknowledgments()
+_background_tasks = set()
 
 if not BACKBOARD_API_KEY:
     print("⚠️  Warning: BACKBOARD_API_KEY not found in environment variables")
@@ -113,6 +129,26 @@ def get_file_metadata(audio_path: str) -> dict:
         }
 
 
+def file_metadata_from_doc(file_doc: dict) -> dict:
+    """
+    Metadata of an upload from its file document, without touching the audio.
+    
+    Args:
+        file_doc: ``fileinfos`` document (or the dict get_file_from_mongodb returns)
+        
+    Returns:
+        Dictionary with file metadata, as get_file_metadata
+    """
+    details = file_doc.get("keyDetails") or file_doc
+    return {
+        "file_name": details.get("filename") or "unknown",
+        "file_address": file_doc.get("fileAddress") or "",
+        "org_file_name": details.get("originalname") or details.get("filename") or "unknown",
+        "mimetype": details.get("mimetype") or "audio/mpeg",
+        "size": details.get("size") or 0
+    }
+
+
 def wait_for_files(audio_path, diarization_path, timeout=300, check_interval=2):
     """
     Wait for both audio file and diarization JSON to exist.
@@ -174,21 +210,153 @@ def wait_for_files(audio_path, diarization_path, timeout=300, check_interval=2):
     return False
 
 
-async def main(audio_path: str = None, diarization_json_path: str = None, transcript_text: str = None):
+def store_report(cleaned_data: dict, file_id: str = None, file_metadata: dict = None, database=None) -> bool:
+    """
+    Write an extracted report onto its file document.
+    
+    Args:
+        cleaned_data: submit_clean_report arguments (from the LLM or the local pre-filter)
+        file_id: MongoDB file ID, if known
+        file_metadata: Metadata of the audio file, used to find the document without an ID
+        database: Database holding the file documents and daily stats (default: MONGODB_URI's)
+        
+    Returns:
+        True if a document was updated
+    """
+    database = db if database is None else database
+    collection, stats_collection = database[COLLECTION_NAME], database[STATS_COLLECTION]
+    
+    # Prefer the known file over the file_name echoed back by the model
+    if file_id:
+        filter_query = {"_id": ObjectId(file_id)}
+    elif file_metadata:
+        filter_query = {"keyDetails.filename": file_metadata["file_name"]}
+    else:
+        filter_query = {"keyDetails.filename": cleaned_data.get("file_name")}
+
+    # Dynamically build update data from ALL fields the report provides
+    update_fields = {}
+
+    # Fields that go to top level of document
+    top_level_fields = {
+        "summary": "summary"
+    }
+
+    # Fields that should NOT be added to keyDetails (metadata fields).
+    # voiceID comes from the voiceprint index at diarization, never from the report.
+    excluded_fields = ["file_name", "file_address", "org_file_name", "voice_id"]
+
+    # Iterate through ALL fields in the report
+    for key, value in cleaned_data.items():
+        # Skip empty/null values
+        if value is None or value == "":
+            continue
+
+        # Handle top-level fields
+        if key in top_level_fields:
+            update_fields[top_level_fields[key]] = value
+        # Skip excluded fields
+        elif key in excluded_fields:
+            continue
+        # Everything else goes into keyDetails
+        else:
+            # Convert fraud boolean to yes/no for consistency
+            if key == "fraud":
+                update_fields[f"keyDetails.{key}"] = "yes" if value else "no"
+            else:
+                update_fields[f"keyDetails.{key}"] = value
+
+    # A known fraud voice (voiceindex.py) outranks the model's reading of the text
+    if update_fields.get("keyDetails.fraud") != "yes":
+        known = collection.find_one({**filter_query, "voiceMatch.fraud": True}, {"_id": 1})
+        if known:
+            update_fields["keyDetails.fraud"] = "yes"
+
+    # Only update if there are fields to update
+    if update_fields:
+        # Watermark for the incremental analytics export
+        update_fields["extractedAt"] = datetime.datetime.now(datetime.timezone.utc)
+        update_data = {"$set": update_fields}
+        result = collection.update_one(filter_query, update_data)
+
+        if result.matched_count > 0:
+            # Keep the dashboard's per-day counters in step with this call
+            refresh_call_stats(collection, stats_collection, filter_query)
+            print(f"\nDocument updated successfully! Modified {result.modified_count} field(s)")
+            print(f"   Updated {len(update_fields)} field(s): {', '.join(update_fields.keys())}")
+            return True
+        else:
+            print(f"\n⚠ No document found with filename: {cleaned_data.get('file_name')}")
+            print(f"   Make sure the file exists in the database first.")
+    else:
+        print(f"\n⚠ No fields to update - all fields were empty or missing")
+    
+    return False
+
+
+async def acknowledge_tool_outputs(client, thread_id: str, run_id: str, tool_outputs: list) -> None:
+    """Send tool results back to the assistant; only needed to read its closing reply."""
+    try:
+        final_response = await client.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run_id,
+            tool_outputs=tool_outputs
+        )
+        print(f"Complete!")
+        if hasattr(final_response, 'content'):
+            print(f"   AI: {final_response.content}")
+    except Exception as e:
+        print(f"⚠️  Could not submit tool outputs: {e}")
+
+
+async def drain_acknowledgments(timeout: float = ACK_DRAIN_TIMEOUT) -> None:
+    """Wait for background acknowledgments, cancelling any still pending after ``timeout`` seconds."""
+    if not _background_tasks:
+        return
+    done, pending = await asyncio.wait(set(_background_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"⚠️  Gave up on {len(pending)} tool-output acknowledgment(s) after {timeout:g}s")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def main(audio_path: str = None, diarization_json_path: str = None, transcript_text: str = None,
+               file_id: str = None, client=None, acknowledge: str = None, file_metadata: dict = None,
+               database=None):
     """
     Main function to process audio transcript and extract structured data.
     
     Args:
-        audio_path: Path to audio file (optional, for metadata)
+        audio_path: Path to audio file (to transcribe, and for metadata unless file_metadata is given)
         diarization_json_path: Path to diarization JSON (to run transcription)
         transcript_text: Pre-generated transcript text (if available, skips transcription)
+        file_id: MongoDB file ID; when given, partial transcripts stream into its document
+        client: Backboard client to use; defaults to the one BACKBOARD_MODE selects
+            (live, or the offline stub/replay clients in backboard_stub.py)
+        acknowledge: "none", "background" or "wait" for the tool-output reply
+            (default BACKBOARD_ACK). Background replies keep running after
+            main() returns; await drain_acknowledgments() before the event loop
+            closes, or use extract() / extract_many(), which do.
+        file_metadata: Upload metadata for the report (see file_metadata_from_doc);
+            read from audio_path when not given
+        database: Database for file documents, stats and pre-filter counters
+            (default: MONGODB_URI's); benchmarks pass an in-memory one
+    
+    Returns:
+        The extracted report if it was stored, otherwise None
     """
+    database = db if database is None else database
+    collection, status_collection = database[COLLECTION_NAME], database[STATUS_COLLECTION]
+    extracted = None
+    
     # Track JSON file for cleanup
     transcript_json_to_delete = None
     
     # Import backboard here to avoid argparse conflicts
     try:
-        from backboard import BackboardClient
+        if client is None:
+            client = create_backboard_client(api_key=BACKBOARD_API_KEY)
     except ImportError:
         print("⚠️ backboard not installed. Install with: pip install backboard")
         return
@@ -209,7 +377,7 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
         
         try:
             # Import transcript module to generate JSON file
-            from transcript import main_transcription_pipeline
+            from transcript import AUTO_MODEL, TRANSCRIPTION_MODE, main_transcription_pipeline
             
             # Create output path for transcript JSON
             audio_dir = Path(audio_path).parent
@@ -221,13 +389,30 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
             print(f"   Diarization: {diarization_json_path}")
             print(f"   Output: {transcript_json_path}")
             
-            # Generate transcript and save to JSON file
-            transcripts, transcript_text = main_transcription_pipeline(
-                audio_path=audio_path,
-                diarization_json_path=diarization_json_path,
-                model_name="base",
-                save_files=True  # This will save the JSON file
-            )
+            # Stream partial results to the dashboard while transcription runs
+            progress_sink = None
+            if file_id:
+                from progress_sink import MongoProgressSink
+                progress_sink = await asyncio.to_thread(MongoProgressSink, collection, file_id)
+            
+            # Generate transcript and save to JSON file (off the event loop)
+            try:
+                transcripts, transcript_text = await asyncio.to_thread(
+                    main_transcription_pipeline,
+                    audio_path=audio_path,
+                    diarization_json_path=diarization_json_path,
+                    model_name=AUTO_MODEL,
+                    mode=TRANSCRIPTION_MODE,
+                    save_files=True,  # This will save the JSON file
+                    on_segment=progress_sink
+                )
+            except BaseException as e:
+                if progress_sink:
+                    await asyncio.to_thread(progress_sink.abort, repr(e))
+                raise
+            
+            if progress_sink:
+                await asyncio.to_thread(progress_sink.close)
             
             print(f"\n✓ Transcript JSON generated with {len(transcripts)} segments")
             print(f"✓ Transcript text: {len(transcript_text)} characters\n")
@@ -255,15 +440,28 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
     print(f"📖 Processing transcript ({len(transcript_text)} characters)...\n")
     
     # Step 3: Extract file metadata
-    file_metadata = {}
-    if audio_path:
+    if not file_metadata and audio_path:
         file_metadata = get_file_metadata(audio_path)
-        print(f"📁 File metadata extracted:")
+    file_metadata = file_metadata or {}
+    if file_metadata:
+        print(f"📁 File metadata:")
         print(f"   File: {file_metadata['file_name']}")
         print(f"   Size: {file_metadata['size']} bytes\n")
     
-    # Step 4: Initialize Backboard client and create assistant
-    client = BackboardClient(api_key=BACKBOARD_API_KEY)
+    # Step 3b: Local pre-extraction; obviously irrelevant calls skip the LLM
+    prefilter_result = analyze(transcript_text)
+    if prefilter_result["skip_llm"]:
+        print(f"⏭️  Skipping LLM: call is irrelevant ({prefilter_result['reason']})")
+        cleaned_data = local_report(prefilter_result, file_metadata)
+        await asyncio.to_thread(record_outcome, status_collection, skipped=True)
+        if await asyncio.to_thread(store_report, cleaned_data, file_id, file_metadata, database):
+            extracted = cleaned_data
+        
+        if transcript_json_to_delete and os.path.exists(transcript_json_to_delete):
+            os.remove(transcript_json_to_delete)
+        return extracted
+    
+    # Step 4: Create assistant
 
     # DEFINE THE TOOL
     tools = [{
@@ -326,7 +524,6 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
                 "file_name": {"type": "string"},
                 "file_address": {"type": "string"},
                 "org_file_name": {"type": "string"},
-                "voice_id": {"type": "string"},
                 "mimetype": {"type": "string"},
                 
                 # Technical (optional)
@@ -342,7 +539,7 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
             "required": [
                 "clean_text", "summary", "intent", "payment_method",
                 "risk_flag", "sentiment", "satisfaction", "mood", "fraud",
-                "file_name", "file_address", "org_file_name", "voice_id", "mimetype"
+                "file_name", "file_address", "org_file_name", "mimetype"
             ]
         }
     }
@@ -399,12 +596,15 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
     thread = await client.create_thread(assistant.assistant_id)
     print(f"✓ Thread created: {thread.thread_id}\n")
 
-    # Step 5: Send transcript to AI
+    # Step 5: Send the compacted transcript to AI
+    compacted_text, compaction_stats = compact_transcript(transcript_text)
+    print(f"🗜️  Compacted transcript: ~{compaction_stats['tokensBefore']} → ~{compaction_stats['tokensAfter']} tokens "
+          f"({compaction_stats['compressionRatio']}x)")
     print("🤖 Sending to Backboard AI for extraction...\n")
     
     response = await client.add_message(
         thread_id=thread.thread_id,
-        content=transcript_text,
+        content=compacted_text,
     )
 
     # Step 6: Process response
@@ -442,55 +642,15 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
                     print(json.dumps(cleaned_data, indent=2))
                     print("=" * 70)
                     
-                    # Find and update existing document
-                    # Use file_name as the unique identifier to find the document
-                    filter_query = {"keyDetails.filename": cleaned_data.get("file_name")}
-                    
-                    # Dynamically build update data from ALL fields the AI provides
-                    update_fields = {}
+                    # Regex-extracted values fill anything the model left out
+                    filled = fill_missing(cleaned_data, prefilter_result["fields"])
+                    if filled:
+                        print(f"   Filled from local pre-extraction: {', '.join(filled)}")
+                    await asyncio.to_thread(record_outcome, status_collection, skipped=False, filled=len(filled))
                     
-                    # Fields that go to top level of document
-                    top_level_fields = {
-                        "summary": "summary",
-                        "voice_id": "voiceID"
-                    }
-                    
-                    # Fields that should NOT be added to keyDetails (metadata fields)
-                    excluded_fields = ["file_name", "file_address", "org_file_name"]
-                    
-                    # Iterate through ALL fields returned by AI
-                    for key, value in cleaned_data.items():
-                        # Skip empty/null values
-                        if value is None or value == "":
-                            continue
-                        
-                        # Handle top-level fields
-                        if key in top_level_fields:
-                            update_fields[top_level_fields[key]] = value
-                        # Skip excluded fields
-                        elif key in excluded_fields:
-                            continue
-                        # Everything else goes into keyDetails
-                        else:
-                            # Convert fraud boolean to yes/no for consistency
-                            if key == "fraud":
-                                update_fields[f"keyDetails.{key}"] = "yes" if value else "no"
-                            else:
-                                update_fields[f"keyDetails.{key}"] = value
-                    
-                    # Only update if there are fields to update
-                    if update_fields:
-                        update_data = {"$set": update_fields}
-                        result = collection.update_one(filter_query, update_data)
-                        
-                        if result.matched_count > 0:
-                            print(f"\nDocument updated successfully! Modified {result.modified_count} field(s)")
-                            print(f"   Updated {len(update_fields)} field(s): {', '.join(update_fields.keys())}")
-                        else:
-                            print(f"\n⚠ No document found with filename: {cleaned_data.get('file_name')}")
-                            print(f"   Make sure the file exists in the database first.")
-                    else:
-                        print(f"\n⚠ No fields to update - all fields were empty or missing")
+                    # Blocking Mongo writes run in a thread so other extractions keep going
+                    if await asyncio.to_thread(store_report, cleaned_data, file_id, file_metadata, database):
+                        extracted = cleaned_data
 
                     tool_outputs.append({
                         "tool_call_id": tool_call.id,
@@ -505,21 +665,19 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
                     print(f"Failed to parse: {e}")
         
         # SUBMIT TOOL OUTPUTS
-        if tool_outputs:
-            print(f"\nSubmitting tool results...")
-            
-            run_id = response.run_id if hasattr(response, 'run_id') else None
-            
-            if run_id:
-                final_response = await client.submit_tool_outputs(
-                    thread_id=thread.thread_id,
-                    run_id=run_id,
-                    tool_outputs=tool_outputs
-                )
-                
-                print(f"Complete!")
-                if hasattr(final_response, 'content'):
-                    print(f"   AI: {final_response.content}")
+        # The report is already stored; the reply is only the assistant's sign-off
+        acknowledge = (acknowledge or TOOL_OUTPUT_ACK).lower()
+        run_id = response.run_id if hasattr(response, 'run_id') else None
+        
+        if tool_outputs and run_id and acknowledge != "none":
+            ack = acknowledge_tool_outputs(client, thread.thread_id, run_id, tool_outputs)
+            if acknowledge == "background":
+                task = asyncio.create_task(ack)
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+            else:
+                print(f"\nSubmitting tool results...")
+                await ack
     
     else:
         print(f"\n⚠ AI did not call any tools")
@@ -536,6 +694,39 @@ async def main(audio_path: str = None, diarization_json_path: str = None, transc
             print(f"\n🗑️  Cleaned up transcript JSON: {transcript_json_to_delete.name}")
         except Exception as e:
             print(f"\n⚠️  Could not delete transcript JSON: {e}")
+    
+    return extracted
+
+async def extract(**kwargs):
+    """Run main() and wait for its background acknowledgment; use this as the top-level coroutine."""
+    try:
+        return await main(**kwargs)
+    finally:
+        await drain_acknowledgments()
+
+async def extract_many(jobs: list, concurrency: int = 8, client=None) -> list:
+    """
+    Run several extractions interleaved on one event loop and one client.
+    
+    Args:
+        jobs: Keyword arguments for main(), one dict per call
+        concurrency: Maximum extractions in flight
+        client: Shared Backboard client (default: the one BACKBOARD_MODE selects)
+        
+    Returns:
+        main()'s result or the raised exception, per job
+    """
+    client = client or create_backboard_client(api_key=BACKBOARD_API_KEY)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(kwargs):
+        async with semaphore:
+            return await main(client=client, **kwargs)
+    
+    try:
+        return await asyncio.gather(*(run(kwargs) for kwargs in jobs), return_exceptions=True)
+    finally:
+        await drain_acknowledgments()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="FinSense AI - Structured Data Extraction Pipeline")
@@ -585,14 +776,16 @@ if __name__ == "__main__":
             
             print(f"\n🎯 Starting pipeline: transcript.py → Backboard AI...\n")
             
-            asyncio.run(main(
+            asyncio.run(extract(
                 audio_path=audio_path,
-                diarization_json_path=str(diarization_path)
+                diarization_json_path=str(diarization_path),
+                file_id=args.file_id,
+                file_metadata=file_metadata_from_doc(file_info)
             ))
         
         elif args.audio_path:
             # Direct path mode
-            asyncio.run(main(
+            asyncio.run(extract(
                 audio_path=args.audio_path,
                 diarization_json_path=args.diarization_path,
                 transcript_text=args.transcript_text
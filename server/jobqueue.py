@@ -0,0 +1,320 @@
+import datetime
+import logging
+from typing import Dict, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+JOBS_COLLECTION = "jobs"
+
+# Pipeline stages in execution order; a job records each one as it completes
+STAGES = ["preprocessed", "diarized", "transcribed", "extracted"]
+
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def backoff_seconds(attempts: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    """Exponential backoff before retry number ``attempts`` (1-based)."""
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+class JobQueue:
+    """
+    Durable pipeline job queue backed by the ``jobs`` collection.
+
+    Workers lease jobs with an atomic ``find_one_and_update``; a lease expires
+    unless it is renewed, so a job held by a crashed worker is picked up again
+    by the next one. Every write after leasing is fenced on the worker ID, so
+    a worker that lost its lease cannot overwrite the new owner's progress.
+
+    Job documents look like::
+
+        {fileId, status: queued|leased|done|dead, priority, attempts, leases,
+         lane: short|long, estimatedSeconds, availableAt, leasedBy,
+         leaseExpiresAt, deferrals, stages: {<stage>: {...}}, lastError,
+         reprocessedAt, createdAt, updatedAt}
+
+    ``lane`` and ``estimatedSeconds`` are filled in by the scheduler (see
+    ``annotate``) before a job can be leased from a lane.
+    """
+
+    def __init__(self, db, lease_seconds: int = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.collection = db[JOBS_COLLECTION]
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index([("fileId", ASCENDING)], unique=True)
+        self.collection.create_index([("status", ASCENDING), ("priority", DESCENDING), ("availableAt", ASCENDING)])
+        self.collection.create_index([
+            ("status", ASCENDING), ("lane", ASCENDING), ("priority", DESCENDING),
+            ("estimatedSeconds", ASCENDING), ("availableAt", ASCENDING)
+        ])
+        self.collection.create_index([("status", ASCENDING), ("leaseExpiresAt", ASCENDING)])
+
+    def enqueue(self, file_id: str, priority: int = 0, lane: Optional[str] = None,
+                estimated_seconds: Optional[float] = None) -> Optional[ObjectId]:
+        """
+        Queue a file for processing; a file already in the queue is left alone.
+
+        Returns:
+            The job ID, or None if the file already had a job
+        """
+        now = utcnow()
+        result = self.collection.update_one(
+            {"fileId": ObjectId(file_id)},
+            {"$setOnInsert": {
+                "fileId": ObjectId(file_id),
+                "status": "queued",
+                "priority": priority,
+                "lane": lane,
+                "estimatedSeconds": estimated_seconds,
+                "attempts": 0,
+                "leases": 0,
+                "availableAt": now,
+                "leasedBy": None,
+                "leaseExpiresAt": None,
+                "stages": {},
+                "lastError": None,
+                "createdAt": now,
+                "updatedAt": now
+            }},
+            upsert=True
+        )
+        return result.upserted_id
+
+    def unannotated(self, limit: int = 100):
+        """
+        Runnable jobs the scheduler has not estimated yet: queued ones, and
+        expired leases taken without a lane (by workers from before lanes),
+        which a worker leasing by lane would otherwise never pick up again.
+        """
+        return list(self.collection.find(
+            {"lane": None, "$or": [
+                {"status": "queued"},
+                {"status": "leased", "leaseExpiresAt": {"$lt": utcnow()}}
+            ]},
+            {"fileId": 1},
+            limit=limit
+        ))
+
+    def annotate(self, job_id, lane: str, estimated_seconds: float) -> None:
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"lane": lane, "estimatedSeconds": round(estimated_seconds, 1)}}
+        )
+
+    def lease(self, worker_id: str, lane: Optional[str] = None) -> Optional[Dict]:
+        """
+        Atomically claim the next runnable job, or return None if there is none.
+
+        Within the short lane the shortest job goes first; the long lane (and
+        unlaned leasing) is first-come first-served so no job waits forever.
+        """
+        now = utcnow()
+        runnable = {"$or": [
+            {"status": "queued", "availableAt": {"$lte": now}},
+            {"status": "leased", "leaseExpiresAt": {"$lt": now}}
+        ]}
+        if lane:
+            runnable["lane"] = lane
+        if lane == "short":
+            order = [("priority", DESCENDING), ("estimatedSeconds", ASCENDING), ("availableAt", ASCENDING)]
+        else:
+            order = [("priority", DESCENDING), ("availableAt", ASCENDING)]
+
+        return self.collection.find_one_and_update(
+            runnable,
+            {
+                "$set": {
+                    "status": "leased",
+                    "leasedBy": worker_id,
+                    "leaseExpiresAt": now + datetime.timedelta(seconds=self.lease_seconds),
+                    "updatedAt": now
+                },
+                "$inc": {"leases": 1}
+            },
+            sort=order,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _owned(self, job_id, worker_id: str) -> Dict:
+        return {"_id": job_id, "status": "leased", "leasedBy": worker_id}
+
+    def heartbeat(self, job_id, worker_id: str) -> bool:
+        """Extend the lease; False means this worker no longer owns the job."""
+        now = utcnow()
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {
+                "leaseExpiresAt": now + datetime.timedelta(seconds=self.lease_seconds),
+                "updatedAt": now
+            }}
+        )
+        return result.matched_count == 1
+
+    def complete_stage(self, job_id, worker_id: str, stage: str, artifacts: Optional[Dict] = None) -> bool:
+        """Record a finished stage (and renew the lease)."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        now = utcnow()
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {
+                f"stages.{stage}": {"completedAt": now, **(artifacts or {})},
+                "leaseExpiresAt": now + datetime.timedelta(seconds=self.lease_seconds),
+                "updatedAt": now
+            }}
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id, worker_id: str) -> bool:
+        now = utcnow()
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id),
+            {"$set": {
+                "status": "done",
+                "leasedBy": None,
+                "leaseExpiresAt": None,
+                "lastError": None,
+                "completedAt": now,
+                "updatedAt": now
+            }}
+        )
+        return result.matched_count == 1
+
+    def defer(self, job_id, worker_id: str, seconds: float, reason: str) -> bool:
+        """
+        Hand a job back to the queue for later without counting an attempt.
+
+        The lease it was taken with is not counted either, so waiting does not
+        bring the job closer to being dead-lettered by :meth:`reap`.
+        """
+        now = utcnow()
+        result = self.collection.update_one(
+            self._owned(job_id, worker_id),
+            {
+                "$set": {
+                    "status": "queued",
+                    "leasedBy": None,
+                    "leaseExpiresAt": None,
+                    "lastError": reason,
+                    "availableAt": now + datetime.timedelta(seconds=seconds),
+                    "updatedAt": now
+                },
+                "$inc": {"leases": -1, "deferrals": 1}
+            }
+        )
+        return result.matched_count == 1
+
+    def fail(self, job_id, worker_id: str, error: str) -> Optional[str]:
+        """
+        Record a failed attempt and schedule a retry with exponential backoff.
+
+        Returns:
+            The job's new status ("queued" or "dead"), or None if the lease was lost
+        """
+        job = self.collection.find_one(self._owned(job_id, worker_id), {"attempts": 1})
+        if not job:
+            return None
+
+        attempts = job.get("attempts", 0) + 1
+        now = utcnow()
+        dead = attempts >= self.max_attempts
+        update = {
+            "status": "dead" if dead else "queued",
+            "attempts": attempts,
+            "leasedBy": None,
+            "leaseExpiresAt": None,
+            "lastError": str(error)[:2000],
+            "updatedAt": now
+        }
+        if not dead:
+            update["availableAt"] = now + datetime.timedelta(seconds=backoff_seconds(attempts))
+
+        result = self.collection.update_one(self._owned(job_id, worker_id), {"$set": update})
+        if result.matched_count == 0:
+            return None
+        return update["status"]
+
+    def reap(self) -> int:
+        """
+        Dead-letter jobs whose leases keep expiring (workers crashing on them).
+
+        A job that has been leased more than ``max_attempts`` times without
+        finishing is poison: it would otherwise take down worker after worker.
+        """
+        now = utcnow()
+        result = self.collection.update_many(
+            {
+                "status": "leased",
+                "leaseExpiresAt": {"$lt": now},
+                "leases": {"$gte": self.max_attempts}
+            },
+            {"$set": {
+                "status": "dead",
+                "leasedBy": None,
+                "leaseExpiresAt": None,
+                "lastError": "Lease expired too many times (worker crash or hang)",
+                "updatedAt": now
+            }}
+        )
+        if result.modified_count:
+            logger.warning(f"Dead-lettered {result.modified_count} job(s) with repeatedly expired leases")
+        return result.modified_count
+
+    def count_runnable(self, lane: Optional[str] = None) -> int:
+        query = {"status": "queued", "availableAt": {"$lte": utcnow()}}
+        if lane:
+            query["lane"] = lane
+        return self.collection.count_documents(query)
+
+    def retry_dead(self, job_id) -> bool:
+        """Send a dead-lettered job back to the queue with a fresh attempt budget."""
+        now = utcnow()
+        result = self.collection.update_one(
+            {"_id": ObjectId(job_id), "status": "dead"},
+            {"$set": {"status": "queued", "attempts": 0, "leases": 0, "availableAt": now, "updatedAt": now}}
+        )
+        return result.matched_count == 1
+
+    def reprocess(self, file_id, from_stage: str = STAGES[-1]) -> Optional[Dict]:
+        """
+        Queue a finished (or dead-lettered) file again, running ``from_stage``
+        and every stage after it. Earlier stages keep their outputs; one that
+        was collected in the meantime is run again first (see
+        ``worker.plan_stages``). ``enqueue`` leaves a file that already has a
+        job alone, so this is the way to re-run one.
+
+        Returns:
+            The stage records dropped from the job (their outputs are no longer
+            referenced by it), or None if the file has no job or its job is
+            still queued or running
+        """
+        if from_stage not in STAGES:
+            raise ValueError(f"Unknown stage: {from_stage}")
+        dropped = STAGES[STAGES.index(from_stage):]
+        now = utcnow()
+        before = self.collection.find_one_and_update(
+            {"fileId": ObjectId(file_id), "status": {"$in": ["done", "dead"]}},
+            {
+                "$set": {"status": "queued", "attempts": 0, "leases": 0, "availableAt": now,
+                         "lastError": None, "reprocessedAt": now, "updatedAt": now},
+                "$unset": {"completedAt": "", **{f"stages.{stage}": "" for stage in dropped}}
+            },
+            projection={"stages": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None
+        return {stage: record for stage, record in (before.get("stages") or {}).items() if stage in dropped}
@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+"""
+Live-call analysis over a streaming audio socket.
+
+The rest of the pipeline runs after the call: an upload is preprocessed,
+diarized, transcribed and extracted as a whole. ``live.py serve`` takes
+the audio while the call is still going and answers with transcript
+turns and risk / intent signals as they are spoken:
+
+* preprocessing per chunk, with carried filter state: resampling to
+  16 kHz, the high-pass filter of audioprocess.py and the spectral gate
+  (the line's cached noise profile, or one measured on the first seconds
+  of the call);
+* a streaming VAD: the energy / ZCR / tonality test of vad.py against a
+  rolling noise floor. An utterance ends after ``ENDPOINT_MS`` of
+  silence; longer ones are cut every ``MAX_WINDOW`` seconds;
+* rolling diarization: stereo calls take the speaker from the channel, as
+  the channel-split diarizer does; on mono calls each utterance joins the
+  nearest running MFCC centroid, or starts a new speaker while fewer than
+  ``num_speakers`` have been heard;
+* Whisper on each utterance. A cut is decoded with ``LOOKAHEAD`` seconds
+  past it and only the words ending before the cut are committed; the
+  next window starts after the last committed word, so no word is split;
+* rule-based signals (legal threats, hardship, profanity) and a rolling
+  intent over the committed text.
+
+Events carry ``latency``: seconds from the arrival of the last audio they
+cover (the end of the utterance, or the cut) to the moment they are sent.
+
+Protocol, TCP, one call per connection: the client sends one JSON header
+line, e.g. ``{"callId": "...", "sampleRate": 8000, "channels": 1}`` (plus
+an optional ``lineId`` for the noise profile cache), then little-endian
+16-bit PCM, interleaved for stereo, and half-closes the connection when
+the call ends. The server answers with JSON lines: ``ready``, then
+``transcript``, ``signal`` and ``intent`` events, and ``end`` with the
+call's statistics.
+
+Examples:
+    python live.py serve --port 8765
+    python live.py replay ./files/call.wav --port 8765
+    python live.py replay ./files/call.wav --sr 8000 --stereo --speed 2
+"""
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vad import FRAME_MS, MARGIN_DB, MIN_ENERGY_DB, MAX_ZCR, MAX_TONALITY, PAD_MS, frame_features
+from denoise import GateStream, NoiseProfile, NoiseProfileCache, SpectralGate
+from stereo import CHANNEL_SPEAKERS
+
+logger = logging.getLogger(__name__)
+
+
+LIVE_HOST = os.getenv('LIVE_HOST', '127.0.0.1')
+LIVE_PORT = int(os.getenv('LIVE_PORT', '8765'))
+# Small models keep decoding well inside the latency budget on CPU
+LIVE_MODEL = os.getenv('LIVE_MODEL', 'tiny')
+SAMPLE_RATE = 16000
+HIGH_PASS_HZ = 50
+# Call audio measured for the noise profile when the line has none cached
+PROFILE_SECONDS = 3.0
+# Rolling window of frame energies for the VAD noise floor
+NOISE_FLOOR_SECONDS = 30.0
+ENDPOINT_MS = 500
+MAX_WINDOW = 4.0
+LOOKAHEAD = 1.0
+MIN_UTTERANCE = 0.3
+NEW_SPEAKER_DISTANCE = 0.35
+# Weight kept by earlier turns each time a new one is scored
+INTENT_DECAY = 0.7
+READ_BYTES = 1 << 16
+REPLAY_CHUNK_MS = 100
+
+SIGNAL_PATTERNS = {
+    "legal_threat": re.compile(
+        r"\b(lawyers?|advocate|sue|suing|court|legal (?:action|notice)|police|fir|rbi|ombudsman"
+        r"|consumer (?:forum|court)|complaint|harass\w*)\b", re.IGNORECASE),
+    "hardship": re.compile(
+        r"\b(lost (?:my|his|her|our) job|laid off|no (?:income|salary|job)|salary (?:not|delayed|late)"
+        r"|hospital\w*|medical|can'?t afford|cannot afford|unemployed|passed away)\b", re.IGNORECASE),
+    "profanity": re.compile(
+        r"\b(damn\w*|bloody|bastards?|shit\w*|fuck\w*|crap|idiots?|stupid|rubbish)\b", re.IGNORECASE),
+}
+# Labels match the intent enum of the extraction report (getStructuresData.py)
+INTENT_PATTERNS = {
+    "dispute": re.compile(r"\b(dispute|wrong charge|not my loan|never took|fraudulent|already paid)\b", re.IGNORECASE),
+    "refusal": re.compile(r"\b(won'?t pay|will not pay|not going to pay|refuse)\b", re.IGNORECASE),
+    "hardship": SIGNAL_PATTERNS["hardship"],
+    "settlement": re.compile(r"\b(settle\w*|one[- ]time|waive\w*)\b", re.IGNORECASE),
+    "payment_promise": re.compile(
+        r"\b(will pay|i'?ll pay|i will transfer|by tomorrow|promise|next week|i'?ll transfer)\b", re.IGNORECASE),
+}
+
+
+def pcm_to_float(pcm: bytes, channels: int) -> np.ndarray:
+    """(channels, samples) float32 array from interleaved little-endian 16-bit PCM."""
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    return samples.reshape(-1, channels).T
+
+
+def float_to_pcm(y: np.ndarray) -> bytes:
+    """Interleaved 16-bit PCM from a mono or (channels, samples) float signal."""
+    y = np.atleast_2d(np.asarray(y, dtype=np.float32))
+    return (np.clip(y.T, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class StreamResampler:
+    """
+    Resample chunks to ``sr_out`` by an integer factor with a carried FIR state.
+
+    Telephony rates (8, 16, 32, 48 kHz) are all integer multiples or
+    divisors of 16 kHz, which keeps this a single polyphase-free filter.
+    """
+
+    def __init__(self, sr_in: int, sr_out: int = SAMPLE_RATE, taps_per_factor: int = 16):
+        from scipy.signal import firwin
+
+        if sr_in <= 0 or (sr_out % sr_in and sr_in % sr_out):
+            raise ValueError(f"Unsupported sample rate {sr_in}: must be a multiple or divisor of {sr_out}")
+        self.up = max(1, sr_out // sr_in)
+        self.down = max(1, sr_in // sr_out)
+        self.taps = None
+        self.phase = 0
+        if self.up > 1 or self.down > 1:
+            factor = max(self.up, self.down)
+            self.taps = (firwin(taps_per_factor * factor + 1, 1.0 / factor) * self.up).astype(np.float32)
+            self.state = np.zeros(len(self.taps) - 1, dtype=np.float32)
+
+    def push(self, x: np.ndarray) -> np.ndarray:
+        if self.taps is None:
+            return np.asarray(x, dtype=np.float32)
+        from scipy.signal import lfilter
+
+        if self.up > 1:
+            stuffed = np.zeros(len(x) * self.up, dtype=np.float32)
+            stuffed[::self.up] = x
+            x = stuffed
+        y, self.state = lfilter(self.taps, 1.0, x, zi=self.state)
+        if self.down > 1:
+            y = y[self.phase::self.down]
+            self.phase = (self.phase - len(x)) % self.down
+        return y.astype(np.float32)
+
+
+class LivePreprocessor:
+    """
+    Chunk-by-chunk version of the preprocessing stage for one channel.
+
+    Until a noise profile exists, audio passes through ungated so the
+    first words are not held back; output stays sample-aligned with the
+    input either way.
+    """
+
+    def __init__(self, sr: int, profile: Optional[NoiseProfile] = None):
+        from scipy.signal import butter
+
+        self.resampler = StreamResampler(sr)
+        self.sos = butter(5, HIGH_PASS_HZ, 'hp', fs=SAMPLE_RATE, output='sos')
+        self.zi = np.zeros((self.sos.shape[0], 2))
+        self.gate = GateStream(SpectralGate(profile)) if profile is not None else None
+        self.measured = []
+        self.measured_samples = 0
+
+    def push(self, x: np.ndarray) -> np.ndarray:
+        from scipy.signal import sosfilt
+
+        y = self.resampler.push(x)
+        y, self.zi = sosfilt(self.sos, y, zi=self.zi)
+        y = y.astype(np.float32)
+        if self.gate is not None:
+            return self.gate.push(y)
+
+        self.measured.append(y)
+        self.measured_samples += len(y)
+        if self.measured_samples >= PROFILE_SECONDS * SAMPLE_RATE:
+            profile = NoiseProfile.estimate(np.concatenate(self.measured), SAMPLE_RATE)
+            self.measured = []
+            if profile is not None:
+                # Gated output starts where the ungated output stopped, so the timeline stays intact
+                self.gate = GateStream(SpectralGate(profile))
+        return y
+
+    def flush(self) -> np.ndarray:
+        return self.gate.flush() if self.gate is not None else np.zeros(0, dtype=np.float32)
+
+
+class ChannelStream:
+    """
+    Preprocessed audio, streaming VAD and open utterances of one channel.
+
+    Positions are absolute sample indices at 16 kHz from the start of the
+    call; ``audio`` holds only what open utterances may still need.
+    """
+
+    def __init__(self, sr: int, profile: Optional[NoiseProfile] = None, frame_ms: int = FRAME_MS):
+        self.pre = LivePreprocessor(sr, profile)
+        self.frame_length = int(SAMPLE_RATE * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.offset = 0
+        self.analysed = 0
+        self.energy = np.zeros(0, dtype=np.float32)
+        self.floor_frames = int(NOISE_FLOOR_SECONDS * 1000 / frame_ms)
+        self.pad = int(PAD_MS * SAMPLE_RATE / 1000)
+        self.endpoint = int(ENDPOINT_MS * SAMPLE_RATE / 1000)
+        # Each utterance: {"start", "end" (None while open), "speaker"}
+        self.utterances = []
+        self.last_speech = None
+
+    @property
+    def available(self) -> int:
+        return self.offset + len(self.audio)
+
+    def slice(self, start: int, end: int) -> np.ndarray:
+        return self.audio[max(0, start - self.offset):max(0, end - self.offset)]
+
+    def push(self, x: np.ndarray) -> None:
+        self.audio = np.concatenate((self.audio, self.pre.push(x)))
+        self._detect()
+
+    def finish(self) -> None:
+        self.audio = np.concatenate((self.audio, self.pre.flush()))
+        self._detect()
+        if self.utterances and self.utterances[-1]["end"] is None:
+            self.utterances[-1]["end"] = min(self.last_speech + self.pad, self.available)
+
+    def _detect(self) -> None:
+        n_frames = (self.available - self.analysed) // self.frame_length
+        if n_frames <= 0:
+            return
+        block = self.slice(self.analysed, self.analysed + n_frames * self.frame_length)
+        features = frame_features(block, SAMPLE_RATE, self.frame_ms)
+        self.energy = np.concatenate((self.energy, features["energy_db"]))[-self.floor_frames:]
+        threshold = max(np.percentile(self.energy, 10) + MARGIN_DB, MIN_ENERGY_DB)
+        speech = (
+            (features["energy_db"] > threshold)
+            & (features["zcr"] < MAX_ZCR)
+            & (features["tonality"] < MAX_TONALITY)
+        )
+
+        for i, is_speech in enumerate(speech):
+            frame_start = self.analysed + i * self.frame_length
+            frame_end = frame_start + self.frame_length
+            open_utterance = bool(self.utterances) and self.utterances[-1]["end"] is None
+            if is_speech:
+                if not open_utterance:
+                    self.utterances.append({"start": max(self.offset, frame_start - self.pad), "end": None,
+                                            "speaker": None})
+                self.last_speech = frame_end
+            elif open_utterance and frame_end - self.last_speech >= self.endpoint:
+                self.utterances[-1]["end"] = self.last_speech + self.pad
+        self.analysed += n_frames * self.frame_length
+        self._trim()
+
+    def _trim(self) -> None:
+        keep_from = self.utterances[0]["start"] if self.utterances else self.analysed - self.pad
+        drop = max(0, keep_from - self.offset)
+        if drop:
+            self.audio = self.audio[drop:]
+            self.offset += drop
+
+    def next_window(self) -> Optional[Tuple[Dict, int, int, bool]]:
+        """
+        The next stretch of the first utterance that is ready to decode.
+
+        Returns:
+            ``(utterance, start, end, final)``: a final window ends the
+            utterance; otherwise ``end`` is the cut plus ``LOOKAHEAD``
+        """
+        while self.utterances:
+            utterance = self.utterances[0]
+            start, end = utterance["start"], utterance["end"]
+            cut = int(MAX_WINDOW * SAMPLE_RATE)
+            lookahead = int(LOOKAHEAD * SAMPLE_RATE)
+            if end is not None and end - start <= cut + lookahead:
+                if end - start < MIN_UTTERANCE * SAMPLE_RATE:
+                    self.utterances.pop(0)
+                    continue
+                return utterance, start, end, True
+            if min(self.available, end or self.available) - start >= cut + lookahead:
+                return utterance, start, start + cut + lookahead, False
+            return None
+        return None
+
+    def commit(self, utterance: Dict, committed_to: Optional[int] = None) -> None:
+        """Close the decoded window: drop a finished utterance or move its start past the committed words."""
+        if committed_to is None:
+            self.utterances.remove(utterance)
+        else:
+            utterance["start"] = committed_to
+        self._trim()
+
+
+class OnlineSpeakers:
+    """
+    Rolling diarization for a mono stream.
+
+    Utterances are described by the mean and spread of their MFCCs,
+    standardised with statistics of the call so far. Each one joins the
+    nearest speaker centroid (cosine distance), or starts a new speaker
+    while fewer than ``num_speakers`` have been heard and none is within
+    ``new_speaker_distance``.
+    """
+
+    def __init__(self, num_speakers: int = 2, new_speaker_distance: float = NEW_SPEAKER_DISTANCE,
+                 n_mfcc: int = 20):
+        self.num_speakers = num_speakers
+        self.new_speaker_distance = new_speaker_distance
+        self.n_mfcc = n_mfcc
+        self.centroids = []
+        self.counts = []
+        self.frames = 0
+        self.sum = None
+        self.sumsq = None
+
+    def embed(self, y: np.ndarray) -> np.ndarray:
+        import librosa
+
+        mfcc = librosa.feature.mfcc(y=y, sr=SAMPLE_RATE, n_mfcc=self.n_mfcc, n_fft=400, hop_length=160)[1:].T
+        if self.sum is None:
+            self.sum = np.zeros(mfcc.shape[1])
+            self.sumsq = np.zeros(mfcc.shape[1])
+        self.frames += len(mfcc)
+        self.sum += mfcc.sum(axis=0)
+        self.sumsq += (mfcc ** 2).sum(axis=0)
+        mean = self.sum / self.frames
+        std = np.sqrt(np.maximum(self.sumsq / self.frames - mean ** 2, 0.0)) + 1e-8
+        z = (mfcc - mean) / std
+        embedding = np.concatenate((z.mean(axis=0), z.std(axis=0)))
+        return embedding / (np.linalg.norm(embedding) + 1e-12)
+
+    def assign(self, y: np.ndarray) -> str:
+        embedding = self.embed(y)
+        if self.centroids:
+            centroids = np.array(self.centroids)
+            distance = 1.0 - centroids @ embedding / (np.linalg.norm(centroids, axis=1) + 1e-12)
+            best = int(np.argmin(distance))
+        if not self.centroids or (len(self.centroids) < self.num_speakers
+                                  and distance[best] > self.new_speaker_distance):
+            self.centroids.append(embedding)
+            self.counts.append(1)
+            return f"SPEAKER_{len(self.centroids) - 1:02d}"
+
+        self.counts[best] += 1
+        self.centroids[best] = self.centroids[best] + (embedding - self.centroids[best]) / self.counts[best]
+        return f"SPEAKER_{best:02d}"
+
+
+class SignalTracker:
+    """Risk flags and the rolling intent over committed transcript text."""
+
+    def __init__(self, decay: float = INTENT_DECAY):
+        self.decay = decay
+        self.counts = {flag: 0 for flag in SIGNAL_PATTERNS}
+        self.scores = {intent: 0.0 for intent in INTENT_PATTERNS}
+        self.intent = None
+
+    def update(self, turn: Dict) -> List[Dict]:
+        events = []
+        for flag, pattern in SIGNAL_PATTERNS.items():
+            for match in pattern.finditer(turn["text"]):
+                self.counts[flag] += 1
+                events.append({"type": "signal", "flag": flag, "match": match.group(0),
+                               "count": self.counts[flag], **_turn_fields(turn)})
+
+        for intent, pattern in INTENT_PATTERNS.items():
+            self.scores[intent] = self.scores[intent] * self.decay + len(pattern.findall(turn["text"]))
+        intent, score = max(self.scores.items(), key=lambda item: item[1])
+        if score > 0 and intent != self.intent:
+            self.intent = intent
+            events.append({"type": "intent", "intent": intent, "score": round(score, 2), **_turn_fields(turn)})
+        return events
+
+
+def _turn_fields(turn: Dict) -> Dict:
+    return {key: turn[key] for key in ("callId", "speaker", "start", "end", "text", "latency") if key in turn}
+
+
+def whisper_decoder(model_name: str = LIVE_MODEL) -> Callable[[np.ndarray, bool], Dict]:
+    """Decode function over a shared Whisper model, loaded on first use."""
+    from transcript import ModelCache, decode_audio
+
+    models = ModelCache()
+    return lambda audio, word_timestamps: decode_audio(audio, models[model_name], word_timestamps)
+
+
+def warm_up(decode: Callable[[np.ndarray, bool], Dict]) -> None:
+    """Load the model and the lazily imported libraries before the first call instead of during it."""
+    from transcript import post_process_transcription
+
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    decode(silence, False)
+    OnlineSpeakers().embed(silence)
+    post_process_transcription("")
+
+
+class LiveSession:
+    """
+    One live call: feed it PCM as it arrives, get events back.
+
+    ``decode(audio, word_timestamps)`` returns a Whisper-style result.
+    Not thread-safe; the server runs each call's work in one executor
+    thread at a time.
+    """
+
+    def __init__(self, header: Dict, decode: Callable[[np.ndarray, bool], Dict],
+                 profile_cache: Optional[NoiseProfileCache] = None, num_speakers: int = 2):
+        self.call_id = str(header.get("callId") or f"live-{int(time.time() * 1000)}")
+        self.sr = int(header.get("sampleRate", 8000))
+        self.n_channels = int(header.get("channels", 1))
+        if self.n_channels not in (1, 2):
+            raise ValueError("channels must be 1 (mixed) or 2 (agent/customer split)")
+
+        profiles = [None] * self.n_channels
+        line_id = header.get("lineId")
+        if line_id and profile_cache is not None:
+            ids = [line_id] if self.n_channels == 1 else [f"{line_id}-ch{i}" for i in range(self.n_channels)]
+            profiles = [
+                profile if profile is not None and profile.compatible(SAMPLE_RATE) else None
+                for profile in (profile_cache.get(i) for i in ids)
+            ]
+        self.channels = [ChannelStream(self.sr, profile) for profile in profiles]
+        self.speakers = OnlineSpeakers(num_speakers) if self.n_channels == 1 else None
+        self.signals = SignalTracker()
+        self.decode = decode
+
+        self.remainder = b""
+        self.received = 0
+        # Call time (s) at the end of each received chunk, and when it arrived
+        self.arrival_times = []
+        self.arrivals = []
+        self.latencies = []
+        self.turns = 0
+
+    def _arrival(self, sample: int) -> float:
+        i = bisect.bisect_left(self.arrival_times, sample / SAMPLE_RATE)
+        return self.arrivals[min(i, len(self.arrivals) - 1)]
+
+    def feed(self, chunks: List[Tuple[bytes, float]]) -> List[Dict]:
+        """Process ``(pcm, arrival monotonic time)`` chunks in order; returns the events they complete."""
+        frame_bytes = 2 * self.n_channels
+        for pcm, arrival in chunks:
+            pcm = self.remainder + pcm
+            usable = len(pcm) - len(pcm) % frame_bytes
+            self.remainder = pcm[usable:]
+            if not usable:
+                continue
+            samples = pcm_to_float(pcm[:usable], self.n_channels)
+            self.received += samples.shape[1]
+            self.arrival_times.append(self.received / self.sr)
+            self.arrivals.append(arrival)
+            for channel, y in zip(self.channels, samples):
+                channel.push(y)
+        return self._drain()
+
+    def finish(self) -> List[Dict]:
+        """Flush the end of the call."""
+        if not self.arrivals:
+            return []
+        for channel in self.channels:
+            channel.finish()
+        return self._drain()
+
+    def _drain(self) -> List[Dict]:
+        events = []
+        progress = True
+        while progress:
+            progress = False
+            # Decode the earliest ready window across channels so turns come out in call order
+            ready = [(window, index) for index, channel in enumerate(self.channels)
+                     if (window := channel.next_window()) is not None]
+            if ready:
+                window, index = min(ready, key=lambda item: item[0][1])
+                events.extend(self._decode_window(index, *window))
+                progress = True
+        return events
+
+    def _decode_window(self, index: int, utterance: Dict, start: int, end: int, final: bool) -> List[Dict]:
+        from transcript import post_process_transcription, words_from_result
+
+        channel = self.channels[index]
+        audio = channel.slice(start, end)
+        if utterance["speaker"] is None:
+            utterance["speaker"] = CHANNEL_SPEAKERS[index] if self.speakers is None else self.speakers.assign(audio)
+
+        result = self.decode(audio, not final)
+        if final:
+            text, covered_to = result.get("text", ""), end
+            channel.commit(utterance)
+        else:
+            cut = start + int(MAX_WINDOW * SAMPLE_RATE)
+            words = [word for word in words_from_result(result) if start + word["end"] * SAMPLE_RATE <= cut]
+            text = "".join(word["word"] for word in words)
+            # Resume after the last committed word; with none, at the cut
+            covered_to = start + int(words[-1]["end"] * SAMPLE_RATE) if words else cut
+            channel.commit(utterance, max(covered_to, start + 1))
+
+        text = post_process_transcription(text)
+        if not text:
+            return []
+        latency = round(time.monotonic() - self._arrival(covered_to), 3)
+        self.latencies.append(latency)
+        self.turns += 1
+        turn = {
+            "type": "transcript",
+            "callId": self.call_id,
+            "speaker": utterance["speaker"],
+            "start": round(start / SAMPLE_RATE, 2),
+            "end": round(covered_to / SAMPLE_RATE, 2),
+            "text": text,
+            "final": final,
+            "latency": latency,
+        }
+        if self.speakers is None:
+            turn["channel"] = index
+        return [turn] + self.signals.update(turn)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "callId": self.call_id,
+            "audioSeconds": round(self.received / self.sr, 2),
+            "turns": self.turns,
+            "signals": self.signals.counts,
+            "intent": self.signals.intent,
+            "latencyP50": latencies[len(latencies) // 2] if latencies else None,
+            "latencyMax": latencies[-1] if latencies else None,
+        }
+
+
+async def _send(writer, event: Dict) -> None:
+    writer.write((json.dumps(event) + "\n").encode("utf-8"))
+    await writer.drain()
+
+
+async def serve(host: str = LIVE_HOST, port: int = LIVE_PORT, model_name: str = LIVE_MODEL,
+                num_speakers: int = 2, workers: int = 1) -> None:
+    """
+    Accept live calls until cancelled.
+
+    Socket reads stay on the event loop; preprocessing and decoding run in
+    ``workers`` threads, so a call whose decoding falls behind catches up
+    on everything received meanwhile in one pass.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="live")
+    loop = asyncio.get_running_loop()
+    decode = whisper_decoder(model_name)
+    await loop.run_in_executor(executor, warm_up, decode)
+    profile_cache = NoiseProfileCache()
+
+    async def handle(reader, writer):
+        peer = writer.get_extra_info("peername")
+        try:
+            header = json.loads(await reader.readline())
+            session = LiveSession(header, decode, profile_cache, num_speakers)
+        except (ValueError, TypeError, AttributeError) as e:
+            await _send(writer, {"type": "error", "message": f"Bad header: {e}"})
+            writer.close()
+            return
+        logger.info(f"Live call {session.call_id} from {peer}: {session.sr} Hz, {session.n_channels} channel(s)")
+        await _send(writer, {"type": "ready", "callId": session.call_id})
+
+        inbox = asyncio.Queue()
+
+        async def receive():
+            try:
+                while chunk := await reader.read(READ_BYTES):
+                    inbox.put_nowait((chunk, time.monotonic()))
+            finally:
+                inbox.put_nowait(None)
+
+        receiving = asyncio.create_task(receive())
+        try:
+            ended = False
+            while not ended:
+                batch = [await inbox.get()]
+                while not inbox.empty():
+                    batch.append(inbox.get_nowait())
+                if batch[-1] is None:
+                    ended = True
+                    batch.pop()
+                events = await loop.run_in_executor(executor, session.feed, batch)
+                if ended:
+                    events += await loop.run_in_executor(executor, session.finish)
+                for event in events:
+                    await _send(writer, event)
+            await _send(writer, {"type": "end", **session.stats()})
+            logger.info(f"Live call {session.call_id} ended: {session.stats()}")
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Live call {session.call_id} dropped: {e}")
+        finally:
+            receiving.cancel()
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Live analysis listening on {host}:{port} (model {model_name})")
+    async with server:
+        await server.serve_forever()
+
+
+async def replay(path: str, host: str = LIVE_HOST, port: int = LIVE_PORT, sr: int = 8000, stereo: bool = False,
+                 speed: float = 1.0, chunk_ms: int = REPLAY_CHUNK_MS, call_id: Optional[str] = None,
+                 on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Stream a recording to the server at ``speed`` x real time, as a dialer would.
+
+    Returns:
+        The server's ``end`` statistics plus ``endToEnd``: seconds from
+        sending the end of each transcript turn to receiving it
+    """
+    import librosa
+
+    y, _ = librosa.load(path, sr=sr, mono=not stereo)
+    if stereo and y.ndim != 2:
+        raise ValueError(f"{path} is not a stereo recording")
+    pcm = float_to_pcm(y)
+    frame_bytes = 2 * (2 if stereo else 1)
+    chunk_bytes = int(sr * chunk_ms / 1000) * frame_bytes
+
+    reader, writer = await asyncio.open_connection(host, port)
+    header = {"callId": call_id or os.path.basename(path), "sampleRate": sr, "channels": 2 if stereo else 1}
+    await _send(writer, header)
+    started = time.monotonic()
+    end_to_end = []
+
+    async def send():
+        for offset in range(0, len(pcm), chunk_bytes):
+            due = started + offset / frame_bytes / sr / speed
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            writer.write(pcm[offset:offset + chunk_bytes])
+            await writer.drain()
+        writer.write_eof()
+
+    sending = asyncio.create_task(send())
+    result = {}
+    try:
+        while line := await reader.readline():
+            event = json.loads(line)
+            if event["type"] == "transcript":
+                end_to_end.append(time.monotonic() - (started + event["end"] / speed))
+            if on_event:
+                on_event(event)
+            if event["type"] in ("end", "error"):
+                result = event
+                break
+        if result.get("type") == "end":
+            await sending
+    finally:
+        sending.cancel()
+        writer.close()
+
+    end_to_end.sort()
+    result["endToEnd"] = {
+        "p50": round(end_to_end[len(end_to_end) // 2], 3) if end_to_end else None,
+        "p95": round(end_to_end[int(0.95 * (len(end_to_end) - 1))], 3) if end_to_end else None,
+    }
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live-call analysis over a streaming audio socket")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", help="Accept live calls")
+    serve_parser.add_argument("--host", default=LIVE_HOST)
+    serve_parser.add_argument("--port", type=int, default=LIVE_PORT)
+    serve_parser.add_argument("--model", default=LIVE_MODEL, help="Whisper model size")
+    serve_parser.add_argument("--num-speakers", type=int, default=2)
+    serve_parser.add_argument("--workers", type=int, default=1, help="Threads for preprocessing and decoding")
+
+    replay_parser = sub.add_parser("replay", help="Stream a recording to the server as a live call")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--host", default=LIVE_HOST)
+    replay_parser.add_argument("--port", type=int, default=LIVE_PORT)
+    replay_parser.add_argument("--sr", type=int, default=8000, help="Sample rate to send")
+    replay_parser.add_argument("--stereo", action="store_true", help="Send both channels (agent/customer split)")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Multiple of real time")
+    replay_parser.add_argument("--chunk-ms", type=int, default=REPLAY_CHUNK_MS)
+    replay_parser.add_argument("--call-id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        if args.command == "serve":
+            asyncio.run(serve(args.host, args.port, args.model, args.num_speakers, args.workers))
+        else:
+            summary = asyncio.run(replay(
+                args.path, args.host, args.port, args.sr, args.stereo, args.speed, args.chunk_ms, args.call_id,
+                on_event=lambda event: print(json.dumps(event), flush=True)
+            ))
+            print(json.dumps(summary, indent=2))
+            sys.exit(0 if summary.get("type") == "end" else 1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,187 @@
+import time
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Whisper sizes in increasing cost, with decode cost relative to tiny
+MODEL_COST = {
+    "tiny": 1.0,
+    "base": 2.0,
+    "small": 6.0,
+    "medium": 18.0,
+    "large": 36.0,
+}
+
+FIRST_PASS_MODEL = "tiny"
+ESCALATION_MODEL = "small"
+
+# Whisper's own fallback thresholds: below this mean log-probability or above
+# this compression ratio (repetition loops) a decode is treated as unreliable
+MIN_AVG_LOGPROB = -1.0
+MAX_COMPRESSION_RATIO = 2.4
+# Segments Whisper itself thinks are silence are not worth a second pass
+MAX_NO_SPEECH_PROB = 0.6
+
+# Assumed tiny decode speed (seconds per audio second) before any timing exists
+DEFAULT_FIRST_PASS_RATE = 0.1
+
+
+def decode_stats(result: Dict) -> Dict:
+    """
+    Duration-weighted confidence of one Whisper decode.
+
+    Returns:
+        Dict with avg_logprob, the worst compression_ratio and no_speech_prob,
+        or an empty dict if the decode produced no segments
+    """
+    segments = result.get("segments") or []
+    if not segments:
+        return {}
+
+    weights = [max(seg["end"] - seg["start"], 1e-3) for seg in segments]
+    total = sum(weights)
+    return {
+        "avg_logprob": sum(w * seg["avg_logprob"] for w, seg in zip(weights, segments)) / total,
+        "compression_ratio": max(seg["compression_ratio"] for seg in segments),
+        "no_speech_prob": sum(w * seg["no_speech_prob"] for w, seg in zip(weights, segments)) / total,
+    }
+
+
+class ModelPolicy:
+    """
+    Pick the Whisper model size per segment instead of one size for the call.
+
+    Every segment is decoded with ``first_model`` first. It is decoded again
+    with ``escalation_model`` only when the first pass looks unreliable (low
+    mean log-probability or a high compression ratio) and, if a deadline is
+    set, only when the extra decode still fits in it. Clean segments never
+    pay for the large model.
+
+    Every escalation decision, taken or not, is kept in ``decisions``.
+
+    Args:
+        first_model: Model for the first pass
+        escalation_model: Model for segments that fail the quality checks
+        min_avg_logprob: Escalate below this mean log-probability
+        max_compression_ratio: Escalate above this compression ratio
+        deadline_seconds: Wall-clock budget for the whole transcription (None for no limit)
+        sla_factor: Budget as a multiple of the audio length; replaces deadline_seconds on ``start``
+    """
+
+    def __init__(
+        self,
+        first_model: str = FIRST_PASS_MODEL,
+        escalation_model: str = ESCALATION_MODEL,
+        min_avg_logprob: float = MIN_AVG_LOGPROB,
+        max_compression_ratio: float = MAX_COMPRESSION_RATIO,
+        max_no_speech_prob: float = MAX_NO_SPEECH_PROB,
+        deadline_seconds: Optional[float] = None,
+        sla_factor: Optional[float] = None
+    ):
+        if first_model not in MODEL_COST or escalation_model not in MODEL_COST:
+            raise ValueError(f"Unknown model size; expected one of {list(MODEL_COST)}")
+        self.first_model = first_model
+        self.escalation_model = escalation_model
+        self.min_avg_logprob = min_avg_logprob
+        self.max_compression_ratio = max_compression_ratio
+        self.max_no_speech_prob = max_no_speech_prob
+        self.deadline_seconds = deadline_seconds
+        self.sla_factor = sla_factor
+
+        self.decisions: List[Dict] = []
+        self._started = time.monotonic()
+        self._audio_total = 0.0
+        self._audio_done = 0.0
+        self._first_pass_seconds = 0.0
+
+    def start(self, audio_seconds: float) -> None:
+        """Reset the clock for a transcription of ``audio_seconds`` of audio."""
+        self._started = time.monotonic()
+        self._audio_total = audio_seconds
+        self._audio_done = 0.0
+        self._first_pass_seconds = 0.0
+        self.decisions = []
+        if self.sla_factor:
+            self.deadline_seconds = audio_seconds * self.sla_factor
+
+    def first_pass_done(self, audio_seconds: float, elapsed: float) -> None:
+        """Record how long a first-pass decode took, to price escalations."""
+        self._audio_done += audio_seconds
+        self._first_pass_seconds += elapsed
+
+    @property
+    def first_pass_rate(self) -> float:
+        if self._audio_done <= 0:
+            return DEFAULT_FIRST_PASS_RATE
+        return self._first_pass_seconds / self._audio_done
+
+    def escalation_cost(self, audio_seconds: float) -> float:
+        ratio = MODEL_COST[self.escalation_model] / MODEL_COST[self.first_model]
+        return audio_seconds * self.first_pass_rate * ratio
+
+    def quality_reason(self, stats: Dict) -> Optional[str]:
+        """Why a first-pass decode needs a second look, or None if it is fine."""
+        if not stats or stats["no_speech_prob"] > self.max_no_speech_prob:
+            return None
+        if stats["avg_logprob"] < self.min_avg_logprob:
+            return "low_logprob"
+        if stats["compression_ratio"] > self.max_compression_ratio:
+            return "high_compression"
+        return None
+
+    def should_escalate(self, stats: Dict, start: float, end: float, speaker: Optional[str] = None) -> bool:
+        """
+        Decide whether to re-decode a segment with the escalation model.
+
+        Args:
+            stats: ``decode_stats`` of the first pass
+            start, end: Segment bounds on the call timeline (seconds)
+            speaker: Speaker label, recorded with the decision
+
+        Returns:
+            True if the segment should be decoded again
+        """
+        if self.escalation_model == self.first_model:
+            return False
+
+        reason = self.quality_reason(stats)
+        if reason is None:
+            return False
+
+        escalate = True
+        cost = self.escalation_cost(end - start)
+        if self.deadline_seconds is not None:
+            # Leave room for the first pass over the audio not decoded yet
+            elapsed = time.monotonic() - self._started
+            remaining = max(0.0, self._audio_total - self._audio_done) * self.first_pass_rate
+            if elapsed + remaining + cost > self.deadline_seconds:
+                escalate = False
+                reason += "+over_deadline"
+
+        self.decisions.append({
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "speaker": speaker,
+            "from": self.first_model,
+            "to": self.escalation_model if escalate else self.first_model,
+            "escalated": escalate,
+            "reason": reason,
+            "avgLogprob": round(stats["avg_logprob"], 3),
+            "compressionRatio": round(stats["compression_ratio"], 3),
+            "estimatedCostSeconds": round(cost, 2)
+        })
+        return escalate
+
+    def summary(self) -> Dict:
+        escalated = [d for d in self.decisions if d["escalated"]]
+        return {
+            "firstModel": self.first_model,
+            "escalationModel": self.escalation_model,
+            "deadlineSeconds": self.deadline_seconds,
+            "flagged": len(self.decisions),
+            "escalated": len(escalated),
+            "escalatedSeconds": round(sum(d["end"] - d["start"] for d in escalated), 1),
+            "elapsedSeconds": round(time.monotonic() - self._started, 1)
+        }
@@ -0,0 +1,30 @@
+import mongoose from 'mongoose'
+
+// One document per upload day, maintained with $inc by the upload/delete
+// routes and the Python extraction stage (server/rollups.py)
+const dailyStatsSchema = new mongoose.Schema({
+    _id: {
+        type: String  // YYYY-MM-DD (UTC)
+    },
+    calls: { type: Number, default: 0 },
+    extractedCalls: { type: Number, default: 0 },
+    totalDuration: { type: Number, default: 0 },
+    totalSize: { type: Number, default: 0 },
+    satisfiedCalls: { type: Number, default: 0 },
+    dissatisfiedCalls: { type: Number, default: 0 },
+    neutralCalls: { type: Number, default: 0 },
+    fraudsDetected: { type: Number, default: 0 },
+    riskFlags: { type: Number, default: 0 }
+}, {
+    collection: 'dailystats'
+})
+
+export const STAT_COUNTERS = [
+    'calls', 'extractedCalls', 'totalDuration', 'totalSize',
+    'satisfiedCalls', 'dissatisfiedCalls', 'neutralCalls',
+    'fraudsDetected', 'riskFlags'
+]
+
+const DailyStats = mongoose.model('DailyStats', dailyStatsSchema)
+
+export default DailyStats
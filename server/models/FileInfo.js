@@ -6,10 +6,31 @@ const fileInfoSchema = new mongoose.Schema({
         required: true,
         trim: true
     },
+    // Machine the upload landed on; its worker puts the file into the artifact store
+    uploadHost: {
+        type: String,
+        required: false
+    },
+    // The upload in the content-addressed artifact store (server/artifacts.py): { key, size }
+    source: {
+        type: mongoose.Schema.Types.Mixed,
+        required: false
+    },
     voiceID: {
         type: String,
         required: false,
     },
+    // Voiceprint lookup at diarization (server/voiceindex.py); fraud is the customer's flag:
+    // { voiceID, customer, fraud, speakers: { SPEAKER_xx: { voiceId, similarity, known, fraud, calls } } }
+    voiceMatch: {
+        type: mongoose.Schema.Types.Mixed,
+        required: false
+    },
+    // Trunk or dialer the call came in on; keys the cached noise profile (server/denoise.py)
+    lineId: {
+        type: String,
+        required: false
+    },
     keyDetails: {
         type: mongoose.Schema.Types.Mixed,
         required: false
@@ -21,6 +42,52 @@ const fileInfoSchema = new mongoose.Schema({
     summary: {
         type: String,
         required: false,
+    },
+    // Written incrementally by the Python pipeline while a call is transcribed
+    status: {
+        type: String,
+        required: false,
+    },
+    progress: {
+        type: Number,
+        default: 0
+    },
+    partialTranscript: {
+        type: [mongoose.Schema.Types.Mixed],
+        default: undefined
+    },
+    // Why the worker gave up on the call (status 'failed'), or why it is still
+    // waiting for the upload to reach the artifact store (status 'waiting_for_upload')
+    processingError: {
+        type: String,
+        required: false
+    },
+    // Why streaming transcription stopped (status 'transcription_failed')
+    progressError: {
+        type: String,
+        required: false
+    },
+    // Set by the extraction stage; drives the incremental analytics export
+    extractedAt: {
+        type: Date,
+        required: false
+    },
+    // Set when the upload was a copy of an earlier call and took over its results
+    // instead of being processed ({ fileId, match: 'exact' | 'near', similarity })
+    duplicateOf: {
+        type: mongoose.Schema.Types.Mixed,
+        required: false
+    },
+    // Set when the upload resembles an earlier call too loosely to take over its
+    // results; it is processed as usual ({ fileId, match: 'possible', similarity })
+    possibleDuplicateOf: {
+        type: mongoose.Schema.Types.Mixed,
+        required: false
+    },
+    // Counters this call currently contributes to DailyStats ({ day, counters })
+    statsContribution: {
+        type: mongoose.Schema.Types.Mixed,
+        required: false
     }
 }, {
     collection: 'fileinfos'  // Explicitly set collection name
@@ -0,0 +1,78 @@
+import mongoose from 'mongoose'
+
+// Pipeline job consumed by server/worker.py (see server/jobqueue.py for the lifecycle)
+const jobSchema = new mongoose.Schema({
+    fileId: {
+        type: mongoose.Schema.Types.ObjectId,
+        ref: 'FileInfo',
+        required: true,
+        unique: true
+    },
+    status: {
+        type: String,
+        enum: ['queued', 'leased', 'done', 'dead'],
+        default: 'queued'
+    },
+    priority: {
+        type: Number,
+        default: 0
+    },
+    // Filled in by the worker's scheduler from the upload's size/duration
+    lane: {
+        type: String,
+        enum: ['short', 'long', null],
+        default: null
+    },
+    estimatedSeconds: {
+        type: Number,
+        default: null
+    },
+    // Whisper model override chosen by admission control under load
+    modelName: {
+        type: String,
+        default: null
+    },
+    attempts: {
+        type: Number,
+        default: 0
+    },
+    leases: {
+        type: Number,
+        default: 0
+    },
+    availableAt: {
+        type: Date,
+        default: Date.now
+    },
+    leasedBy: {
+        type: String,
+        default: null
+    },
+    leaseExpiresAt: {
+        type: Date,
+        default: null
+    },
+    stages: {
+        type: mongoose.Schema.Types.Mixed,
+        default: {}
+    },
+    lastError: {
+        type: String,
+        default: null
+    },
+    createdAt: {
+        type: Date,
+        default: Date.now
+    },
+    updatedAt: {
+        type: Date,
+        default: Date.now
+    }
+}, {
+    collection: 'jobs',
+    minimize: false
+})
+
+const Job = mongoose.model('Job', jobSchema)
+
+export default Job
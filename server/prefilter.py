@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Local pre-extraction that runs before the Backboard call.
+
+Two jobs:
+
+- Relevance gate: rules over the corrected transcript, backed by a small
+  TF-IDF + logistic-regression model, decide whether a call is obviously
+  irrelevant (greetings only, dead air, wrong number). Those calls get a
+  locally built ``intent='irrelevant'`` report and never reach the LLM.
+- Field pre-fill: amounts (including k/lakh/crore forms), payment rails
+  and payment dates are pulled out with regexes and fill fields the LLM
+  left empty.
+
+The model is optional; without it only the rules decide, and they only
+short-circuit calls that are clearly irrelevant. It is trained from calls
+the LLM already labelled.
+
+Examples:
+    python prefilter.py train          # fit the model from stored calls
+    python prefilter.py stats          # LLM calls saved so far
+    python prefilter.py check "[SPEAKER_00]: hello? hello? [SPEAKER_01]: wrong number"
+"""
+import os
+import re
+import json
+import argparse
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_PATH = Path(os.getenv('PREFILTER_MODEL_PATH', Path(__file__).resolve().parent / 'prefilter_model.json'))
+STATUS_COLLECTION = "pipelinestatus"
+STATUS_ID = "prefilter"
+
+# Calls with fewer words than this and no finance terms are greetings or dead air
+SHORT_CALL_WORDS = 40
+# Longer calls without finance terms are only skipped if the model is this sure
+IRRELEVANT_PROBABILITY = 0.1
+
+MAX_FEATURES = 5000
+MIN_DF = 2
+
+SPEAKER_TAG = re.compile(r'\[[^\]]*\]:')
+TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+FINANCE_TERMS = re.compile(
+    r'\b(pay|pays|paid|paying|payment|payments|emi|emis|loan|loans|amount|due|dues|overdue|outstanding|'
+    r'balance|rupees?|rs|inr|lakhs?|lacs?|crores?|upi|neft|rtgs|imps|nach|ecs|cheques?|cash|bank|'
+    r'account|settle|settlement|instal?lments?|interest|penalty|fees?|charges?|debt|credit|card|dispute|'
+    r'refund|transfer|deposit|foreclosure|foreclose|moratorium|defaulter|default|collection|recovery|'
+    r'salary|money|bounce|bounced|auto.?debit|kyc|nbfc)\b',
+    re.IGNORECASE
+)
+WRONG_NUMBER = re.compile(
+    r"\b(wrong number|no one (?:by|of) that name|nobody (?:by|of) that name|"
+    r"(?:doesn't|does not|don't|do not) (?:live|stay|work) here|not (?:his|her|their) number|"
+    r"you have the wrong)\b",
+    re.IGNORECASE
+)
+
+MULTIPLIERS = {
+    "k": 1e3, "thousand": 1e3,
+    "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5,
+    "crore": 1e7, "crores": 1e7, "cr": 1e7,
+}
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40,
+    "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+# A spoken or written number: "25,000", "12k", "twenty five thousand", "one point five lakhs",
+# "two lakh fifty thousand"; "and" / "point" only between terms
+_DIGITS = r'\d[\d,]*(?:\.\d+)?'
+_NUMBER_TERM = (r'(?:' + _DIGITS + r'|(?:' + '|'.join(sorted([*NUMBER_WORDS, *MULTIPLIERS, "hundred"], key=len, reverse=True))
+                + r')\b)')
+NUMBER_PHRASE = re.compile(
+    r'\b' + _NUMBER_TERM + r'(?:(?:[\s-]+|(?<=\d))(?:(?:and|point)[\s-]+)?' + _NUMBER_TERM + r')*',
+    re.IGNORECASE
+)
+NUMBER_TOKEN = re.compile(_DIGITS + r'|[a-z]+', re.IGNORECASE)
+CURRENCY_BEFORE = re.compile(r'(?:₹|\brs\.?|\binr)\s*$', re.IGNORECASE)
+CURRENCY_AFTER = re.compile(r'\s*(?:rupees?|rs\b|inr\b)', re.IGNORECASE)
+# "point five lakh" with the whole part lost: the phrase after "point" is not the amount
+DANGLING_POINT = re.compile(r'\bpoint[\s-]*$', re.IGNORECASE)
+
+PAYMENT_METHODS = [
+    ("UPI", re.compile(r'\b(upi|gpay|google pay|phonepe|paytm|bhim)\b', re.IGNORECASE)),
+    ("NEFT", re.compile(r'\bneft\b', re.IGNORECASE)),
+    ("RTGS", re.compile(r'\brtgs\b', re.IGNORECASE)),
+    ("IMPS", re.compile(r'\bimps\b', re.IGNORECASE)),
+    ("NACH", re.compile(r'\b(nach|ecs|auto.?debit|mandate)\b', re.IGNORECASE)),
+    ("CHEQUE", re.compile(r'\bcheques?\b', re.IGNORECASE)),
+    ("CASH", re.compile(r'\bcash\b', re.IGNORECASE)),
+]
+
+_MONTHS = r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)'
+_WEEKDAYS = r'(monday|tuesday|wednesday|thursday|friday|saturday|sunday)'
+PAYMENT_DATE = re.compile(
+    r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+    r'|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?' + _MONTHS +
+    r'|' + _MONTHS + r'\s+\d{1,2}(?:st|nd|rd|th)?'
+    r'|day after tomorrow|tomorrow|today|tonight'
+    r'|(?:this|next|coming)\s+(?:week|month|' + _WEEKDAYS + r')'
+    r'|(?:by|on)\s+' + _WEEKDAYS +
+    r'|end of (?:the |this |next )?month'
+    r'|(?:by|on|before) the \d{1,2}(?:st|nd|rd|th)(?:\s+of\s+' + _MONTHS + r')?)\b',
+    re.IGNORECASE
+)
+
+
+def plain_text(transcript_text: str) -> str:
+    """Drop ``[SPEAKER_xx]:`` tags from a combined transcript."""
+    return SPEAKER_TAG.sub(' ', transcript_text or '')
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def parse_number_phrase(phrase: str) -> Optional[float]:
+    """
+    Value of a whole number phrase, or None when it does not read as one number.
+
+    Handles compounds ("twenty five thousand" = 25000), Indian scales
+    ("two lakh fifty thousand" = 250000), spoken decimals ("one point five
+    lakhs" = 150000) and digits mixed with scale words ("1.5 lakh", "12k").
+    Runs such as "five twenty" or "2000 3000" are ambiguous and give None.
+    """
+    total, current = 0.0, None      # completed scale groups; the group being read
+    last_unit = None                # smallest part added to ``current``, to reject "five twenty"
+    top_scale = None                # largest scale applied so far
+    fraction = None                 # digits read after "point"
+    seen_number = False             # a bare "k" or "lakh" is not an amount
+    for token in NUMBER_TOKEN.findall(phrase.lower()):
+        if token == "and":
+            continue
+        if token == "point":
+            if current is None or fraction is not None or current != int(current):
+                return None
+            fraction = ""
+            continue
+        if fraction is not None and token not in MULTIPLIERS:
+            digit = NUMBER_WORDS.get(token, token)
+            if not str(digit).isdigit():
+                return None
+            fraction += str(digit)
+            continue
+        if fraction:
+            current, fraction = current + float(f"0.{fraction}"), None
+        elif fraction == "":
+            return None
+
+        if token == "hundred":
+            current = (current or 1) * 100
+            last_unit = 100
+        elif token in MULTIPLIERS:
+            scale = MULTIPLIERS[token]
+            if top_scale is not None and scale > top_scale:
+                total, top_scale = (total + (current or 0)) * scale, scale
+            else:
+                if top_scale is not None and current is None:
+                    return None
+                total += (current or 1) * scale
+                top_scale = scale if top_scale is None else top_scale
+            current, last_unit = None, None
+        else:
+            value = float(NUMBER_WORDS[token]) if token in NUMBER_WORDS else float(token.replace(',', ''))
+            if last_unit is not None and value >= last_unit:
+                return None
+            current = (current or 0) + value
+            seen_number = True
+            # Only a unit may follow twenty..ninety; nothing but a scale follows a unit, teen or digits
+            last_unit = 10 if token in NUMBER_WORDS and value >= 20 else 0
+    if fraction == "":
+        return None
+    if fraction:
+        current = (current or 0) + float(f"0.{fraction}")
+    if not seen_number:
+        return None
+    return total + (current or 0)
+
+
+def extract_amounts(text: str) -> List[float]:
+    """
+    Rupee amounts in the order they are mentioned (``12k``, ``1.5 lakh``, ``Rs 5,000``,
+    ``2000 rupees``, ``twenty five thousand``). A number counts as an amount when it has a
+    thousand/lakh/crore scale or a currency next to it; phrases that do not parse as one
+    number are skipped rather than guessed.
+    """
+    found = []
+    for match in NUMBER_PHRASE.finditer(text):
+        phrase = match.group(0)
+        if DANGLING_POINT.search(text[max(0, match.start() - 8):match.start()]):
+            continue
+        scaled = any(token in MULTIPLIERS for token in NUMBER_TOKEN.findall(phrase.lower()))
+        currency = CURRENCY_BEFORE.search(text[max(0, match.start() - 6):match.start()]) \
+            or CURRENCY_AFTER.match(text, match.end())
+        if not (scaled or currency):
+            continue
+        value = parse_number_phrase(phrase)
+        if value is not None:
+            found.append((match.start(), value))
+    return [round(value, 2) for _, value in found]
+
+
+def extract_payment_methods(text: str) -> List[str]:
+    return [method for method, pattern in PAYMENT_METHODS if pattern.search(text)]
+
+
+def extract_payment_dates(text: str) -> List[str]:
+    return [match.group(0) for match in PAYMENT_DATE.finditer(text)]
+
+
+def prefill_fields(text: str) -> Dict:
+    """
+    Report fields recoverable by regex.
+
+    Follows the extraction prompt: the last amount mentioned is taken as the
+    agreed one, and a payment method is only filled when exactly one rail
+    is mentioned.
+    """
+    fields = {}
+    amounts = extract_amounts(text)
+    if amounts:
+        fields["amount"] = amounts[-1]
+    methods = extract_payment_methods(text)
+    if len(methods) == 1:
+        fields["payment_method"] = methods[0]
+    dates = extract_payment_dates(text)
+    if dates:
+        fields["payment_date"] = dates[-1]
+    return fields
+
+
+class RelevanceModel:
+    """
+    TF-IDF (unigrams + bigrams) and L2-regularized logistic regression,
+    small enough to store as JSON and score in well under a millisecond.
+    """
+
+    def __init__(self, vocabulary: Optional[Dict[str, int]] = None, idf: Optional[np.ndarray] = None,
+                 weights: Optional[np.ndarray] = None, bias: float = 0.0):
+        self.vocabulary = vocabulary or {}
+        self.idf = idf if idf is not None else np.zeros(0)
+        self.weights = weights if weights is not None else np.zeros(0)
+        self.bias = bias
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        tokens = tokenize(plain_text(text))
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def transform(self, texts: Iterable[str]) -> "scipy.sparse.csr_matrix":
+        from scipy import sparse
+
+        rows, cols, values = [], [], []
+        n = 0
+        for n, text in enumerate(texts, 1):
+            counts = Counter(f for f in self.features(text) if f in self.vocabulary)
+            for feature, count in counts.items():
+                rows.append(n - 1)
+                cols.append(self.vocabulary[feature])
+                values.append(float(count))
+        matrix = sparse.csr_matrix((values, (rows, cols)), shape=(n, len(self.vocabulary)))
+        matrix = matrix.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ matrix
+
+    def fit(self, texts: List[str], labels: List[int], l2: float = 1e-3,
+            epochs: int = 300, learning_rate: float = 0.5) -> "RelevanceModel":
+        """Fit on ``labels`` (1 = relevant) with full-batch gradient descent."""
+        df = Counter()
+        for text in texts:
+            df.update(set(self.features(text)))
+        kept = [f for f, count in df.most_common(MAX_FEATURES) if count >= MIN_DF]
+        self.vocabulary = {feature: i for i, feature in enumerate(sorted(kept))}
+        n = len(texts)
+        self.idf = np.array(
+            [np.log((1 + n) / (1 + df[f])) + 1 for f in sorted(kept)], dtype=np.float64
+        )
+
+        X = self.transform(texts)
+        y = np.asarray(labels, dtype=np.float64)
+        self.weights = np.zeros(X.shape[1])
+        self.bias = float(np.log((y.mean() + 1e-6) / (1 - y.mean() + 1e-6)))
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(X @ self.weights + self.bias)))
+            error = p - y
+            self.weights -= learning_rate * (X.T @ error / n + l2 * self.weights)
+            self.bias -= learning_rate * float(error.mean())
+        return self
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        """Probability each text is a relevant (actionable) call."""
+        if not self.vocabulary:
+            return np.full(len(texts), 0.5)
+        return 1.0 / (1.0 + np.exp(-(self.transform(texts) @ self.weights + self.bias)))
+
+    def save(self, path: Path = MODEL_PATH) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "vocabulary": self.vocabulary,
+                "idf": self.idf.round(6).tolist(),
+                "weights": self.weights.round(6).tolist(),
+                "bias": self.bias
+            }, f)
+
+    @classmethod
+    def load(cls, path: Path = MODEL_PATH) -> Optional["RelevanceModel"]:
+        if not Path(path).exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["vocabulary"], np.array(data["idf"]), np.array(data["weights"]), data["bias"])
+
+
+_model_cache = {}
+
+
+def default_model() -> Optional[RelevanceModel]:
+    if MODEL_PATH not in _model_cache:
+        _model_cache[MODEL_PATH] = RelevanceModel.load(MODEL_PATH)
+    return _model_cache[MODEL_PATH]
+
+
+def analyze(transcript_text: str, model: Optional[RelevanceModel] = None) -> Dict:
+    """
+    Decide whether a call needs the LLM and pre-extract what regexes can.
+
+    Args:
+        transcript_text: Combined ``[SPEAKER]: text`` transcript
+        model: Relevance model (defaults to the trained one, if any)
+
+    Returns:
+        Dict with ``skip_llm`` (True only for obviously irrelevant calls),
+        ``reason``, ``probability`` (model score, or None) and ``fields``
+    """
+    text = plain_text(transcript_text)
+    words = tokenize(text)
+    fields = prefill_fields(text)
+    model = model if model is not None else default_model()
+    result = {"skip_llm": False, "reason": "finance_terms", "probability": None, "fields": fields}
+
+    if FINANCE_TERMS.search(text) or fields.get("amount"):
+        return result
+
+    if not words:
+        result.update(skip_llm=True, reason="empty")
+    elif WRONG_NUMBER.search(text):
+        result.update(skip_llm=True, reason="wrong_number")
+    elif len(words) < SHORT_CALL_WORDS:
+        result.update(skip_llm=True, reason="no_finance_terms_short")
+    elif model is not None:
+        probability = float(model.predict_proba([transcript_text])[0])
+        result["probability"] = round(probability, 4)
+        if probability < IRRELEVANT_PROBABILITY:
+            result.update(skip_llm=True, reason="model")
+        else:
+            result["reason"] = "model_uncertain"
+    else:
+        result["reason"] = "no_model"
+    return result
+
+
+def local_report(analysis: Dict, file_metadata: Optional[Dict] = None) -> Dict:
+    """A ``submit_clean_report``-shaped report for a call the LLM is skipped for."""
+    reasons = {
+        "empty": "No speech was transcribed",
+        "wrong_number": "The call reached a wrong number",
+        "no_finance_terms_short": "Short call with greetings only and no financial discussion",
+        "model": "No financial discussion detected",
+    }
+    summary = reasons.get(analysis["reason"], "No financial discussion detected") + "."
+    metadata = file_metadata or {}
+    return {
+        "clean_text": summary,
+        "summary": summary + " No action required.",
+        "intent": "irrelevant",
+        "payment_method": "NOT_SPECIFIED",
+        "risk_flag": False,
+        "sentiment": "neutral",
+        "satisfaction": "neutral",
+        "mood": "calm",
+        "fraud": False,
+        "file_name": metadata.get("file_name", ""),
+        "file_address": metadata.get("file_address", ""),
+        "org_file_name": metadata.get("org_file_name", ""),
+        "mimetype": metadata.get("mimetype", ""),
+    }
+
+
+def fill_missing(report: Dict, fields: Dict) -> List[str]:
+    """Fill report fields the LLM omitted with pre-extracted values; returns the names filled."""
+    filled = []
+    for key, value in fields.items():
+        current = report.get(key)
+        if current in (None, "", 0) or (key == "payment_method" and current == "NOT_SPECIFIED"):
+            report[key] = value
+            filled.append(key)
+    return filled
+
+
+def record_outcome(status_collection, skipped: bool, filled: int = 0) -> None:
+    """Count calls seen, LLM calls saved and fields filled locally."""
+    status_collection.update_one(
+        {"_id": STATUS_ID},
+        {"$inc": {"calls": 1, "llmCallsSaved": int(skipped), "fieldsFilled": filled}},
+        upsert=True
+    )
+
+
+def training_data(files) -> Tuple[List[str], List[int]]:
+    """Transcripts and LLM relevance labels of calls that were already extracted."""
+    texts, labels = [], []
+    for doc in files.find(
+        {"keyDetails.intent": {"$exists": True}, "partialTranscript.0": {"$exists": True}},
+        {"keyDetails.intent": 1, "partialTranscript": 1}
+    ):
+        text = " ".join(
+            f"[{seg.get('speaker', 'Unknown')}]: {seg.get('text', '')}"
+            for seg in doc["partialTranscript"] if seg.get('text')
+        )
+        texts.append(text)
+        labels.append(int(doc["keyDetails"]["intent"] != "irrelevant"))
+    return texts, labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local relevance gate and field pre-extraction")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("train", help="Fit the relevance model from calls the LLM already labelled")
+    sub.add_parser("stats", help="Show how many LLM calls the pre-filter saved")
+    check_parser = sub.add_parser("check", help="Analyze one transcript")
+    check_parser.add_argument("text", help="Combined transcript text")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "check":
+        print(json.dumps(analyze(args.text), indent=2))
+    else:
+        from pymongo import MongoClient
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+        try:
+            db = client["finsense-ai"]
+            if args.command == "train":
+                texts, labels = training_data(db["fileinfos"])
+                if len(set(labels)) < 2:
+                    raise SystemExit("Need both relevant and irrelevant labelled calls to train")
+                model = RelevanceModel().fit(texts, labels)
+                model.save(MODEL_PATH)
+                accuracy = float(((model.predict_proba(texts) >= 0.5) == np.array(labels)).mean())
+                logger.info(f"Trained on {len(texts)} calls ({sum(labels)} relevant), "
+                            f"training accuracy {accuracy:.3f}, saved to {MODEL_PATH}")
+            else:
+                status = db[STATUS_COLLECTION].find_one({"_id": STATUS_ID}) or {}
+                calls = status.get("calls", 0)
+                saved = status.get("llmCallsSaved", 0)
+                print(json.dumps({
+                    "calls": calls,
+                    "llmCallsSaved": saved,
+                    "savedFraction": round(saved / calls, 4) if calls else 0.0,
+                    "fieldsFilled": status.get("fieldsFilled", 0)
+                }, indent=2))
+        finally:
+            client.close()
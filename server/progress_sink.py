@@ -0,0 +1,95 @@
+import time
+import logging
+from typing import Dict, List
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+
+class MongoProgressSink:
+    """
+    Push partial transcripts and progress into a ``fileinfos`` document.
+
+    Segments are buffered and written in one ``$push``/``$set`` update once
+    ``max_batch`` segments have accumulated or ``min_interval`` seconds have
+    passed, so a call with hundreds of turns costs a handful of writes.
+    """
+
+    def __init__(self, collection, file_id: str, min_interval: float = 2.0, max_batch: int = 20):
+        self.collection = collection
+        self.file_id = ObjectId(file_id)
+        self.min_interval = min_interval
+        self.max_batch = max_batch
+        self.pending: List[Dict] = []
+        self.progress = 0.0
+        self.last_flush = 0.0
+        self.writes = 0
+
+        self.collection.update_one(
+            {"_id": self.file_id},
+            {"$set": {"partialTranscript": [], "progress": 0, "status": "transcribing"},
+             "$unset": {"progressError": ""}}
+        )
+
+    def push(self, segment: Dict, progress: float) -> None:
+        """Buffer one finished segment; flushes when the throttle allows."""
+        self.pending.append(segment)
+        self.progress = progress
+
+        if len(self.pending) >= self.max_batch or time.monotonic() - self.last_flush >= self.min_interval:
+            self.flush()
+
+    # Lets the sink be passed straight as an ``on_segment`` callback
+    __call__ = push
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        try:
+            self.collection.update_one(
+                {"_id": self.file_id},
+                {
+                    "$push": {"partialTranscript": {"$each": self.pending}},
+                    "$set": {"progress": round(100 * self.progress, 1)}
+                }
+            )
+            self.writes += 1
+        except Exception as e:
+            # Progress is best effort; the final results are written separately
+            logger.warning(f"Could not write partial transcript: {e}")
+            return
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def close(self, status: str = "transcribed") -> None:
+        """Flush what is left and mark transcription as finished."""
+        self.progress = 1.0
+        self.flush()
+        self.collection.update_one(
+            {"_id": self.file_id},
+            {"$set": {"progress": 100, "status": status}}
+        )
+        logger.info(f"Partial transcript streamed in {self.writes} write(s)")
+
+    def abort(self, error: str, status: str = "transcription_failed") -> None:
+        """Drop the half-written partial transcript and record why transcription stopped."""
+        self.pending = []
+        try:
+            self.collection.update_one(
+                {"_id": self.file_id},
+                {"$set": {"status": status, "progressError": str(error)[:2000]},
+                 "$unset": {"partialTranscript": ""}}
+            )
+        except Exception as e:
+            logger.warning(f"Could not record aborted transcription: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort(repr(exc))
+        return False
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Retention policy for pipeline intermediates.
+
+Once a job is done its report is in Mongo, and the cleaned audio,
+diarization and transcript it went through are only needed if the call is
+processed again. Each of these outputs is kept for a number of days after
+the job completes (``RETAIN_*_DAYS``) and then deleted from the artifact
+store. The job keeps the key with ``collectedAt`` set, and a later re-run
+(``worker.py --reprocess``) that needs the output runs its stage, and the
+ones after it, again (see ``worker.plan_stages``).
+The upload itself is never collected.
+
+A blob is content-addressed and can be shared between jobs, so it is only
+deleted once no job that still keeps it refers to it. Outputs the older
+standalone scripts wrote next to uploads (``<upload>_cleaned.wav``,
+``_cleaned_diarization.*``, ``_cleaned_transcript.*``) are swept by the
+same policy once the call has been extracted.
+
+Every run reports the objects, files and bytes it reclaimed.
+
+Examples:
+    python retention.py run               # collect what the policy allows
+    python retention.py run --dry-run     # report what would be collected
+    python retention.py status            # bytes held per stage
+"""
+import os
+import json
+import glob
+import datetime
+import argparse
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING
+
+from jobqueue import JOBS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+
+# Days after a job completes that each stage's output is kept
+RETENTION_DAYS = {
+    "preprocessed": float(os.getenv('RETAIN_CLEANED_DAYS', '1')),
+    "diarized": float(os.getenv('RETAIN_DIARIZATION_DAYS', '7')),
+    "transcribed": float(os.getenv('RETAIN_TRANSCRIPT_DAYS', '7')),
+}
+# How often the worker supervisor runs the policy; 0 disables it
+RETENTION_INTERVAL_MINUTES = float(os.getenv('RETENTION_INTERVAL_MINUTES', '60'))
+RETENTION_BATCH = 500
+# Standalone-script outputs next to an upload, most specific suffix first
+LEGACY_OUTPUTS = [
+    ("_cleaned_diarization", "diarized"),
+    ("_cleaned_voiceprints", "diarized"),
+    ("_cleaned_transcript", "transcribed"),
+    ("_cleaned", "preprocessed"),
+]
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _aware(value: datetime.datetime) -> datetime.datetime:
+    # Mongo hands back naive UTC datetimes
+    return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+
+
+class RetentionPolicy:
+    """Which stage outputs of a finished job may be collected, and when."""
+
+    def __init__(self, days: Optional[Dict[str, float]] = None):
+        self.days = dict(RETENTION_DAYS, **(days or {}))
+
+    def cutoff(self, stage: str, now: datetime.datetime) -> datetime.datetime:
+        """Jobs completed before this may lose the stage's output."""
+        return now - datetime.timedelta(days=self.days[stage])
+
+    def collectable(self, job: Dict, now: datetime.datetime) -> List[str]:
+        if job.get("status") != "done" or not job.get("completedAt"):
+            return []
+        completed = _aware(job["completedAt"])
+        return [
+            stage for stage in self.days
+            if (job.get("stages") or {}).get(stage, {}).get("key")
+            and not job["stages"][stage].get("collectedAt")
+            and completed <= self.cutoff(stage, now)
+        ]
+
+
+def stage_keys(artifacts: Dict) -> List[str]:
+    """Blobs a stage wrote: its output, plus the voiceprints for diarization."""
+    return [key for key in (artifacts.get("key"), artifacts.get("voiceprints")) if key]
+
+
+class GarbageCollector:
+    """Apply a :class:`RetentionPolicy` to the ``jobs`` collection and the artifact store."""
+
+    def __init__(self, db, store, policy: Optional[RetentionPolicy] = None):
+        self.jobs = db[JOBS_COLLECTION]
+        self.files = db["fileinfos"]
+        self.store = store
+        self.policy = policy or RetentionPolicy()
+
+    def ensure_indexes(self) -> None:
+        self.jobs.create_index([("status", ASCENDING), ("completedAt", ASCENDING)])
+        for stage in self.policy.days:
+            self.jobs.create_index(f"stages.{stage}.key", sparse=True)
+        self.files.create_index("source.key", sparse=True)
+
+    def _due(self, now: datetime.datetime, limit: int) -> List[Dict]:
+        return list(self.jobs.find(
+            {"status": "done", "$or": [
+                {f"stages.{stage}.key": {"$exists": True}, f"stages.{stage}.collectedAt": None,
+                 "completedAt": {"$lte": self.policy.cutoff(stage, now)}}
+                for stage in self.policy.days
+            ]},
+            {"stages": 1, "status": 1, "completedAt": 1},
+            limit=limit
+        ))
+
+    def _referenced(self, key: str, releasing) -> bool:
+        """Whether a job outside this run still keeps ``key``, or it is an upload."""
+        if self.files.find_one({"source.key": key}, {"_id": 1}):
+            return True
+        for stage in self.policy.days:
+            for field in ("key", "voiceprints"):
+                holders = self.jobs.find({f"stages.{stage}.{field}": key,
+                                          f"stages.{stage}.collectedAt": None}, {"_id": 1})
+                if any((holder["_id"], stage) not in releasing for holder in holders):
+                    return True
+        return False
+
+    def collect(self, dry_run: bool = False, limit: int = RETENTION_BATCH,
+                now: Optional[datetime.datetime] = None) -> Dict:
+        """
+        Delete the outputs the policy allows and mark them collected on their jobs.
+
+        Returns:
+            Report with the jobs touched and the objects, files and bytes reclaimed, per stage
+        """
+        now = now or utcnow()
+        jobs = self._due(now, limit)
+        plan = [(job, stage) for job in jobs for stage in self.policy.collectable(job, now)]
+        releasing = {(job["_id"], stage) for job, stage in plan}
+
+        report = {"dryRun": dry_run, "jobs": len(jobs), "objects": 0, "bytes": 0, "files": 0, "fileBytes": 0,
+                  "stages": {stage: {"objects": 0, "bytes": 0} for stage in self.policy.days}}
+        seen = set()
+        for job, stage in plan:
+            freed = 0
+            for key in stage_keys(job["stages"][stage]):
+                if key in seen or self._referenced(key, releasing):
+                    continue
+                seen.add(key)
+                if not self.store.exists(key):
+                    continue
+                size = self.store.size(key)
+                if not dry_run:
+                    self.store.delete(key)
+                freed += size
+                report["objects"] += 1
+                report["stages"][stage]["objects"] += 1
+            report["stages"][stage]["bytes"] += freed
+            report["bytes"] += freed
+            if not dry_run:
+                self.jobs.update_one({"_id": job["_id"]}, {"$set": {
+                    f"stages.{stage}.collectedAt": now,
+                    f"stages.{stage}.collectedBytes": freed
+                }})
+
+        swept = self.sweep_upload_dirs(dry_run=dry_run, limit=limit, now=now)
+        report["files"], report["fileBytes"] = swept["files"], swept["bytes"]
+        for stage, freed in swept["stages"].items():
+            report["stages"][stage]["bytes"] += freed
+
+        logger.info(f"Retention {'would reclaim' if dry_run else 'reclaimed'} "
+                    f"{(report['bytes'] + report['fileBytes']) / (1 << 20):.1f} MB: "
+                    f"{report['objects']} stored object(s) from {len(plan)} stage output(s), "
+                    f"{report['files']} file(s) next to uploads")
+        return report
+
+    def release(self, keys) -> Dict:
+        """
+        Delete blobs a job has stopped referring to (the outputs ``JobQueue.reprocess``
+        dropped), unless another job or an upload still holds them.
+
+        Returns:
+            Objects and bytes reclaimed
+        """
+        report = {"objects": 0, "bytes": 0}
+        for key in set(keys):
+            if self._referenced(key, set()) or not self.store.exists(key):
+                continue
+            report["bytes"] += self.store.size(key)
+            self.store.delete(key)
+            report["objects"] += 1
+        return report
+
+    def sweep_upload_dirs(self, dry_run: bool = False, limit: int = RETENTION_BATCH,
+                          now: Optional[datetime.datetime] = None) -> Dict:
+        """Delete standalone-script outputs next to extracted uploads once their retention has passed."""
+        now = now or utcnow()
+        # Uploads extracted before ``any_due`` have something to sweep; before ``all_due``, everything
+        cutoffs = [self.policy.cutoff(stage, now) for stage in self.policy.days]
+        any_due, all_due = max(cutoffs), min(cutoffs)
+        swept = {"files": 0, "bytes": 0, "stages": {stage: 0 for stage in self.policy.days}}
+
+        pending = self.files.find(
+            {"extractedAt": {"$lte": any_due}, "intermediatesSweptAt": None, "fileAddress": {"$exists": True}},
+            {"fileAddress": 1, "extractedAt": 1}, sort=[("extractedAt", ASCENDING)], limit=limit
+        )
+        for file_doc in pending:
+            extracted = _aware(file_doc["extractedAt"])
+            stem = os.path.splitext(file_doc["fileAddress"])[0]
+            for path in glob.glob(f"{glob.escape(stem)}_cleaned*"):
+                name = os.path.basename(path)[len(os.path.basename(stem)):]
+                stage = next(stage for suffix, stage in LEGACY_OUTPUTS if name.startswith(suffix))
+                if extracted > self.policy.cutoff(stage, now):
+                    continue
+                size = os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+                swept["files"] += 1
+                swept["bytes"] += size
+                swept["stages"][stage] += size
+            if not dry_run and extracted <= all_due:
+                self.files.update_one({"_id": file_doc["_id"]}, {"$set": {"intermediatesSweptAt": now}})
+        return swept
+
+    def status(self) -> Dict:
+        """Stored outputs per stage: held (not yet collected) and collected so far."""
+        totals = {}
+        for stage in self.policy.days:
+            held = self.jobs.aggregate([
+                {"$match": {f"stages.{stage}.key": {"$exists": True}}},
+                {"$group": {
+                    "_id": {"$cond": [{"$ifNull": [f"$stages.{stage}.collectedAt", False]}, "collected", "held"]},
+                    "outputs": {"$sum": 1},
+                    "bytes": {"$sum": {"$ifNull": [f"$stages.{stage}.size", 0]}}
+                }}
+            ])
+            totals[stage] = {row["_id"]: {"outputs": row["outputs"], "bytes": row["bytes"]} for row in held}
+            totals[stage]["retentionDays"] = self.policy.days[stage]
+        return totals
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+    from artifacts import open_store
+
+    parser = argparse.ArgumentParser(description="Retention for pipeline intermediates")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Collect what the policy allows and report reclaimed bytes")
+    run_parser.add_argument("--dry-run", action="store_true")
+    run_parser.add_argument("--limit", type=int, default=RETENTION_BATCH, help="Jobs and uploads per run")
+    sub.add_parser("status", help="Stored bytes per stage")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    try:
+        collector = GarbageCollector(client["finsense-ai"], open_store())
+        if args.command == "run":
+            collector.ensure_indexes()
+            print(json.dumps(collector.collect(dry_run=args.dry_run, limit=args.limit), indent=2))
+        else:
+            print(json.dumps(collector.status(), indent=2))
+    finally:
+        client.close()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Per-day dashboard statistics, maintained incrementally.
+
+Each call contributes a fixed set of counters to the ``dailystats`` document
+for the day it was uploaded. The contribution currently applied is stored on
+the call itself (``statsContribution``), so re-extracting or deleting a call
+moves the rollup by exactly the difference with atomic ``$inc`` updates and
+the dashboard only has to sum one document per day.
+
+The upload route adds ``calls``/``totalSize`` when a file arrives, the
+extraction stage refreshes the rest, and the delete route subtracts
+whatever the call last contributed.
+
+Examples:
+    python rollups.py               # print totals from the rollups
+    python rollups.py --rebuild     # recompute everything from fileinfos
+"""
+import os
+import argparse
+import datetime
+import json
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+STATS_COLLECTION = "dailystats"
+MAX_REFRESH_ATTEMPTS = 5
+
+SATISFIED_VALUES = ["satisfied", "positive", "yes"]
+DISSATISFIED_VALUES = ["dissatisfied", "very_dissatisfied", "negative", "no"]
+NEUTRAL_VALUES = ["neutral"]
+TRUE_VALUES = ["yes", "true", "1"]
+
+COUNTERS = [
+    "calls", "extractedCalls", "totalDuration", "totalSize",
+    "satisfiedCalls", "dissatisfiedCalls", "neutralCalls",
+    "fraudsDetected", "riskFlags",
+]
+
+
+def day_of(created_at) -> str:
+    if created_at is None:
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+    return created_at.strftime("%Y-%m-%d")
+
+
+def _number(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _flag(value) -> int:
+    return int(str(value).lower() in TRUE_VALUES) if value is not None else 0
+
+
+def contribution(file_doc: Dict) -> Dict:
+    """
+    Counters one call adds to its day. Must match ``_contribution_expression``.
+
+    Returns:
+        Dict with the call's ``day`` and its ``counters``
+    """
+    details = file_doc.get("keyDetails") or {}
+    satisfaction = str(details.get("satisfaction") or "").lower()
+    return {
+        "day": day_of(file_doc.get("createdAt")),
+        "counters": {
+            "calls": 1,
+            "extractedCalls": int(bool(details.get("intent"))),
+            "totalDuration": _number(details.get("duration")),
+            "totalSize": _number(details.get("size")),
+            "satisfiedCalls": int(satisfaction in SATISFIED_VALUES),
+            "dissatisfiedCalls": int(satisfaction in DISSATISFIED_VALUES),
+            "neutralCalls": int(satisfaction in NEUTRAL_VALUES),
+            "fraudsDetected": _flag(details.get("fraud")),
+            "riskFlags": _flag(details.get("risk_flag")),
+        }
+    }
+
+
+def _contribution_expression() -> Dict:
+    """The same counters as ``contribution``, as an aggregation expression."""
+    def number(field):
+        return {"$convert": {"input": f"$keyDetails.{field}", "to": "double", "onError": 0, "onNull": 0}}
+
+    def lower(field):
+        return {"$toLower": {"$toString": {"$ifNull": [f"$keyDetails.{field}", ""]}}}
+
+    def one_if_in(field, values):
+        return {"$cond": [{"$in": [lower(field), values]}, 1, 0]}
+
+    return {
+        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$ifNull": ["$createdAt", "$$NOW"]}}},
+        "counters": {
+            "calls": {"$literal": 1},
+            "extractedCalls": {"$cond": [{"$gt": [{"$ifNull": ["$keyDetails.intent", ""]}, ""]}, 1, 0]},
+            "totalDuration": number("duration"),
+            "totalSize": number("size"),
+            "satisfiedCalls": one_if_in("satisfaction", SATISFIED_VALUES),
+            "dissatisfiedCalls": one_if_in("satisfaction", DISSATISFIED_VALUES),
+            "neutralCalls": one_if_in("satisfaction", NEUTRAL_VALUES),
+            "fraudsDetected": one_if_in("fraud", TRUE_VALUES),
+            "riskFlags": one_if_in("risk_flag", TRUE_VALUES),
+        }
+    }
+
+
+def _apply(stats, day: str, counters: Dict, sign: int = 1) -> None:
+    inc = {key: sign * value for key, value in counters.items() if value}
+    if inc:
+        stats.update_one({"_id": day}, {"$inc": inc}, upsert=True)
+
+
+def refresh_call_stats(files, stats, file_filter: Dict) -> Optional[Dict]:
+    """
+    Bring one call's contribution to the rollups up to date after its
+    extracted fields changed.
+
+    The stored contribution is swapped with a compare-and-set, so two
+    concurrent refreshes of the same call cannot both apply their delta.
+
+    Returns:
+        The contribution now applied, or None if the call does not exist
+    """
+    for _ in range(MAX_REFRESH_ATTEMPTS):
+        doc = files.find_one(file_filter, {"createdAt": 1, "keyDetails": 1, "statsContribution": 1})
+        if doc is None:
+            return None
+
+        old = doc.get("statsContribution")
+        new = contribution(doc)
+        if old == new:
+            return new
+
+        swapped = files.update_one(
+            {"_id": doc["_id"], "statsContribution": old},
+            {"$set": {"statsContribution": new}}
+        )
+        if swapped.matched_count == 0:
+            continue
+
+        if old:
+            _apply(stats, old["day"], old["counters"], sign=-1)
+        _apply(stats, new["day"], new["counters"])
+        return new
+
+    logger.warning(f"Gave up refreshing rollups for {file_filter} after concurrent updates")
+    return None
+
+
+def rebuild(files, stats) -> int:
+    """
+    Recompute every call's contribution and all daily rollups from scratch.
+
+    Run while no extraction is writing, e.g. after deploying or if the
+    rollups have drifted.
+
+    Returns:
+        Number of days written
+    """
+    files.update_many({}, [{"$set": {"statsContribution": _contribution_expression()}}])
+
+    group = {"_id": "$statsContribution.day"}
+    for key in COUNTERS:
+        group[key] = {"$sum": f"$statsContribution.counters.{key}"}
+    files.aggregate([{"$group": group}, {"$out": stats.name}])
+    return stats.count_documents({})
+
+
+def totals(stats, start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+    """Sum the daily rollups, optionally over an inclusive YYYY-MM-DD range."""
+    match = {}
+    if start:
+        match.setdefault("_id", {})["$gte"] = start
+    if end:
+        match.setdefault("_id", {})["$lte"] = end
+
+    group = {"_id": None, "days": {"$sum": 1}}
+    for key in COUNTERS:
+        group[key] = {"$sum": f"${key}"}
+    rows = list(stats.aggregate([{"$match": match}, {"$group": group}]))
+    result = rows[0] if rows else {key: 0 for key in COUNTERS + ["days"]}
+    result.pop("_id", None)
+    return result
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+    parser = argparse.ArgumentParser(description="Maintain the per-day dashboard statistics")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all rollups from fileinfos")
+    parser.add_argument("--from", dest="start", help="First day (YYYY-MM-DD) to include in totals")
+    parser.add_argument("--to", dest="end", help="Last day (YYYY-MM-DD) to include in totals")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    try:
+        db = client["finsense-ai"]
+        if args.rebuild:
+            days = rebuild(db["fileinfos"], db[STATS_COLLECTION])
+            logger.info(f"Rebuilt rollups for {days} day(s)")
+        print(json.dumps(totals(db[STATS_COLLECTION], args.start, args.end), indent=2))
+    finally:
+        client.close()
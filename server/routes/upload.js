@@ -1,10 +1,13 @@
 import express from 'express'
+import mongoose from 'mongoose'
 import multer from 'multer'
 import path from 'path'
 import { fileURLToPath } from 'url'
 import fs from 'fs'
-import { spawn } from 'child_process'
+import os from 'os'
 import FileInfo from '../models/FileInfo.js'
+import Job from '../models/Job.js'
+import DailyStats, { STAT_COUNTERS } from '../models/DailyStats.js'
 
 const router = express.Router()
 
@@ -57,62 +60,69 @@ const upload = multer({
     }
 })
 
-// Function to run Python processing pipeline
-async function runPythonPipeline(fileId, filename) {
-    return new Promise((resolve, reject) => {
-        console.log('\n🔄 Starting Python processing pipeline...')
-        console.log(`   File ID: ${fileId}`)
-        console.log(`   Filename: ${filename}`)
-        
-        // Use the full ML pipeline script
-        const pythonScriptPath = path.join(__dirname, '../getStructuresData.py')
-        const venvPython = path.join(__dirname, '../../venv/bin/python3')
-        
-        // Use venv Python if it exists, otherwise fall back to system python3
-        const pythonCommand = fs.existsSync(venvPython) ? venvPython : 'python3'
-        
-        console.log(`   Using Python: ${pythonCommand}`)
-        console.log(`   Script: ${pythonScriptPath}`)
-        
-        // Spawn Python process with file-id argument
-        const pythonProcess = spawn(pythonCommand, [
-            pythonScriptPath,
-            '--file-id', fileId
-        ])
-        
-        let outputData = ''
-        let errorData = ''
-        
-        pythonProcess.stdout.on('data', (data) => {
-            const output = data.toString()
-            outputData += output
-            console.log(output)
-        })
-        
-        pythonProcess.stderr.on('data', (data) => {
-            const error = data.toString()
-            errorData += error
-            console.error(error)
-        })
-        
-        pythonProcess.on('close', (code) => {
-            if (code === 0) {
-                console.log('✅ Python pipeline completed successfully')
-                resolve({ success: true, output: outputData })
-            } else {
-                console.error(`❌ Python pipeline failed with code ${code}`)
-                reject({ success: false, error: errorData, code })
-            }
-        })
-        
-        pythonProcess.on('error', (error) => {
-            console.error('❌ Failed to start Python process:', error)
-            reject({ success: false, error: error.message })
-        })
-    })
+// Admission limits are published by the Python workers (server/admission.py)
+const ADMISSION_STATUS_MAX_AGE_MS = 2 * 60 * 1000
+const FALLBACK_MAX_QUEUE_DEPTH = 200
+
+// Add (sign 1) or remove (sign -1) a call's contribution to its day's rollup
+async function applyStatsContribution(contribution, sign = 1) {
+    if (!contribution?.day) return
+    const inc = {}
+    for (const [key, value] of Object.entries(contribution.counters || {})) {
+        if (value) inc[key] = sign * value
+    }
+    if (Object.keys(inc).length > 0) {
+        await DailyStats.updateOne({ _id: contribution.day }, { $inc: inc }, { upsert: true })
+    }
 }
 
-router.post('/upload', upload.single('audio'), async (req, res) => {
+// Decide whether to queue, degrade or reject an upload before its body is read
+async function admissionControl(req, res, next) {
+    try {
+        const status = await mongoose.connection.collection('pipelinestatus').findOne({ _id: 'admission' })
+        const fresh = status?.updatedAt && (Date.now() - new Date(status.updatedAt).getTime()) < ADMISSION_STATUS_MAX_AGE_MS
+        // Without live workers, still keep the queue bounded
+        const limits = fresh ? status.limits : {
+            degradeDepth: FALLBACK_MAX_QUEUE_DEPTH,
+            rejectDepth: FALLBACK_MAX_QUEUE_DEPTH,
+            secondsPerJob: 60
+        }
+
+        const depth = await Job.countDocuments({ status: { $in: ['queued', 'leased'] } })
+
+        if (depth >= limits.rejectDepth) {
+            // Come back once the backlog is down to the normal-service level
+            const retryAfter = Math.max(1, Math.ceil((depth - limits.degradeDepth + 1) * limits.secondsPerJob))
+            res.set('Retry-After', String(retryAfter))
+            return res.status(503).json({
+                message: 'Processing queue is full, please retry later',
+                retryAfter,
+                queueDepth: depth
+            })
+        }
+
+        if (depth >= limits.degradeDepth && limits.degradedModel) {
+            req.modelName = limits.degradedModel
+        }
+        next()
+    } catch (error) {
+        // Admission is a safeguard; never block uploads because it failed
+        console.error('Admission check failed:', error.message)
+        next()
+    }
+}
+
+// Queue depth, in-flight jobs and estimated drain time as seen by the workers
+router.get('/queue', async (req, res) => {
+    try {
+        const status = await mongoose.connection.collection('pipelinestatus').findOne({ _id: 'admission' })
+        res.status(200).json({ message: 'Queue status retrieved successfully', queue: status })
+    } catch (error) {
+        res.status(500).json({ message: 'Server error', error: error.message })
+    }
+})
+
+router.post('/upload', admissionControl, upload.single('audio'), async (req, res) => {
     try {
         
         if (!req.file) {
@@ -120,30 +130,40 @@ router.post('/upload', upload.single('audio'), async (req, res) => {
             return res.status(400).json({ message: 'No audio file uploaded' })
         }
 
+        const createdAt = new Date()
+        // The extraction stage fills in the rest of the counters (server/rollups.py)
+        const statsContribution = {
+            day: createdAt.toISOString().slice(0, 10),
+            counters: { calls: 1, totalSize: req.file.size }
+        }
+
         const newFileInfo = new FileInfo({
             fileAddress: req.file.path,
+            // Only this host can put the upload into the artifact store: it must run
+            // a worker, or `python server/worker.py --ingest` (npm run ingest)
+            uploadHost: os.hostname(),
             voiceID: null,
+            lineId: req.body.lineId || undefined,
             keyDetails: {
                 filename: req.file.filename,
                 originalname: req.file.originalname,
                 mimetype: req.file.mimetype,
                 size: req.file.size
             },
-            summary: null
+            summary: null,
+            status: 'queued',
+            createdAt,
+            statsContribution
         })
 
         const savedFile = await newFileInfo.save()
+        await applyStatsContribution(statsContribution)
 
-        // Trigger Python processing pipeline in the background
-        // Don't wait for it to complete before sending response
-        runPythonPipeline(savedFile._id.toString(), req.file.filename)
-            .then(() => {
-                console.log('✅ Background processing completed for file:', req.file.filename)
-            })
-            .catch((error) => {
-                console.error('⚠️ Background processing failed for file:', req.file.filename)
-                console.error('Error:', error)
-            })
+        // Queue the file for the Python workers (server/worker.py); the job
+        // survives restarts and is retried on failure
+        await Job.create({ fileId: savedFile._id, modelName: req.modelName || null })
+        console.log('📥 Queued processing job for file:', req.file.filename,
+            req.modelName ? `(degraded to ${req.modelName} under load)` : '')
 
         res.status(200).json({
             message: 'File uploaded successfully',
@@ -181,7 +201,8 @@ router.get('/files', async (req, res) => {
             path: file.fileAddress,
             uploadDate: file.createdAt,
             voiceID: file.voiceID,
-            summary: file.summary
+            summary: file.summary,
+            status: file.status
         }))
 
         res.status(200).json({
@@ -203,7 +224,12 @@ router.delete('/files/delete/:id', async (req, res) => {
         if (!fileInfo) {
             return res.status(404).json({ message: 'File not found' })
         }
-        await FileInfo.findByIdAndDelete(fileId)
+        const deleted = await FileInfo.findByIdAndDelete(fileId)
+        await Job.deleteOne({ fileId: fileInfo._id })
+        // Later copies of this recording must not be linked to it
+        await mongoose.connection.collection('fingerprints').deleteOne({ _id: fileInfo._id })
+        // Use the deleted copy: extraction may have updated the counters since the lookup
+        await applyStatsContribution(deleted?.statsContribution, -1)
 
         fs.unlink(fileInfo.fileAddress, (err) => {
             if (err) {
@@ -217,47 +243,27 @@ router.delete('/files/delete/:id', async (req, res) => {
 })
 
 // Get statistics endpoint - MUST BE BEFORE /files/:id route
+// Sums the per-day rollups (one document per day, not per call); optional
+// ?from=YYYY-MM-DD&to=YYYY-MM-DD limits the range
 router.get('/statistics', async (req, res) => {
     try {
-        const allFiles = await FileInfo.find()
-        
-        // Calculate statistics
-        const totalCalls = allFiles.length
-        let totalDuration = 0
-        let totalSize = 0
-        let satisfiedCalls = 0
-        let dissatisfiedCalls = 0
-        let fraudsDetected = 0
-
-        allFiles.forEach(file => {
-            // Add size from keyDetails
-            if (file.keyDetails?.size) {
-                totalSize += file.keyDetails.size
-            }
+        const match = {}
+        if (req.query.from) match._id = { ...match._id, $gte: String(req.query.from) }
+        if (req.query.to) match._id = { ...match._id, $lte: String(req.query.to) }
 
-            // Get duration from keyDetails
-            if (file.keyDetails?.duration) {
-                totalDuration += file.keyDetails.duration
-            }
-
-            // Get satisfaction from keyDetails (satisfied, dissatisfied, neutral)
-            if (file.keyDetails?.satisfaction) {
-                const satisfaction = file.keyDetails.satisfaction.toLowerCase()
-                if (satisfaction === 'satisfied' || satisfaction === 'positive' || satisfaction === 'yes') {
-                    satisfiedCalls++
-                } else if (satisfaction === 'dissatisfied' || satisfaction === 'negative' || satisfaction === 'no') {
-                    dissatisfiedCalls++
-                }
-            }
+        const group = { _id: null }
+        for (const key of STAT_COUNTERS) {
+            group[key] = { $sum: `$${key}` }
+        }
+        const [totals = {}] = await DailyStats.aggregate([{ $match: match }, { $group: group }])
 
-            // Get fraud status from keyDetails
-            if (file.keyDetails?.fraud) {
-                const fraud = file.keyDetails.fraud.toString().toLowerCase()
-                if (fraud === 'yes' || fraud === 'true' || fraud === '1') {
-                    fraudsDetected++
-                }
-            }
-        })
+        const totalCalls = totals.calls || 0
+        const totalDuration = totals.totalDuration || 0
+        const totalSize = totals.totalSize || 0
+        const satisfiedCalls = totals.satisfiedCalls || 0
+        const dissatisfiedCalls = totals.dissatisfiedCalls || 0
+        const fraudsDetected = totals.fraudsDetected || 0
+        const riskFlags = totals.riskFlags || 0
 
         const averageCallTime = totalCalls > 0 ? Math.floor(totalDuration / totalCalls) : 0
 
@@ -269,6 +275,7 @@ router.get('/statistics', async (req, res) => {
                 dissatisfiedCalls,
                 averageCallTime,
                 fraudsDetected,
+                riskFlags,
                 totalDuration,
                 totalSize
             }
@@ -298,7 +305,10 @@ router.get('/files/:id', async (req, res) => {
                 path: fileInfo.fileAddress,
                 uploadDate: fileInfo.createdAt,
                 voiceID: fileInfo.voiceID,
-                summary: fileInfo.summary
+                summary: fileInfo.summary,
+                status: fileInfo.status,
+                progress: fileInfo.progress,
+                partialTranscript: fileInfo.partialTranscript || []
             }
         })
     } catch (error) {
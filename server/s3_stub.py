@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an S3-compatible object store, for developing and testing
+the ``s3`` artifact backend without MinIO or AWS.
+
+Serves path-style requests (``/<bucket>/<key>``) from a directory: bucket
+create/head, object PUT/GET (with ``Range``)/HEAD/DELETE, ListObjectsV2 and
+multipart uploads, which is what boto3's ``upload_file``/``download_file``
+and the store use. Requests are not authenticated.
+
+Example:
+    python s3_stub.py --port 9000 --root ./s3data
+    ARTIFACT_STORE=s3 ARTIFACT_S3_ENDPOINT=http://localhost:9000 \\
+        AWS_ACCESS_KEY_ID=stub AWS_SECRET_ACCESS_KEY=stub python artifacts.py init
+"""
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+PART_PATTERN = re.compile(r"<PartNumber>(\d+)</PartNumber>")
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+S3_NAMESPACE = 'xmlns="http://s3.amazonaws.com/doc/2006-03-01/"'
+
+
+class S3StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "S3Stub"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    # Request parsing
+    def _target(self):
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _object_path(self, bucket: str, key: str) -> Path:
+        path = (self.server.root / bucket / key).resolve()
+        if self.server.root.resolve() not in path.parents:
+            raise PermissionError(key)
+        return path
+
+    def _body(self) -> bytes:
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            raw = self._read_http_chunks()
+        else:
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if ("aws-chunked" in self.headers.get("Content-Encoding", "")
+                or self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-")):
+            raw = self._decode_aws_chunks(raw)
+        return raw
+
+    def _read_http_chunks(self) -> bytes:
+        data = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return bytes(data)
+            data += self.rfile.read(size)
+            self.rfile.readline()
+
+    @staticmethod
+    def _decode_aws_chunks(raw: bytes) -> bytes:
+        # <hex size>[;chunk-signature=...]\r\n<data>\r\n ... 0\r\n<trailers>\r\n\r\n
+        data = bytearray()
+        position = 0
+        while True:
+            line_end = raw.index(b"\r\n", position)
+            size = int(raw[position:line_end].split(b";")[0], 16)
+            if size == 0:
+                return bytes(data)
+            data += raw[line_end + 2:line_end + 2 + size]
+            position = line_end + 2 + size + 2
+
+    # Responses
+    def _send(self, status: int, body: bytes = b"", headers=None, head_only: bool = False):
+        headers = dict(headers or {})
+        if not head_only:
+            headers["Content-Length"] = str(len(body))
+        headers.setdefault("Content-Length", "0")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and not head_only:
+            self.wfile.write(body)
+
+    def _xml(self, status: int, body: str):
+        self._send(status, f"{XML_HEADER}{body}".encode(), {"Content-Type": "application/xml"})
+
+    def _error(self, status: int, code: str, message: str = ""):
+        if self.command == "HEAD":
+            self._send(status)
+        else:
+            self._xml(status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+    @staticmethod
+    def _etag(path: Path) -> str:
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return f'"{digest.hexdigest()}"'
+
+    # Methods
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        if not key:
+            (self.server.root / bucket).mkdir(parents=True, exist_ok=True)
+            return self._send(200, headers={"Location": f"/{bucket}"})
+        if not (self.server.root / bucket).is_dir():
+            return self._error(404, "NoSuchBucket", bucket)
+
+        if "uploadId" in query:
+            part = self.server.uploads / query["uploadId"] / f"{int(query['partNumber']):05d}"
+            if not part.parent.is_dir():
+                return self._error(404, "NoSuchUpload", query["uploadId"])
+            part.write_bytes(body)
+            return self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+        path = self._object_path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        staging.write_bytes(body)
+        os.replace(staging, path)
+        self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        body = self._body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            (self.server.uploads / upload_id).mkdir(parents=True)
+            return self._xml(200, f"<InitiateMultipartUploadResult {S3_NAMESPACE}><Bucket>{escape(bucket)}</Bucket>"
+                                  f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                                  f"</InitiateMultipartUploadResult>")
+        if "uploadId" in query:
+            parts_dir = self.server.uploads / query["uploadId"]
+            if not parts_dir.is_dir():
+                return self._error(404, "NoSuchUpload", query["uploadId"])
+            path = self._object_path(bucket, key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            staging = path.with_name(f"{path.name}.{query['uploadId']}.tmp")
+            with open(staging, "wb") as out:
+                for number in PART_PATTERN.findall(body.decode()):
+                    with open(parts_dir / f"{int(number):05d}", "rb") as part:
+                        shutil.copyfileobj(part, out)
+            os.replace(staging, path)
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            return self._xml(200, f"<CompleteMultipartUploadResult {S3_NAMESPACE}><Bucket>{escape(bucket)}</Bucket>"
+                                  f"<Key>{escape(key)}</Key><ETag>{self._etag(path)}</ETag>"
+                                  f"</CompleteMultipartUploadResult>")
+        self._error(400, "InvalidRequest", "unsupported POST")
+
+    def _object_headers(self, path: Path) -> dict:
+        stat = path.stat()
+        return {"Content-Length": str(stat.st_size), "Accept-Ranges": "bytes",
+                "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+                "Content-Type": "application/octet-stream"}
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+        if not key:
+            return self._send(200 if (self.server.root / bucket).is_dir() else 404)
+        path = self._object_path(bucket, key)
+        if not path.is_file():
+            return self._error(404, "NoSuchKey", key)
+        self._send(200, headers=self._object_headers(path), head_only=True)
+
+    def do_GET(self):
+        bucket, key, query = self._target()
+        if not (self.server.root / bucket).is_dir():
+            return self._error(404, "NoSuchBucket", bucket)
+        if not key:
+            return self._list(bucket, query)
+        path = self._object_path(bucket, key)
+        if not path.is_file():
+            return self._error(404, "NoSuchKey", key)
+
+        size = path.stat().st_size
+        headers = self._object_headers(path)
+        match = RANGE_PATTERN.match(self.headers.get("Range", ""))
+        start, end, status = 0, size - 1, 200
+        if match:
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(size - 1, int(last)) if last else size - 1
+            else:
+                start, end = max(0, size - int(last)), size - 1
+            if start >= size:
+                return self._error(416, "InvalidRange", self.headers["Range"])
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        length = end - start + 1
+        headers["Content-Length"] = str(length)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                self.wfile.write(block)
+                remaining -= len(block)
+
+    def _list(self, bucket: str, query: dict):
+        root = self.server.root / bucket
+        prefix = query.get("prefix", "")
+        limit = int(query.get("max-keys", 1000))
+        after = query.get("continuation-token") or query.get("start-after", "")
+        keys = sorted(str(path.relative_to(root)) for path in root.rglob("*")
+                      if path.is_file() and not path.name.endswith(".tmp"))
+        keys = [key for key in keys if key.startswith(prefix) and key > after]
+        page, truncated = keys[:limit], len(keys) > limit
+
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><Size>{(root / key).stat().st_size}</Size>"
+            f"<LastModified>{formatdate((root / key).stat().st_mtime, usegmt=True)}</LastModified></Contents>"
+            for key in page)
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        self._xml(200, f"<ListBucketResult {S3_NAMESPACE}><Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+                       f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{limit}</MaxKeys>"
+                       f"<IsTruncated>{str(truncated).lower()}</IsTruncated>{token}{contents}</ListBucketResult>")
+
+    def do_DELETE(self):
+        bucket, key, query = self._target()
+        if "uploadId" in query:
+            shutil.rmtree(self.server.uploads / query["uploadId"], ignore_errors=True)
+        elif key:
+            self._object_path(bucket, key).unlink(missing_ok=True)
+        self._send(204)
+
+
+def make_server(root: str, host: str = "127.0.0.1", port: int = 9000) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), S3StubHandler)
+    server.root = Path(root)
+    server.uploads = server.root / ".uploads"
+    server.uploads.mkdir(parents=True, exist_ok=True)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local S3-compatible stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--root", default="./s3data", help="Directory holding the buckets")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = make_server(args.root, args.host, args.port)
+    logger.info(f"S3 stand-in serving {args.root} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
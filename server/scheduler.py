@@ -0,0 +1,121 @@
+import os
+import logging
+from typing import Callable, Dict, Optional
+
+from tuning import tuned
+
+logger = logging.getLogger(__name__)
+
+
+# Rough compressed bitrates for uploads whose duration is unknown
+BYTES_PER_SECOND = {
+    "audio/wav": 32000,
+    "audio/wave": 32000,
+    "audio/x-wav": 32000,
+    "audio/flac": 16000,
+    "audio/mpeg": 16000,
+    "audio/mp4": 8000,
+    "audio/x-m4a": 8000,
+    "audio/aac": 8000,
+    "audio/ogg": 8000,
+    "audio/webm": 8000,
+}
+DEFAULT_BYTES_PER_SECOND = 16000
+
+# Calls up to this long go to the short lane
+SHORT_JOB_SECONDS = 300
+LANES = ("short", "long")
+
+
+def estimate_audio_seconds(key_details: Dict, file_address: Optional[str] = None,
+                           open_source: Optional[Callable] = None) -> float:
+    """
+    Estimate a call's length, which is what pipeline cost scales with.
+
+    Uses, in order: a stored duration, the file header when the file is on
+    this machine (or, through ``open_source``, read with range requests from
+    the artifact store), and finally the upload size divided by a typical
+    bitrate for its mimetype.
+    """
+    duration = key_details.get("duration")
+    if duration:
+        return float(duration)
+
+    if file_address and os.path.exists(file_address):
+        try:
+            import soundfile as sf
+            return float(sf.info(file_address).duration)
+        except Exception:
+            pass
+    elif open_source is not None:
+        try:
+            import soundfile as sf
+            with open_source() as f:
+                return float(sf.info(f).duration)
+        except Exception:
+            pass
+
+    size = key_details.get("size") or 0
+    bps = BYTES_PER_SECOND.get(key_details.get("mimetype"), DEFAULT_BYTES_PER_SECOND)
+    return size / bps
+
+
+def lane_for(estimated_seconds: float) -> str:
+    return "short" if estimated_seconds <= SHORT_JOB_SECONDS else "long"
+
+
+def reserved_short_slots(slots: int) -> int:
+    """Slots long calls may never occupy, so short calls always find one free."""
+    if slots <= 1:
+        return 0
+    return max(1, slots // 4)
+
+
+def thread_budget(cores: int, active_jobs: int) -> int:
+    """Split the machine's cores evenly across the jobs that will run together."""
+    return max(1, cores // max(1, active_jobs))
+
+
+class SlotScheduler:
+    """
+    Decide which lane the next free slot should lease from.
+
+    Concurrency is capped at ``slots`` (the host's tuned value, else one per
+    core). Short calls
+    are leased first and shortest-first; long calls are leased in arrival
+    order and may use every slot except the reserved short ones, so a
+    backfill of long recordings cannot starve a 30-second call.
+    """
+
+    def __init__(self, slots: Optional[int] = None, cores: Optional[int] = None):
+        self.cores = cores or os.cpu_count() or 1
+        self.slots = slots or tuned("worker", "slots") or self.cores
+        self.reserved = reserved_short_slots(self.slots)
+        self.active = {lane: 0 for lane in LANES}
+
+    @property
+    def total_active(self) -> int:
+        return sum(self.active.values())
+
+    def lanes_to_try(self):
+        """Lanes a free slot may lease from right now, in preference order."""
+        if self.total_active >= self.slots:
+            return []
+        lanes = ["short"]
+        if self.active["long"] < self.slots - self.reserved:
+            lanes.append("long")
+        return lanes
+
+    def threads_for_next(self, waiting: int = 0) -> int:
+        """Thread budget for a job about to start, counting jobs likely to start alongside it."""
+        configured = tuned("worker", "threads")
+        if configured:
+            return configured
+        expected = min(self.slots, self.total_active + 1 + max(0, waiting))
+        return thread_budget(self.cores, expected)
+
+    def started(self, lane: str) -> None:
+        self.active[lane] += 1
+
+    def finished(self, lane: str) -> None:
+        self.active[lane] = max(0, self.active[lane] - 1)
@@ -0,0 +1,327 @@
+"""
+Columnar table of speaker turns, shared by diarization, transcription and storage.
+
+Turns used to travel as lists of ``{speaker, start, end, duration}`` dicts,
+written as indented JSON after diarization and parsed again, turn by turn,
+by transcription. A :class:`SegmentTable` keeps them in one NumPy
+structured array (24 bytes per turn) with speaker labels interned once:
+
+* filtering, sorting, merging, relabelling and the word-to-turn interval
+  join are array operations;
+* the ``.seg`` file is a short JSON header followed by the raw rows, so
+  saving and loading a call with thousands of turns is a single buffer copy
+  and the loaded table is a view over the bytes read;
+* a table saved in this process is handed to the next stage as is when it
+  loads the same, unchanged file (the worker runs all stages of a job in
+  one process);
+* ``to_records`` / ``save_json`` produce the old JSON for the standalone
+  scripts and anything else that reads ``*_diarization.json``, and
+  :meth:`SegmentTable.load` still reads it.
+"""
+import os
+import json
+import struct
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+SEGMENT_DTYPE = np.dtype([("start", "<f8"), ("end", "<f8"), ("speaker", "<i4"), ("channel", "<i4")])
+MAGIC = b"SEGT"
+FORMAT_VERSION = 1
+# magic, version, header length
+_PREFIX = struct.Struct("<4sII")
+# Saved tables kept for same-process handoff to the next stage
+HANDOFF_SLOTS = 8
+_handoff = OrderedDict()
+
+
+def interval_join(starts: np.ndarray, ends: np.ndarray, turn_starts: np.ndarray, turn_ends: np.ndarray,
+                  max_cells: int = 4_000_000) -> np.ndarray:
+    """
+    Index of the turn each interval overlaps most.
+
+    Intervals that overlap no turn go to the turn with the nearest edge.
+    Turns are sorted by start once; binary search then narrows each
+    interval to the few turns that can overlap it, plus the nearest turn
+    on either side, so the cost follows the number of overlapping turns
+    rather than intervals x turns. Candidates are evaluated in blocks of
+    at most ``max_cells`` so memory stays bounded on long calls.
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    assignment = np.zeros(len(starts), dtype=np.int64)
+    if len(turn_starts) == 0 or len(starts) == 0:
+        return assignment
+
+    order = np.argsort(turn_starts, kind="stable")
+    ts = np.asarray(turn_starts, dtype=np.float64)[order]
+    te = np.asarray(turn_ends, dtype=np.float64)[order]
+    # Turns before ``lo`` end by the interval's start; turns from ``hi`` on start after its end
+    reach = np.maximum.accumulate(te)
+    reach_turn = np.maximum.accumulate(np.where(te == reach, np.arange(len(te)), 0))
+    lo = np.searchsorted(reach, starts, side="right")
+    hi = np.searchsorted(ts, ends, side="left")
+
+    # Nearest turn outside [lo, hi): the one reaching furthest before, or the first one after
+    before = reach_turn[np.maximum(lo - 1, 0)]
+    after = np.minimum(hi, len(ts) - 1)
+    overlap_before = np.where(lo > 0, te[before] - starts, -np.inf)
+    overlap_after = np.where(hi < len(ts), ends - ts[after], -np.inf)
+    best = np.where(overlap_before >= overlap_after, before, after)
+    best_overlap = np.maximum(overlap_before, overlap_after)
+
+    width = hi - lo
+    block = max(1, max_cells // max(1, int(width.max(initial=0))))
+    for first in range(0, len(starts), block):
+        rows = slice(first, first + block)
+        span = int(width[rows].max(initial=0))
+        if span <= 0:
+            continue
+        candidate = lo[rows, None] + np.arange(span)[None, :]
+        valid = candidate < hi[rows, None]
+        candidate = np.minimum(candidate, len(ts) - 1)
+        # Negative overlap is minus the gap, so the maximum is also the nearest turn
+        overlap = np.where(
+            valid,
+            np.minimum(ends[rows, None], te[candidate]) - np.maximum(starts[rows, None], ts[candidate]),
+            -np.inf
+        )
+        pick = np.argmax(overlap, axis=1)
+        picked = overlap[np.arange(len(pick)), pick]
+        better = picked > best_overlap[rows]
+        best[rows] = np.where(better, candidate[np.arange(len(pick)), pick], best[rows])
+
+    assignment[:] = order[best]
+    return assignment
+
+
+class SegmentTable:
+    """
+    Speaker turns as a structured array plus the list of speaker labels.
+
+    ``channel`` is the source channel of channel-split recordings and -1
+    for turns of a mixed recording. Selections (slices, masks) are new
+    tables over the selected rows; ``speakers`` is shared.
+    """
+
+    def __init__(self, rows: Optional[np.ndarray] = None, speakers: Sequence[str] = ()):
+        self.rows = np.zeros(0, dtype=SEGMENT_DTYPE) if rows is None else rows
+        self.speakers = list(speakers)
+
+    # ------------------------------------------------------------ construction
+
+    @classmethod
+    def from_arrays(cls, start, end, speaker, speakers: Sequence[str], channel=None) -> "SegmentTable":
+        """Build from columns; ``speaker`` holds indices into ``speakers``."""
+        rows = np.empty(len(start), dtype=SEGMENT_DTYPE)
+        rows["start"] = start
+        rows["end"] = end
+        rows["speaker"] = speaker
+        rows["channel"] = -1 if channel is None else channel
+        return cls(rows, speakers)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping]) -> "SegmentTable":
+        """Build from ``{speaker, start, end[, channel]}`` dicts (``duration`` is recomputed)."""
+        records = list(records)
+        labels = [str(record["speaker"]) for record in records]
+        speakers = list(dict.fromkeys(labels))
+        index = {label: i for i, label in enumerate(speakers)}
+        return cls.from_arrays(
+            [float(record["start"]) for record in records],
+            [float(record["end"]) for record in records],
+            [index[label] for label in labels],
+            speakers,
+            [int(record.get("channel", -1)) for record in records],
+        )
+
+    @classmethod
+    def coerce(cls, segments: Union["SegmentTable", Iterable[Mapping]]) -> "SegmentTable":
+        return segments if isinstance(segments, SegmentTable) else cls.from_records(segments)
+
+    # ------------------------------------------------------------ columns
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.rows["start"]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.rows["end"]
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.rows["end"] - self.rows["start"]
+
+    @property
+    def channel(self) -> np.ndarray:
+        return self.rows["channel"]
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Speaker label of every turn (object array)."""
+        return np.asarray(self.speakers or [""], dtype=object)[self.rows["speaker"]]
+
+    @property
+    def has_channels(self) -> bool:
+        return bool(len(self.rows)) and bool((self.rows["channel"] >= 0).any())
+
+    def total_duration(self) -> float:
+        return float(np.maximum(self.duration, 0.0).sum())
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._record(self.rows[key])
+        return SegmentTable(self.rows[key], self.speakers)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self.rows:
+            yield self._record(row)
+
+    def __repr__(self) -> str:
+        return f"SegmentTable({len(self)} turns, speakers={self.speakers})"
+
+    def _record(self, row) -> Dict:
+        start, end = round(float(row["start"]), 2), round(float(row["end"]), 2)
+        record = {
+            "speaker": self.speakers[row["speaker"]],
+            "start": start,
+            "end": end,
+            "duration": round(end - start, 2),
+        }
+        if row["channel"] >= 0:
+            record["channel"] = int(row["channel"])
+        return record
+
+    def to_records(self) -> List[Dict]:
+        """The turns as the dicts the pipeline used before (and the JSON export holds)."""
+        return list(self)
+
+    # ------------------------------------------------------------ operations
+
+    def filter_duration(self, min_duration: float = 0.0, max_duration: Optional[float] = None) -> "SegmentTable":
+        keep = self.duration >= min_duration
+        if max_duration is not None:
+            keep &= self.duration <= max_duration
+        return self[keep]
+
+    def sorted(self) -> "SegmentTable":
+        """Turns ordered by start, then end."""
+        return self[np.lexsort((self.rows["end"], self.rows["start"]))]
+
+    def merge_adjacent(self, max_gap: float = 0.05) -> "SegmentTable":
+        """
+        Join consecutive turns of the same speaker and channel separated by at most ``max_gap`` seconds.
+
+        The table is sorted first; a merged turn spans its parts.
+        """
+        table = self.sorted()
+        rows = table.rows
+        if len(rows) < 2:
+            return table
+
+        same = (rows["speaker"][1:] == rows["speaker"][:-1]) & (rows["channel"][1:] == rows["channel"][:-1])
+        run = np.concatenate(([0], np.cumsum(~same)))
+        # Running end within each run of one speaker: offset runs apart so a global cummax stays inside the run
+        offset = float(rows["end"].max() - rows["start"].min()) + max_gap + 1.0
+        running_end = np.maximum.accumulate(rows["end"] + run * offset) - run * offset
+        starts_turn = np.concatenate(([True], ~same | (rows["start"][1:] - running_end[:-1] > max_gap)))
+
+        first = np.flatnonzero(starts_turn)
+        merged = rows[first].copy()
+        merged["end"] = np.maximum.reduceat(rows["end"], first)
+        return SegmentTable(merged, table.speakers)
+
+    def relabel(self, mapping: Optional[Mapping[str, str]] = None) -> "SegmentTable":
+        """
+        Rename speakers; labels not in ``mapping`` are kept.
+
+        Without a mapping, speakers are renumbered ``SPEAKER_00``, ``SPEAKER_01``...
+        in order of first appearance, as pyannote output reads.
+        """
+        if mapping is None:
+            present = self.rows["speaker"][np.sort(np.unique(self.rows["speaker"], return_index=True)[1])]
+            mapping = {self.speakers[code]: f"SPEAKER_{i:02d}" for i, code in enumerate(present)}
+        renamed = [mapping.get(label, label) for label in self.speakers]
+        speakers = list(dict.fromkeys(renamed))
+        lookup = np.array([speakers.index(label) for label in renamed] or [0], dtype=np.int32)
+        rows = self.rows.copy()
+        rows["speaker"] = lookup[rows["speaker"]]
+        return SegmentTable(rows, speakers)
+
+    def join(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Row of the turn each ``[starts, ends)`` interval (e.g. a word) overlaps most; see :func:`interval_join`."""
+        return interval_join(np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64),
+                             self.rows["start"], self.rows["end"])
+
+    # ------------------------------------------------------------ storage
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps({"speakers": self.speakers, "rows": len(self.rows)}).encode("utf-8")
+        # Pad so the rows start 8-byte aligned
+        header += b" " * (-(_PREFIX.size + len(header)) % 8)
+        return b"".join((_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)), header,
+                         np.ascontiguousarray(self.rows).tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SegmentTable":
+        """Table over ``data`` without copying the rows (read-only)."""
+        magic, version, header_length = _PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a segment table")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Segment table format {version} is newer than this reader ({FORMAT_VERSION})")
+        header = json.loads(data[_PREFIX.size:_PREFIX.size + header_length])
+        rows = np.frombuffer(data, dtype=SEGMENT_DTYPE, count=header["rows"], offset=_PREFIX.size + header_length)
+        return cls(rows, header["speakers"])
+
+    def save(self, path: str) -> str:
+        """Write the binary ``.seg`` file and keep the table for a same-process :meth:`load`."""
+        staging = f"{path}.{os.getpid()}.tmp"
+        with open(staging, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(staging, path)
+        _handoff[os.path.abspath(path)] = (os.stat(path).st_mtime_ns, self)
+        _handoff.move_to_end(os.path.abspath(path))
+        while len(_handoff) > HANDOFF_SLOTS:
+            _handoff.popitem(last=False)
+        return path
+
+    def save_json(self, path: str) -> str:
+        """Compatibility export: the JSON list of turn dicts."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_records(), f)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentTable":
+        """Read a ``.seg`` file or a JSON list of turns (older diarization output)."""
+        cached = _handoff.get(os.path.abspath(path))
+        if cached is not None and cached[0] == os.stat(path).st_mtime_ns:
+            return cached[1]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(MAGIC)] == MAGIC:
+            return cls.from_bytes(data)
+
+        if not data.strip():
+            raise ValueError(f"Diarization file is empty: {path}")
+        try:
+            records = json.loads(data.decode("utf-8-sig"))
+        except UnicodeDecodeError:
+            records = json.loads(data.decode("latin-1"))
+        if not isinstance(records, list):
+            raise ValueError("Diarization JSON must be a list of segments")
+        for record in records:
+            if not all(key in record for key in ("start", "end", "speaker")):
+                raise ValueError("Each segment must have 'start', 'end', and 'speaker' fields")
+        return cls.from_records(records)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Import-time budget and preloading for the pipeline entry points.
+
+Stage modules import torch, whisper, librosa, pyannote, pydub and most of
+scipy inside the functions that need them, so ``--help``, the Mongo-only
+commands and the worker supervisor start in a fraction of a second.
+``check`` imports every entry point in a fresh interpreter under
+``python -X importtime`` and fails when one goes over its budget; run it
+after touching module-level imports (``tests/test_import_budget.py`` runs
+the same check under pytest).
+
+Processes that will run stages anyway pay the heavy imports once at boot
+instead of on their first job: in-process callers use :func:`preload`,
+and the worker starts job processes from a forkserver that preloads them
+(``worker.py --preload``).
+
+Examples:
+    python startup.py check
+    python startup.py check --budget-ms 300 worker transcript
+    python startup.py preload --stages transcribed
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import logging
+import subprocess
+import multiprocessing
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINTS = [
+    "worker", "getStructuresData", "audioprocess", "diarization", "transcript",
+    "rollups", "analytics_export", "prefilter", "admission", "benchmark", "fingerprint",
+    "voiceindex", "live", "tuning", "artifacts", "retention",
+]
+IMPORT_BUDGET_MS = 500
+# Modules each pipeline stage needs, heaviest first; missing optional ones are skipped
+STAGE_MODULES = {
+    "preprocessed": ["librosa", "scipy.signal", "pydub", "denoise", "audioprocess"],
+    "diarized": ["torch", "pyannote.audio", "scipy.optimize", "scipy.cluster.vq", "diarization"],
+    "transcribed": ["torch", "whisper", "librosa", "transcript"],
+    # getStructuresData opens MongoDB at import, which must not happen before a fork
+    "extracted": ["backboard"],
+}
+
+
+def import_time(module: str, top: int = 5) -> Dict:
+    """
+    Import ``module`` in a fresh interpreter and report what it cost.
+
+    Returns:
+        Dict with the module's cumulative import time in ms and its
+        ``slowest`` dependencies, or an ``error`` if the import failed
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, capture_output=True, text=True
+    )
+    timings = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # Nesting depth is the indentation of the name
+        name = parts[2][1:]
+        timings.append((name.strip(), len(name) - len(name.lstrip()), int(parts[1].strip())))
+
+    if proc.returncode != 0:
+        return {"module": module, "error": (proc.stderr.strip().splitlines() or ["import failed"])[-1]}
+
+    end = max((i for i, (name, depth, _) in enumerate(timings) if name == module and depth == 0), default=None)
+    if end is None:
+        return {"module": module, "ms": 0.0, "slowest": []}
+    # The module's own imports are listed above it, back to the previous top-level import
+    begin = end
+    while begin > 0 and timings[begin - 1][1] > 0:
+        begin -= 1
+    slowest = sorted(timings[begin:end], key=lambda t: -t[2])[:top]
+    total = timings[end][2]
+    return {
+        "module": module,
+        "ms": round(total / 1000, 1),
+        "slowest": [f"{name} {us / 1000:.0f}ms" for name, _, us in slowest],
+    }
+
+
+def check_budget(modules: Iterable[str] = ENTRY_POINTS, budget_ms: float = IMPORT_BUDGET_MS) -> List[Dict]:
+    """Measure each module's import time; ``ok`` is False over budget or when the import fails."""
+    results = []
+    for module in modules:
+        result = import_time(module)
+        result["ok"] = "error" not in result and result["ms"] <= budget_ms
+        results.append(result)
+    return results
+
+
+def preload_modules(stages: Optional[Iterable[str]] = None) -> List[str]:
+    """Modules :func:`preload` imports for ``stages`` (default: every stage), without duplicates."""
+    modules = []
+    for stage in stages or STAGE_MODULES:
+        for module in STAGE_MODULES[stage]:
+            if module not in modules:
+                modules.append(module)
+    return modules
+
+
+def preload(stages: Optional[Iterable[str]] = None) -> Dict[str, Optional[float]]:
+    """
+    Import the heavy modules for ``stages`` now rather than on first use.
+
+    Returns:
+        Seconds per module; None for modules that are not installed
+    """
+    timings = {}
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    for module in preload_modules(stages):
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module)
+            timings[module] = round(time.perf_counter() - started, 3)
+        except ImportError as e:
+            logger.warning(f"Preload skipped {module}: {e}")
+            timings[module] = None
+    logger.info(f"Preloaded {sum(t is not None for t in timings.values())} module(s) "
+                f"in {sum(t or 0 for t in timings.values()):.1f}s")
+    return timings
+
+
+def job_process_context(preload_stages: Optional[Iterable[str]] = None, enabled: bool = True):
+    """
+    multiprocessing context for job processes.
+
+    With ``enabled`` and where the platform has it, a forkserver that has
+    already imported the stage modules: every job process starts warm.
+    BLAS thread pools in those processes keep the size they had at preload;
+    torch threads are still set per job. Otherwise (or on Windows) spawn,
+    and each job imports what it uses.
+    """
+    if not enabled or "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+
+    from multiprocessing import forkserver
+
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(preload_modules(preload_stages))
+    # Start the server now so its imports overlap with the first lease instead of following it
+    forkserver.ensure_running()
+    logger.info("Forkserver started with stage modules preloading")
+    return ctx
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget and preloading for pipeline entry points")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = sub.add_parser("check", help="Fail if an entry point imports slower than the budget")
+    check_parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    check_parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+
+    preload_parser = sub.add_parser("preload", help="Time the preload of stage modules in this process")
+    preload_parser.add_argument("--stages", nargs="+", choices=list(STAGE_MODULES))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "check":
+        results = check_budget(args.modules, args.budget_ms)
+        for result in results:
+            status = "ok  " if result["ok"] else "FAIL"
+            detail = result.get("error") or f"{result['ms']:>7.1f} ms   " + ", ".join(result["slowest"])
+            print(f"{status} {result['module']:<18} {detail}")
+        sys.exit(0 if all(result["ok"] for result in results) else 1)
+    else:
+        print(json.dumps(preload(args.stages), indent=2))
@@ -0,0 +1,152 @@
+"""
+Channel-split handling for stereo call-center recordings.
+
+Dialer recordings usually put the agent on one channel and the customer on
+the other. When the two channels really are separate voices (not a mono
+mix copied to both sides), "who spoke when" is simply voice activity per
+channel, so diarization reduces to two VAD passes and takes milliseconds
+instead of a pyannote run.
+
+A recording counts as channel-split when its channels are weakly correlated
+sample-for-sample, both carry speech, and their speech rarely overlaps.
+Set ``CHANNEL_SPLIT=off`` to always downmix and diarize.
+"""
+import os
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vad import FRAME_MS, detect_speech, frame_features, _runs
+from segments import SegmentTable
+
+logger = logging.getLogger(__name__)
+
+
+# "auto" (use the channels when they are separate) or "off"
+CHANNEL_SPLIT = os.getenv('CHANNEL_SPLIT', 'auto')
+MAX_CHANNEL_CORRELATION = 0.3
+# Each channel must hold speech in at least this share of frames
+MIN_SPEECH_SHARE = 0.02
+# Share of speech frames active on both channels above which the "split" is really a mix
+MAX_SPEECH_OVERLAP = 0.5
+# A frame this much louder on the other channel is that side's echo or bleed, not speech
+CROSSTALK_DB = 15.0
+# Channel order follows the dialer convention: agent left, customer right
+CHANNEL_SPEAKERS = ("SPEAKER_00", "SPEAKER_01")
+
+
+def load_channels(audio_path: str, sr: int = 16000) -> Tuple[np.ndarray, int]:
+    """
+    Load a recording without downmixing.
+
+    Returns:
+        Tuple of (channels array shaped (n_channels, n_samples), sample rate)
+    """
+    import librosa
+
+    y, sr = librosa.load(audio_path, sr=sr, mono=False)
+    return np.atleast_2d(y).astype(np.float32, copy=False), sr
+
+
+def channel_correlation(left: np.ndarray, right: np.ndarray) -> float:
+    """Absolute Pearson correlation of two equal-length channels (0 for silent input)."""
+    left = left - left.mean()
+    right = right - right.mean()
+    denominator = np.sqrt(np.dot(left, left) * np.dot(right, right))
+    if denominator <= 0:
+        return 0.0
+    return float(abs(np.dot(left, right)) / denominator)
+
+
+def suppress_crosstalk(channels: np.ndarray, sr: int, masks: List[np.ndarray],
+                       frame_ms: int = FRAME_MS, crosstalk_db: float = CROSSTALK_DB) -> List[np.ndarray]:
+    """
+    Drop speech runs that are only the other channel leaking through.
+
+    A run is kept unless, averaged over the run, the other channel is
+    ``crosstalk_db`` louder; real overlapping speech (an interruption) is
+    about as loud on its own microphone as the other side is on theirs.
+    """
+    power = [10.0 ** (frame_features(channel, sr, frame_ms)["energy_db"] / 10.0) for channel in channels]
+    n = min(len(mask) for mask in masks)
+    cleaned = []
+    for own, other in ((0, 1), (1, 0)):
+        mask = masks[own][:n].copy()
+        for s, e in zip(*_runs(mask)):
+            ratio = power[other][s:e].mean() / (power[own][s:e].mean() + 1e-12)
+            if 10.0 * np.log10(ratio + 1e-12) > crosstalk_db:
+                mask[s:e] = False
+        cleaned.append(mask)
+    return cleaned
+
+
+def analyze_channels(channels: np.ndarray, sr: int, frame_ms: int = FRAME_MS) -> Dict:
+    """
+    Decide whether a two-channel recording can be diarized by channel.
+
+    Returns:
+        Dict with ``split`` (bool), the measured ``correlation``,
+        per-channel ``speechShare``, ``overlap`` and the per-channel
+        ``masks`` from :func:`vad.detect_speech` for reuse
+    """
+    if channels.ndim != 2 or channels.shape[0] != 2:
+        return {"split": False, "reason": "not stereo"}
+
+    correlation = channel_correlation(channels[0], channels[1])
+    masks = [detect_speech(channel, sr, frame_ms) for channel in channels]
+    masks = suppress_crosstalk(channels, sr, masks, frame_ms)
+    shares = [float(mask.mean()) if len(mask) else 0.0 for mask in masks]
+    either = masks[0] | masks[1]
+    overlap = float((masks[0] & masks[1]).sum() / either.sum()) if either.any() else 0.0
+
+    if correlation > MAX_CHANNEL_CORRELATION:
+        reason = "channels correlated"
+    elif min(shares) < MIN_SPEECH_SHARE:
+        reason = "one channel has no speech"
+    elif overlap > MAX_SPEECH_OVERLAP:
+        reason = "speech overlaps on both channels"
+    else:
+        reason = None
+
+    info = {
+        "split": reason is None,
+        "reason": reason,
+        "correlation": round(correlation, 3),
+        "speechShare": [round(share, 3) for share in shares],
+        "overlap": round(overlap, 3),
+        "masks": masks,
+    }
+    logger.info(
+        f"Channel check: correlation={info['correlation']}, speech={info['speechShare']}, "
+        f"overlap={info['overlap']} -> {'split' if info['split'] else reason}"
+    )
+    return info
+
+
+def channel_segments(masks: Sequence[np.ndarray], frame_ms: int = FRAME_MS,
+                     speakers: Sequence[str] = CHANNEL_SPEAKERS) -> SegmentTable:
+    """
+    Turn per-channel speech masks into diarization segments.
+
+    Output matches ``SpeakerDiarizer.diarize`` with each turn's ``channel``
+    set, so transcription can decode it from its own channel. Turns from
+    the two channels may overlap, as they do in pyannote output.
+    """
+    runs = [_runs(mask) for mask in masks]
+    scale = frame_ms / 1000.0
+    channels = np.concatenate([np.full(len(starts), channel) for channel, (starts, _) in enumerate(runs)])
+    return SegmentTable.from_arrays(
+        np.round(np.concatenate([starts for starts, _ in runs]) * scale, 2),
+        np.round(np.concatenate([ends for _, ends in runs]) * scale, 2),
+        channels,
+        list(speakers[:len(masks)]),
+        channels,
+    ).sorted()
+
+
+def is_channel_split(channels: np.ndarray, sr: int, mode: Optional[str] = None) -> bool:
+    """True when ``channels`` should take the channel-split path under ``mode`` (default CHANNEL_SPLIT)."""
+    if (mode or CHANNEL_SPLIT).lower() == "off":
+        return False
+    return analyze_channels(channels, sr)["split"]
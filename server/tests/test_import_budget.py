@@ -0,0 +1,18 @@
+"""Every pipeline entry point imports within startup.IMPORT_BUDGET_MS."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from startup import IMPORT_BUDGET_MS, check_budget
+
+
+def describe(result):
+    if "error" in result:
+        return f"{result['module']}: {result['error']}"
+    return f"{result['module']}: {result['ms']} ms > {IMPORT_BUDGET_MS} ms ({', '.join(result['slowest'])})"
+
+
+def test_entry_points_import_within_budget():
+    results = check_budget()
+    assert all(r["ok"] for r in results), "\n".join(describe(r) for r in results if not r["ok"])
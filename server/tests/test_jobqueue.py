@@ -0,0 +1,54 @@
+"""Lease accounting of JobQueue against an in-memory MongoDB."""
+import datetime
+import os
+import sys
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import ObjectId
+
+from jobqueue import JobQueue
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(mongomock.MongoClient()["finsense-ai"], max_attempts=5)
+
+
+def expire_lease(queue, job_id):
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    queue.collection.update_one({"_id": job_id}, {"$set": {"leaseExpiresAt": past}})
+
+
+def make_runnable(queue, job_id):
+    past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1)
+    queue.collection.update_one({"_id": job_id}, {"$set": {"availableAt": past}})
+
+
+def test_deferrals_do_not_count_towards_reaping(queue):
+    job_id = queue.enqueue(str(ObjectId()))
+    for _ in range(queue.max_attempts):
+        job = queue.lease("w1")
+        assert job["_id"] == job_id
+        assert queue.defer(job_id, "w1", 30, "upload not in the store yet")
+        make_runnable(queue, job_id)
+
+    queue.lease("w1")
+    expire_lease(queue, job_id)
+    assert queue.reap() == 0
+    job = queue.collection.find_one({"_id": job_id})
+    assert job["status"] == "leased" and job["leases"] == 1
+
+
+def test_repeatedly_expired_leases_are_dead_lettered(queue):
+    job_id = queue.enqueue(str(ObjectId()))
+    for _ in range(queue.max_attempts):
+        assert queue.lease("w1")["_id"] == job_id
+        expire_lease(queue, job_id)
+
+    assert queue.reap() == 1
+    assert queue.collection.find_one({"_id": job_id})["status"] == "dead"
@@ -1,16 +1,21 @@
 import json
 import os
 import re
+import time
 import logging
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import warnings
 
-import torch
-import librosa
-import soundfile as sf
 import numpy as np
-import whisper
+
+# torch, whisper and librosa are imported where they are used, so importing
+# this module (e.g. for build_combined_text) stays fast
+from vad import compact_speech, detect_speech, extract_speech, restore_times
+from stereo import load_channels
+from model_policy import ModelPolicy, decode_stats
+from segments import SegmentTable, interval_join
+from tuning import tuned
 
 warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,9 +23,33 @@ logger = logging.getLogger(__name__)
 
 
 MODEL_NAME = "base"
-DEVICE = "cpu"
+# Pass as model_name to pick the size per segment with a ModelPolicy
+AUTO_MODEL = "auto"
+DEVICE = tuned("transcript", "device", "cpu")
+SAMPLE_RATE = 16000
 MIN_SEGMENT_DURATION = 0.1
 MAX_SEGMENT_DURATION = 120.0
+USE_VAD = True
+# "turns": one decode per diarized turn; "aligned": decode long windows with
+# word timestamps and assign words to speakers by interval overlap.
+# TRANSCRIPTION_MODE in the environment wins over the tuning profile; an
+# unknown value falls back to "turns" (the worker refuses to start with one,
+# see check_transcription_mode).
+TRANSCRIPTION_MODES = ("turns", "aligned")
+CONFIGURED_TRANSCRIPTION_MODE = os.getenv('TRANSCRIPTION_MODE') or tuned("transcript", "mode", "turns")
+TRANSCRIPTION_MODE = CONFIGURED_TRANSCRIPTION_MODE if CONFIGURED_TRANSCRIPTION_MODE in TRANSCRIPTION_MODES else "turns"
+if TRANSCRIPTION_MODE != CONFIGURED_TRANSCRIPTION_MODE:
+    logger.warning(f"Unknown TRANSCRIPTION_MODE {CONFIGURED_TRANSCRIPTION_MODE!r}, using 'turns' "
+                   f"(expected one of {', '.join(TRANSCRIPTION_MODES)})")
+ALIGN_WINDOW_DURATION = tuned("transcript", "align_window", 600.0)
+MAX_WORD_GAP = 2.0
+
+
+def check_transcription_mode() -> None:
+    """Raise ValueError if the configured transcription mode is not one of TRANSCRIPTION_MODES."""
+    if CONFIGURED_TRANSCRIPTION_MODE not in TRANSCRIPTION_MODES:
+        raise ValueError(f"TRANSCRIPTION_MODE must be one of {TRANSCRIPTION_MODES}, "
+                         f"got {CONFIGURED_TRANSCRIPTION_MODE!r}")
 
 FINANCIAL_CORRECTIONS = {
     r'\be\s*m\s*i\b': 'EMI',
@@ -53,43 +82,27 @@ FINANCIAL_CORRECTIONS = {
 }
 
 
-def load_diarization_json(json_path: str) -> List[Dict]:
+def load_diarization(path: str) -> SegmentTable:
+    """Diarized turns from a ``.seg`` table or a diarization JSON file."""
     try:
-        encodings = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        for encoding in encodings:
-            try:
-                with open(json_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                    
-                if not content.strip():
-                    raise ValueError(f"Diarization file is empty: {json_path}")
-                
-                diarization_data = json.loads(content)
-                break
-            except (UnicodeDecodeError, json.JSONDecodeError) as e:
-                if encoding == encodings[-1]:
-                    raise ValueError(f"Could not parse JSON. Error: {e}")
-                continue
-        
-        if not isinstance(diarization_data, list):
-            raise ValueError("Diarization JSON must be a list of segments")
-        
-        for segment in diarization_data:
-            if not all(key in segment for key in ['start', 'end', 'speaker']):
-                raise ValueError("Each segment must have 'start', 'end', and 'speaker' fields")
-        
-        logger.info(f"Loaded {len(diarization_data)} segments from {json_path}")
-        return diarization_data
-    
+        table = SegmentTable.load(path)
     except Exception as e:
-        logger.error(f"Failed to load diarization JSON: {e}")
+        logger.error(f"Failed to load diarization output: {e}")
         raise
+    logger.info(f"Loaded {len(table)} segments from {path}")
+    return table
+
+
+def load_diarization_json(json_path: str) -> List[Dict]:
+    """Diarized turns as a list of dicts (either file format)."""
+    return load_diarization(json_path).to_records()
 
 
 def load_audio(audio_path: str) -> Tuple[np.ndarray, int]:
+    import librosa
+    
     try:
-        audio, sr = librosa.load(audio_path, sr=16000, mono=True)
+        audio, sr = librosa.load(audio_path, sr=SAMPLE_RATE, mono=True)
         logger.info(f"Loaded audio from {audio_path} - Sample rate: {sr}Hz, Shape: {audio.shape}")
         return audio, sr
     
@@ -113,6 +126,8 @@ def extract_audio_segment(
 
 
 def initialize_whisper_model(model_name: str = MODEL_NAME):
+    import whisper
+    
     logger.info(f"Loading Whisper model: {model_name}")
     
     try:
@@ -125,23 +140,105 @@ def initialize_whisper_model(model_name: str = MODEL_NAME):
         raise
 
 
-def transcribe_segment(audio_segment: np.ndarray, model) -> str:
+class ModelCache:
+    """Load each Whisper size at most once per transcription, on first use."""
+    
+    def __init__(self):
+        self.models = {}
+    
+    def __getitem__(self, model_name: str):
+        if model_name not in self.models:
+            self.models[model_name] = initialize_whisper_model(model_name)
+        return self.models[model_name]
+
+
+def decode_audio(audio: np.ndarray, model, word_timestamps: bool = False) -> Dict:
+    """Run Whisper on an audio array; returns its raw result, or {} on failure."""
+    import torch
+    
     try:
         with torch.no_grad():
-            result = model.transcribe(
-                audio_segment,
+            return model.transcribe(
+                audio,
                 language='en',
                 fp16=False,
-                verbose=False
+                verbose=False,
+                word_timestamps=word_timestamps
             )
-        
-        transcription = result['text'].strip()
-        
-        return transcription
-    
     except Exception as e:
         logger.warning(f"Transcription failed for segment: {e}")
-        return ""
+        return {}
+
+
+def decode_with_policy(
+    audio: np.ndarray,
+    models: ModelCache,
+    policy: ModelPolicy,
+    start: float,
+    end: float,
+    speaker: Optional[str] = None,
+    word_timestamps: bool = False
+) -> Dict:
+    """Decode with the policy's first-pass model and re-decode if the policy escalates."""
+    began = time.monotonic()
+    result = decode_audio(audio, models[policy.first_model], word_timestamps)
+    policy.first_pass_done(len(audio) / SAMPLE_RATE, time.monotonic() - began)
+    
+    if policy.should_escalate(decode_stats(result), start, end, speaker):
+        escalated = decode_audio(audio, models[policy.escalation_model], word_timestamps)
+        if escalated.get('text', '').strip():
+            return escalated
+    return result
+
+
+def transcribe_segment(audio_segment: np.ndarray, model) -> str:
+    return decode_audio(audio_segment, model).get('text', '').strip()
+
+
+def words_from_result(result: Dict) -> List[Dict]:
+    return [
+        {'word': word['word'], 'start': word['start'], 'end': word['end']}
+        for segment in result.get('segments', [])
+        for word in segment.get('words', [])
+    ]
+
+
+def transcribe_words(audio_window: np.ndarray, model) -> List[Dict]:
+    """Decode a long window once and return its words with timestamps (seconds)."""
+    return words_from_result(decode_audio(audio_window, model, word_timestamps=True))
+
+
+def assign_words_to_speakers(
+    word_starts: np.ndarray,
+    word_ends: np.ndarray,
+    turn_starts: np.ndarray,
+    turn_ends: np.ndarray,
+    max_cells: int = 4_000_000
+) -> np.ndarray:
+    """
+    Interval join of words onto diarization turns (see ``segments.interval_join``).
+    
+    Returns:
+        Index into the turn arrays for every word
+    """
+    return interval_join(word_starts, word_ends, turn_starts, turn_ends, max_cells)
+
+
+def group_words_into_turns(words: List[Dict], speakers: np.ndarray, max_gap: float = MAX_WORD_GAP) -> List[Dict]:
+    """Join consecutive words of the same speaker into transcript turns."""
+    turns = []
+    for word, speaker in zip(words, speakers):
+        if turns and turns[-1]['speaker'] == speaker and word['start'] - turns[-1]['end'] <= max_gap:
+            turns[-1]['end'] = word['end']
+            turns[-1]['words'].append(word['word'])
+        else:
+            turns.append({
+                'start': word['start'],
+                'end': word['end'],
+                'speaker': speaker,
+                'words': [word['word']]
+            })
+    return turns
 
 
 def apply_financial_corrections(text: str) -> str:
@@ -208,79 +305,299 @@ def generate_json_output(transcripts: List[Dict], output_path: str) -> None:
         raise
 
 
-def transcribe_diarized_audio(
+def iter_diarized_transcription(
     audio_path: str,
     diarization_json_path: str,
-    model_name: str = MODEL_NAME
-) -> List[Dict]:
-    diarization_segments = load_diarization_json(diarization_json_path)
+    model_name: str = MODEL_NAME,
+    use_vad: bool = USE_VAD,
+    policy: Optional[ModelPolicy] = None
+) -> Iterator[Tuple[Dict, float]]:
+    """
+    Transcribe diarized turns one at a time, yielding each as it finishes.
     
-    audio, sr = load_audio(audio_path)
+    With a ``policy`` (or ``model_name=AUTO_MODEL``) each turn is decoded
+    with a small model first and escalated per turn; see ModelPolicy.
+    
+    Yields:
+        Tuples of (transcript segment, fraction of turns processed so far)
+    """
+    table = load_diarization(diarization_json_path)
     
-    model = initialize_whisper_model(model_name)
+    if table.has_channels:
+        # Channel-split turns are decoded from their own channel, without the other side's crosstalk
+        tracks, sr = load_channels(audio_path, SAMPLE_RATE)
+    else:
+        audio, sr = load_audio(audio_path)
+        tracks = audio[None, :]
     
-    transcripts = []
-    total_segments = len(diarization_segments)
+    models = ModelCache()
+    if policy is None and model_name == AUTO_MODEL:
+        policy = ModelPolicy()
+    if policy is not None:
+        policy.start(table.total_duration())
+        # The escalation model is only loaded if some turn needs it
+        models[policy.first_model]
+    else:
+        model = models[model_name]
+    
+    # Hold music, ringing and dead air inside a turn are dropped before decoding
+    speech_masks = [detect_speech(track, sr) for track in tracks] if use_vad else None
+    turn_seconds = 0.0
+    skipped_seconds = 0.0
+    
+    produced = 0
+    total_segments = len(table)
     
     logger.info(f"Starting transcription of {total_segments} segments...")
     
-    for idx, segment in enumerate(diarization_segments, 1):
-        start_time = segment['start']
-        end_time = segment['end']
-        speaker = segment['speaker']
+    kept = np.flatnonzero(table.duration >= MIN_SEGMENT_DURATION)
+    if len(kept) < total_segments:
+        logger.debug(f"Skipping {total_segments - len(kept)} segment(s) shorter than {MIN_SEGMENT_DURATION}s")
+    tracks_of = np.clip(table.channel, 0, len(tracks) - 1)
+    labels = table.labels
+    
+    for row in kept:
+        idx = int(row) + 1
+        start_time = float(table.start[row])
+        end_time = float(table.end[row])
+        speaker = labels[row]
         duration = end_time - start_time
         
-        if duration < MIN_SEGMENT_DURATION:
-            logger.debug(f"Skipping segment {idx}/{total_segments} (too short: {duration:.2f}s)")
-            continue
-        
         if duration > MAX_SEGMENT_DURATION:
             logger.warning(f"Segment {idx}/{total_segments} is very long ({duration:.2f}s)")
         
         try:
-            audio_segment = extract_audio_segment(audio, sr, start_time, end_time)
+            turn_seconds += duration
+            track = int(tracks_of[row])
+            audio = tracks[track]
+            
+            if speech_masks is not None:
+                audio_segment = extract_speech(audio, sr, speech_masks[track], start_time, end_time)
+                skipped_seconds += duration - len(audio_segment) / sr
+                
+                if len(audio_segment) < MIN_SEGMENT_DURATION * sr:
+                    logger.debug(f"Skipping segment {idx}/{total_segments} (no speech detected)")
+                    continue
+            else:
+                audio_segment = extract_audio_segment(audio, sr, start_time, end_time)
             
-            raw_text = transcribe_segment(audio_segment, model)
+            if policy is not None:
+                result = decode_with_policy(audio_segment, models, policy, start_time, end_time, speaker)
+                raw_text = result.get('text', '').strip()
+            else:
+                raw_text = transcribe_segment(audio_segment, model)
             
             processed_text = post_process_transcription(raw_text)
             
-            transcripts.append({
+            result = {
                 'start': round(start_time, 2),
                 'end': round(end_time, 2),
                 'speaker': speaker,
                 'text': processed_text
-            })
+            }
             
             if idx % 10 == 0:
                 logger.info(f"Processed {idx}/{total_segments} segments")
         
         except Exception as e:
             logger.error(f"Error processing segment {idx}/{total_segments}: {e}")
-            transcripts.append({
+            result = {
                 'start': round(start_time, 2),
                 'end': round(end_time, 2),
                 'speaker': speaker,
                 'text': "[Transcription failed]"
-            })
+            }
+        
+        produced += 1
+        yield result, idx / total_segments
+    
+    if speech_masks is not None and turn_seconds > 0:
+        logger.info(
+            f"VAD skipped {skipped_seconds:.1f}s of {turn_seconds:.1f}s "
+            f"({100 * skipped_seconds / turn_seconds:.1f}%) of non-speech audio"
+        )
+    
+    if policy is not None:
+        logger.info(f"Model policy: {policy.summary()}")
+    
+    logger.info(f"Transcription complete: {produced} segments processed")
+
+
+def iter_aligned_transcription(
+    audio_path: str,
+    diarization_json_path: str,
+    model_name: str = MODEL_NAME,
+    use_vad: bool = USE_VAD,
+    window_duration: float = ALIGN_WINDOW_DURATION,
+    policy: Optional[ModelPolicy] = None
+) -> Iterator[Tuple[Dict, float]]:
+    """
+    Transcribe the whole call in long windows and attribute words to speakers.
+    
+    Instead of one decode per diarized turn, the speech-only audio is decoded
+    a few times with word-level timestamps, so Whisper keeps context across
+    turn boundaries. Words are mapped back to the original timeline and
+    joined onto the diarization turns by interval overlap.
+    
+    With a ``policy`` the escalation decision is made per window.
+    
+    Yields:
+        Tuples of (transcript segment, fraction of audio processed so far)
+    """
+    table = load_diarization(diarization_json_path)
+    
+    audio, sr = load_audio(audio_path)
+    
+    models = ModelCache()
+    if policy is None and model_name == AUTO_MODEL:
+        policy = ModelPolicy()
+    if policy is None:
+        model = models[model_name]
+    
+    turn_speakers = table.labels if len(table) else np.array(['Unknown'], dtype=object)
+    
+    if use_vad:
+        speech, compact_starts, original_starts = compact_speech(audio, sr, detect_speech(audio, sr))
+        logger.info(f"VAD skipped {(len(audio) - len(speech)) / sr:.1f}s of {len(audio) / sr:.1f}s of non-speech audio")
+    else:
+        speech, compact_starts, original_starts = audio, np.zeros(0), np.zeros(0)
+    
+    if policy is not None:
+        policy.start(len(speech) / sr)
+        # The escalation model is only loaded if some window needs it
+        models[policy.first_model]
+    
+    def finish(turn):
+        return {
+            'start': round(float(turn['start']), 2),
+            'end': round(float(turn['end']), 2),
+            'speaker': turn['speaker'],
+            'text': post_process_transcription(''.join(turn['words']))
+        }
+    
+    window = max(1, int(window_duration * sr))
+    decode_calls = 0
+    produced = 0
+    pending = None
+    
+    for offset in range(0, len(speech), window):
+        if policy is not None:
+            window_start, window_end = restore_times(
+                np.array([offset, min(offset + window, len(speech))]) / sr, compact_starts, original_starts
+            )
+            words = words_from_result(decode_with_policy(
+                speech[offset:offset + window], models, policy, float(window_start), float(window_end),
+                word_timestamps=True
+            ))
+        else:
+            words = transcribe_words(speech[offset:offset + window], model)
+        decode_calls += 1
+        progress = min(1.0, (offset + window) / len(speech))
+        
+        if not words:
+            continue
+        
+        shift = offset / sr
+        starts = restore_times(np.array([w['start'] for w in words]) + shift, compact_starts, original_starts)
+        ends = restore_times(np.array([w['end'] for w in words]) + shift, compact_starts, original_starts, side="left")
+        for word, start, end in zip(words, starts, ends):
+            word['start'], word['end'] = start, end
+        
+        speakers = turn_speakers[table.join(starts, ends)]
+        turns = group_words_into_turns(words, speakers)
+        
+        # The last turn may continue in the next window, so hold it back
+        if pending is not None:
+            first = turns[0]
+            if first['speaker'] == pending['speaker'] and first['start'] - pending['end'] <= MAX_WORD_GAP:
+                pending['end'] = first['end']
+                pending['words'].extend(first['words'])
+                turns[0] = pending
+            else:
+                turns.insert(0, pending)
+        pending = turns.pop()
+        
+        for turn in turns:
+            produced += 1
+            yield finish(turn), progress
+    
+    if pending is not None:
+        produced += 1
+        yield finish(pending), 1.0
+    
+    if policy is not None:
+        logger.info(f"Model policy: {policy.summary()}")
+    
+    logger.info(
+        f"Aligned transcription complete: {produced} turns from {decode_calls} decode call(s) "
+        f"covering {len(table)} diarized turns"
+    )
+
+
+def transcribe_diarized_audio(
+    audio_path: str,
+    diarization_json_path: str,
+    model_name: str = MODEL_NAME,
+    use_vad: bool = USE_VAD,
+    on_segment: Optional[Callable[[Dict, float], None]] = None,
+    mode: str = TRANSCRIPTION_MODE,
+    policy: Optional[ModelPolicy] = None
+) -> List[Dict]:
+    if mode == "aligned":
+        iterate = iter_aligned_transcription
+    elif mode == "turns":
+        iterate = iter_diarized_transcription
+    else:
+        raise ValueError(f"Unknown transcription mode: {mode}")
+    
+    transcripts = []
+    
+    for segment, progress in iterate(
+        audio_path=audio_path,
+        diarization_json_path=diarization_json_path,
+        model_name=model_name,
+        use_vad=use_vad,
+        policy=policy
+    ):
+        transcripts.append(segment)
+        if on_segment:
+            on_segment(segment, progress)
     
-    logger.info(f"Transcription complete: {len(transcripts)} segments processed")
     return transcripts
 
 
+def build_combined_text(transcripts: List[Dict]) -> str:
+    """Flatten transcript segments into the `[SPEAKER]: text` string sent for extraction."""
+    full_text = []
+    for segment in transcripts:
+        speaker = segment.get('speaker', 'Unknown')
+        text = segment.get('text', '')
+        if text:
+            full_text.append(f"[{speaker}]: {text}")
+    
+    return " ".join(full_text)
+
+
 def main_transcription_pipeline(
     audio_path: str,
     diarization_json_path: str,
     model_name: str = MODEL_NAME,
-    save_files: bool = True
+    save_files: bool = True,
+    on_segment: Optional[Callable[[Dict, float], None]] = None,
+    mode: str = TRANSCRIPTION_MODE,
+    policy: Optional[ModelPolicy] = None
 ) -> Tuple[List[Dict], str]:
     """
     Main transcription pipeline that returns transcripts and combined text.
     
     Args:
         audio_path: Path to audio file
-        diarization_json_path: Path to diarization JSON
-        model_name: Whisper model name
+        diarization_json_path: Path to the diarization output (.seg table or JSON)
+        model_name: Whisper model name, or AUTO_MODEL to choose the size per segment
         save_files: Whether to save output files (default True)
+        on_segment: Called with (segment, progress) as each turn finishes
+        mode: "turns" (decode per diarized turn) or "aligned" (word-timestamp alignment)
+        policy: Model-size policy to use (and fill with its decisions); implied by AUTO_MODEL
         
     Returns:
         Tuple of (transcripts list, combined text string)
@@ -291,27 +608,30 @@ def main_transcription_pipeline(
         
         text_output_path = audio_dir / f"{audio_filename}_transcript.txt"
         json_output_path = audio_dir / f"{audio_filename}_transcript.json"
+        decisions_output_path = audio_dir / f"{audio_filename}_model_decisions.json"
+        
+        if policy is None and model_name == AUTO_MODEL:
+            policy = ModelPolicy()
         
         transcripts = transcribe_diarized_audio(
             audio_path=audio_path,
             diarization_json_path=diarization_json_path,
-            model_name=model_name
+            model_name=model_name,
+            on_segment=on_segment,
+            mode=mode,
+            policy=policy
         )
         
         # Generate combined text string
-        full_text = []
-        for segment in transcripts:
-            speaker = segment.get('speaker', 'Unknown')
-            text = segment.get('text', '')
-            if text:
-                full_text.append(f"[{speaker}]: {text}")
-        
-        combined_text = " ".join(full_text)
+        combined_text = build_combined_text(transcripts)
         
         # Save files if requested
         if save_files:
             generate_text_output(transcripts, str(text_output_path))
             generate_json_output(transcripts, str(json_output_path))
+            if policy is not None:
+                with open(decisions_output_path, 'w', encoding='utf-8') as f:
+                    json.dump({'summary': policy.summary(), 'decisions': policy.decisions}, f, indent=2)
             
             logger.info("=" * 60)
             logger.info("Transcription pipeline completed successfully!")
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Host-specific performance settings, and the autotuner that measures them.
+
+How many jobs to run at once, how many threads each gets and how large
+the DSP blocks are depend on the machine: its cores, caches and BLAS.
+``autotune`` runs the pipeline's CPU stages on synthetic audio across a
+parameter grid and writes the best settings to ``tuning.json``
+(``TUNING_CONFIG``), in two profiles:
+
+* ``throughput``: most audio processed per second with every slot busy
+  (batch backfills, the worker's default);
+* ``latency``: the shortest time for a single call on an idle machine.
+
+Stage modules read their settings with :func:`tuned` when they are
+imported, so a new config applies from the next worker start. The active
+profile is the file's ``profile`` unless ``TUNING_PROFILE`` overrides it.
+Settings missing from the file (or no file at all) keep the built-in
+defaults.
+
+Examples:
+    python tuning.py autotune
+    python tuning.py autotune --seconds 60 --profile latency
+    python tuning.py show
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import datetime
+import logging
+import platform
+import statistics
+import queue
+import multiprocessing
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+CONFIG_PATH = Path(os.getenv('TUNING_CONFIG', Path(__file__).resolve().parent / 'tuning.json'))
+PROFILES = ("throughput", "latency")
+DEFAULT_PROFILE = "throughput"
+THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+DENOISE_BLOCK_SECONDS = [5, 10, 30, 60, 120]
+VAD_BLOCK_FRAMES = [1024, 2048, 4096, 8192, 16384, 32768]
+ALIGN_WINDOWS = [120.0, 300.0, 600.0]
+# Block sizes only matter on long calls
+DSP_SECONDS = 600.0
+# A built-in default within this fraction of the fastest setting is kept
+TOLERANCE = 0.05
+# Seconds a slot process may take to start (imports, Whisper load, warm-up) before the grid point is dropped
+SLOT_START_TIMEOUT = 600.0
+# ...and then per second of synthetic audio it processes
+SLOT_SECONDS_PER_AUDIO_SECOND = 2.0
+_config = None
+
+
+def read_config(path: Path = CONFIG_PATH) -> Dict:
+    """A tuning file's contents; {} when there is none or it is unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable tuning config {path}: {e}")
+        return {}
+
+
+def load_config() -> Dict:
+    """The host's tuning config, read once per process."""
+    global _config
+    if _config is None:
+        _config = read_config()
+    return _config
+
+
+def active_profile(config: Optional[Dict] = None) -> str:
+    config = load_config() if config is None else config
+    return os.getenv('TUNING_PROFILE') or config.get("profile") or DEFAULT_PROFILE
+
+
+def tuned(section: str, key: str, default: Any = None) -> Any:
+    """A setting of the active profile, or ``default`` when the config does not have it."""
+    config = load_config()
+    value = config.get("profiles", {}).get(active_profile(config), {}).get(section, {}).get(key)
+    return default if value is None else value
+
+
+def save_config(config: Dict, path: Path = CONFIG_PATH) -> Path:
+    staging = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(staging, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    os.replace(staging, path)
+    return path
+
+
+# ---------------------------------------------------------------- measurement
+
+def _best_of(run, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def fastest(timings: Dict, default) -> Any:
+    """Key with the lowest time, unless ``default`` is within TOLERANCE of it (timing noise)."""
+    best = min(timings, key=timings.get)
+    if default in timings and timings[default] <= timings[best] * (1 + TOLERANCE):
+        return default
+    return best
+
+
+def sweep_dsp_blocks(seconds: float = DSP_SECONDS, repeats: int = 3) -> Dict:
+    """Fastest spectral-gate block and VAD FFT block for a call of ``seconds``; the current values win ties."""
+    from benchmark import synthetic_call, line_noise
+    from denoise import NoiseProfile, SpectralGate
+    from denoise import BLOCK_SAMPLES
+    from vad import BLOCK_FRAMES, frame_features
+
+    sr = 16000
+    y = synthetic_call(seconds, sr)
+    y = y + 0.01 * line_noise(len(y), sr)
+    gate = SpectralGate(NoiseProfile.estimate(y, sr))
+
+    denoise = {block: _best_of(lambda: gate.process(y, block=block * sr), repeats)
+               for block in DENOISE_BLOCK_SECONDS if block <= max(seconds, DENOISE_BLOCK_SECONDS[0])}
+    vad = {frames: _best_of(lambda: frame_features(y, sr, block_frames=frames), repeats)
+           for frames in VAD_BLOCK_FRAMES}
+    best_denoise = fastest(denoise, BLOCK_SAMPLES // sr)
+    best_vad = fastest(vad, BLOCK_FRAMES)
+    logger.info(f"DSP blocks: denoise {best_denoise}s ({denoise[best_denoise]:.3f}s), "
+                f"VAD {best_vad} frames ({vad[best_vad]:.3f}s)")
+    return {
+        "denoise": {"block_samples": best_denoise * sr},
+        "vad": {"block_frames": best_vad},
+        "seconds": {"denoise": {str(k): round(v, 4) for k, v in denoise.items()},
+                    "vad": {str(k): round(v, 4) for k, v in vad.items()}},
+    }
+
+
+def representative_job(y, sr: int, decode=None) -> None:
+    """The CPU work of one call: preprocessing, VAD, fast diarization and (if available) Whisper."""
+    from scipy.signal import butter, sosfilt
+    from denoise import reduce_noise
+    from vad import detect_speech
+    from diarization import FastSpeakerDiarizer
+
+    y = sosfilt(butter(5, 50, 'hp', fs=sr, output='sos'), y).astype('float32')
+    mask = detect_speech(y, sr)
+    y = reduce_noise(y, sr, speech_mask=mask)
+    FastSpeakerDiarizer().diarize_array(y, sr)
+    if decode is not None:
+        decode(y[:30 * sr])
+
+
+def _whisper_decoder(threads: int):
+    """tiny-model decode function, or None when Whisper is not installed."""
+    try:
+        import torch
+        import whisper
+    except ImportError:
+        return None
+    torch.set_num_threads(threads)
+    model = whisper.load_model("tiny", device="cpu")
+    return lambda audio: model.transcribe(audio, language='en', fp16=False, verbose=False)
+
+
+def _slot_process(threads: int, seconds: float, repeats: int, barrier, results) -> None:
+    """One concurrent job slot: ``repeats`` representative jobs under a thread budget."""
+    # Thread pools read these when numpy / torch are first imported
+    for var in THREAD_VARS:
+        os.environ[var] = str(threads)
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    if server_dir not in sys.path:
+        sys.path.insert(0, server_dir)
+    from benchmark import synthetic_call
+
+    sr = 16000
+    y = synthetic_call(seconds, sr, seed=os.getpid() % 1000)
+    decode = _whisper_decoder(threads)
+    # Warm up imports and caches outside the measured window
+    representative_job(y[:5 * sr], sr)
+    # Raises BrokenBarrierError when a sibling died or the parent gave up
+    barrier.wait(timeout=SLOT_START_TIMEOUT)
+    jobs = []
+    for _ in range(repeats):
+        started = time.time()
+        representative_job(y, sr, decode)
+        jobs.append((started, time.time()))
+    results.put(jobs)
+
+
+def parallelism_grid(cores: int, max_slots: Optional[int] = None) -> List[Dict]:
+    """Slot / thread combinations that use the machine's cores at most once over."""
+    slots = {1, cores}
+    s = 2
+    while s < cores:
+        slots.add(s)
+        s *= 2
+    grid = []
+    for n in sorted(slots):
+        if max_slots and n > max_slots:
+            continue
+        for threads in sorted({1, max(1, cores // n)}):
+            grid.append({"slots": n, "threads": threads})
+    return grid
+
+
+def measure_parallelism(slots: int, threads: int, seconds: float, repeats: int) -> Optional[Dict]:
+    """
+    Run ``slots`` concurrent job processes; report audio throughput and per-job latency.
+
+    Returns:
+        The measurement, or None if a slot process crashed or did not finish in time
+    """
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(slots)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_slot_process, args=(threads, seconds, repeats, barrier, results))
+                 for _ in range(slots)]
+    for process in processes:
+        process.start()
+
+    deadline = time.monotonic() + SLOT_START_TIMEOUT + repeats * seconds * SLOT_SECONDS_PER_AUDIO_SECOND
+    jobs, reported, failure = [], 0, None
+    while reported < slots and failure is None:
+        try:
+            jobs.extend(results.get(timeout=1.0))
+            reported += 1
+        except queue.Empty:
+            crashed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+            if crashed:
+                failure = f"slot process exited with code {crashed[0]}"
+            elif time.monotonic() > deadline:
+                failure = "timed out"
+    if failure:
+        # Release siblings still waiting to start, then give them a moment to exit
+        barrier.abort()
+    grace = time.monotonic() + 5.0
+    for process in processes:
+        process.join(timeout=None if failure is None else max(0.0, grace - time.monotonic()))
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if failure is None and any(process.exitcode != 0 for process in processes):
+        failure = f"slot process exited with code {next(p.exitcode for p in processes if p.exitcode != 0)}"
+    if failure:
+        logger.warning(f"  slots={slots} threads={threads} skipped: {failure}")
+        return None
+
+    wall = max(end for _, end in jobs) - min(start for start, _ in jobs)
+    latencies = [end - start for start, end in jobs]
+    return {
+        "slots": slots,
+        "threads": threads,
+        "audio_per_s": round(len(jobs) * seconds / wall, 2),
+        "job_latency_s": round(statistics.median(latencies), 3),
+    }
+
+
+def sweep_align_window(seconds: float, threads: int) -> Optional[Dict]:
+    """Fastest aligned-transcription window (audio per Whisper call); None without Whisper."""
+    decode = _whisper_decoder(threads)
+    if decode is None:
+        return None
+    from benchmark import synthetic_call
+    from transcript import ALIGN_WINDOW_DURATION
+
+    sr = 16000
+    y = synthetic_call(max(seconds, max(ALIGN_WINDOWS)), sr)
+    timings = {}
+    for window in ALIGN_WINDOWS:
+        step = int(window * sr)
+        timings[window] = _best_of(lambda: [decode(y[i:i + step]) for i in range(0, len(y), step)], 1)
+    best = fastest(timings, ALIGN_WINDOW_DURATION)
+    return {"align_window": best, "seconds": {str(k): round(v, 3) for k, v in timings.items()}}
+
+
+def detect_device() -> str:
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def autotune(seconds: float = 120.0, repeats: int = 2, max_slots: Optional[int] = None,
+             profile: str = DEFAULT_PROFILE) -> Dict:
+    """
+    Measure this host and build a tuning config with both profiles.
+
+    Returns:
+        The config (not yet saved); ``measurements`` keeps every grid point
+    """
+    cores = os.cpu_count() or 1
+    logger.info(f"Autotuning on {cores} core(s) with {seconds:.0f}s synthetic calls")
+
+    dsp = sweep_dsp_blocks()
+
+    results = []
+    for point in parallelism_grid(cores, max_slots):
+        result = measure_parallelism(point["slots"], point["threads"], seconds, repeats)
+        if result is None:
+            continue
+        logger.info(f"  {result}")
+        results.append(result)
+    if not results:
+        raise RuntimeError("No parallelism setting could be measured; see the skipped grid points above")
+    by_throughput = max(results, key=lambda r: (r["audio_per_s"], -r["job_latency_s"]))
+    by_latency = min(results, key=lambda r: (r["job_latency_s"], -r["audio_per_s"]))
+
+    device = detect_device()
+    align = sweep_align_window(seconds, by_latency["threads"])
+
+    profiles = {}
+    for name, choice in (("throughput", by_throughput), ("latency", by_latency)):
+        transcript = {"device": device}
+        if align:
+            transcript["align_window"] = align["align_window"]
+        profiles[name] = {
+            "worker": {"slots": choice["slots"], "threads": choice["threads"]},
+            "denoise": dsp["denoise"],
+            "vad": dsp["vad"],
+            "transcript": transcript,
+        }
+
+    return {
+        "profile": profile,
+        "profiles": profiles,
+        "host": {
+            "hostname": socket.gethostname(),
+            "cpus": cores,
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "tunedAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        "measurements": {
+            "parallelism": results,
+            "dsp_seconds": dsp["seconds"],
+            "align_window_seconds": align["seconds"] if align else None,
+            "callSeconds": seconds,
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host-specific performance settings")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    tune_parser = sub.add_parser("autotune", help="Benchmark this host and write the tuning config")
+    tune_parser.add_argument("--seconds", type=float, default=120.0, help="Length of each synthetic call")
+    tune_parser.add_argument("--repeats", type=int, default=2, help="Jobs per slot at each grid point")
+    tune_parser.add_argument("--max-slots", type=int, help="Largest concurrency to try")
+    tune_parser.add_argument("--profile", choices=PROFILES, default=DEFAULT_PROFILE, help="Profile to activate")
+    tune_parser.add_argument("--output", type=Path, default=CONFIG_PATH)
+    tune_parser.add_argument("--dry-run", action="store_true", help="Print the config instead of writing it")
+
+    show_parser = sub.add_parser("show", help="Print the active profile's settings")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "autotune":
+        config = autotune(args.seconds, args.repeats, args.max_slots, args.profile)
+        if args.dry_run:
+            print(json.dumps(config, indent=2))
+        else:
+            logger.info(f"Wrote {save_config(config, args.output)}")
+            print(json.dumps(config["profiles"], indent=2))
+    else:
+        config = load_config()
+        profile = active_profile(config)
+        print(json.dumps({
+            "path": str(CONFIG_PATH),
+            "profile": profile,
+            "settings": config.get("profiles", {}).get(profile, {}),
+            "host": config.get("host"),
+        }, indent=2))
@@ -0,0 +1,215 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from tuning import tuned
+
+logger = logging.getLogger(__name__)
+
+
+FRAME_MS = 20
+MARGIN_DB = 10.0
+MIN_ENERGY_DB = -55.0
+MAX_ZCR = 0.45
+MAX_TONALITY = 0.95
+MIN_SPEECH_MS = 150
+MAX_GAP_MS = 300
+PAD_MS = 100
+# FFT block of frame_features; see tuning.py
+BLOCK_FRAMES = tuned("vad", "block_frames", 8192)
+
+
+def frame_signal(y: np.ndarray, frame_length: int, hop_length: int) -> np.ndarray:
+    """
+    Return a strided (n_frames, frame_length) view of a 1-D signal.
+
+    Trailing samples that do not fill a whole frame are dropped.
+    """
+    if len(y) < frame_length:
+        return np.empty((0, frame_length), dtype=y.dtype)
+    frames = np.lib.stride_tricks.sliding_window_view(y, frame_length)
+    return frames[::hop_length]
+
+
+def frame_features(y: np.ndarray, sr: int, frame_ms: int = FRAME_MS,
+                   block_frames: int = BLOCK_FRAMES) -> Dict[str, np.ndarray]:
+    """
+    Compute per-frame energy (dBFS), zero-crossing rate and tonality.
+
+    Tonality is the share of frame power within three bins of the strongest
+    FFT bin; ring-back and DTMF tones sit close to 1, voiced speech spreads
+    its power over many harmonics and stays well below.
+    The FFT runs in blocks so hour-long calls stay within a few MB.
+    """
+    frame_length = int(sr * frame_ms / 1000)
+    frames = frame_signal(np.asarray(y, dtype=np.float32), frame_length, frame_length)
+
+    energy_db = 10.0 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    tonality = np.empty(len(frames), dtype=np.float32)
+    window = np.hanning(frame_length).astype(np.float32)
+    for start in range(0, len(frames), block_frames):
+        block = frames[start:start + block_frames] * window
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        peak = np.argmax(power, axis=1)
+        cumulative = np.concatenate((np.zeros((len(power), 1)), np.cumsum(power, axis=1)), axis=1)
+        rows = np.arange(len(power))
+        lobe = (cumulative[rows, np.minimum(peak + 4, power.shape[1])]
+                - cumulative[rows, np.maximum(peak - 3, 0)])
+        tonality[start:start + block_frames] = lobe / (cumulative[:, -1] + 1e-12)
+
+    return {"energy_db": energy_db, "zcr": zcr, "tonality": tonality}
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start (inclusive) and end (exclusive) indices of True runs in a bool array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[::2], edges[1::2]
+
+
+def smooth_mask(mask: np.ndarray, frame_ms: int = FRAME_MS,
+                min_speech_ms: int = MIN_SPEECH_MS, max_gap_ms: int = MAX_GAP_MS,
+                pad_ms: int = PAD_MS) -> np.ndarray:
+    """
+    Clean up a raw per-frame speech mask.
+
+    Short gaps between speech runs are bridged, isolated blips shorter than
+    ``min_speech_ms`` are dropped and every remaining run is padded so word
+    onsets and tails are not clipped.
+    """
+    mask = mask.copy()
+
+    starts, ends = _runs(~mask)
+    max_gap = max_gap_ms // frame_ms
+    for s, e in zip(starts, ends):
+        if s > 0 and e < len(mask) and e - s <= max_gap:
+            mask[s:e] = True
+
+    starts, ends = _runs(mask)
+    min_speech = max(1, min_speech_ms // frame_ms)
+    for s, e in zip(starts, ends):
+        if e - s < min_speech:
+            mask[s:e] = False
+
+    pad = pad_ms // frame_ms
+    if pad:
+        starts, ends = _runs(mask)
+        for s, e in zip(starts, ends):
+            mask[max(0, s - pad):min(len(mask), e + pad)] = True
+
+    return mask
+
+
+def detect_speech(y: np.ndarray, sr: int, frame_ms: int = FRAME_MS,
+                  margin_db: float = MARGIN_DB, min_energy_db: float = MIN_ENERGY_DB) -> np.ndarray:
+    """
+    Energy / zero-crossing voice activity detection over a whole signal.
+
+    The energy threshold adapts to the recording: it sits ``margin_db``
+    above the 10th-percentile frame energy (the line's noise floor), and
+    never below ``min_energy_db``. Frames that look like hiss (high ZCR)
+    or pure tones (high tonality) are rejected even when loud.
+
+    Returns:
+        Boolean mask with one entry per ``frame_ms`` frame
+    """
+    features = frame_features(y, sr, frame_ms)
+    energy_db = features["energy_db"]
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + margin_db, min_energy_db)
+
+    raw = (
+        (energy_db > threshold)
+        & (features["zcr"] < MAX_ZCR)
+        & (features["tonality"] < MAX_TONALITY)
+    )
+    return smooth_mask(raw, frame_ms)
+
+
+def speech_regions(mask: np.ndarray, frame_ms: int = FRAME_MS) -> List[Tuple[float, float]]:
+    """Convert a frame mask into ``(start, end)`` speech regions in seconds."""
+    starts, ends = _runs(mask)
+    scale = frame_ms / 1000.0
+    return [(round(float(s) * scale, 3), round(float(e) * scale, 3)) for s, e in zip(starts, ends)]
+
+
+def extract_speech(audio: np.ndarray, sr: int, mask: np.ndarray,
+                   start_time: float, end_time: float,
+                   frame_ms: int = FRAME_MS) -> np.ndarray:
+    """
+    Slice ``[start_time, end_time)`` out of ``audio`` keeping only speech frames.
+
+    ``mask`` must come from :func:`detect_speech` on the same ``audio``.
+    Speech regions are concatenated; an empty array means the span held no
+    speech at all.
+    """
+    frame_length = int(sr * frame_ms / 1000)
+    first = int(start_time * sr) // frame_length
+    last = -(-int(end_time * sr) // frame_length)
+    window = mask[first:last]
+
+    if window.all():
+        return audio[int(start_time * sr):int(end_time * sr)]
+
+    starts, ends = _runs(window)
+    if len(starts) == 0:
+        return audio[:0]
+
+    lo = int(start_time * sr)
+    hi = int(end_time * sr)
+    pieces = [
+        audio[max(lo, (first + s) * frame_length):min(hi, (first + e) * frame_length)]
+        for s, e in zip(starts, ends)
+    ]
+    return np.concatenate(pieces)
+
+
+def compact_speech(audio: np.ndarray, sr: int, mask: np.ndarray,
+                   frame_ms: int = FRAME_MS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Concatenate all speech regions of ``audio`` into one shorter signal.
+
+    Returns:
+        Tuple of (compacted audio, region starts in the compacted signal,
+        matching region starts in the original signal), both in seconds.
+        Pass the two arrays to :func:`restore_times` to map timestamps
+        measured on the compacted audio back onto the original timeline.
+    """
+    frame_length = int(sr * frame_ms / 1000)
+    starts, ends = _runs(mask)
+    starts = starts * frame_length
+    ends = np.minimum(ends * frame_length, len(audio))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+
+    if len(starts) == 0:
+        return audio[:0], np.zeros(0), np.zeros(0)
+
+    lengths = ends - starts
+    compact_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    compacted = np.concatenate([audio[s:e] for s, e in zip(starts, ends)])
+    return compacted, compact_starts / sr, starts / sr
+
+
+def restore_times(times: np.ndarray, compact_starts: np.ndarray, original_starts: np.ndarray,
+                  side: str = "right") -> np.ndarray:
+    """
+    Map times on a :func:`compact_speech` signal back to the original recording.
+
+    A time falling exactly on a region boundary maps to the start of the
+    later region with ``side="right"`` (use for start times) and to the end
+    of the earlier region with ``side="left"`` (use for end times).
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if len(compact_starts) == 0:
+        return times
+    region = np.clip(np.searchsorted(compact_starts, times, side=side) - 1, 0, None)
+    return original_starts[region] + (times - compact_starts[region])
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Speaker voiceprint index: assigns ``voiceID`` and flags known fraud voices.
+
+The diarization stage keeps one embedding per speaker (see
+``diarization.save_voiceprints``). Each one is looked up in an on-disk
+inverted-file (IVF) index of every voiceprint seen so far:
+
+* k-means centroids split the vectors into ``nlist`` lists; each list is a
+  pair of append-only files (float32 rows and int64 voice numbers) read
+  through ``np.memmap``, so the index can be far larger than memory and new
+  calls are inserted without a rebuild.
+* A query scores the centroids, scans the ``nprobe`` closest lists and
+  returns the best voices by cosine similarity. At a few thousand vectors
+  per list that is milliseconds for millions of stored voiceprints.
+* Until ``AUTO_TRAIN_SIZE`` vectors exist everything sits in one list
+  (exact search); the index then trains itself once. ``train`` rebuilds
+  it with more lists as it grows.
+
+Voices themselves (calls seen, fraud flag) live in the ``voices``
+collection. A speaker close enough to a stored voice takes its ID, and its
+voiceprint is added as another sample of that voice; otherwise it becomes
+a new voice. Embeddings from different diarization backends are not
+comparable, so each embedding model has its own index directory.
+
+Only models in ``IDENTIFYING_MODELS`` assign voice IDs or raise the fraud
+flag. The MFCC statistics of the fast and channel-split diarizers match
+calls on the same line about as well as the same voice, so a flagged
+fraudster would be reported on unrelated calls; those calls get no voiceID.
+A call is flagged only when its customer is a flagged voice: agents are
+on every call and are never the fraud the flag is about.
+
+Examples:
+    python voiceindex.py flag V00000042 --reason "confirmed card fraud"
+    python voiceindex.py unflag V00000042
+    python voiceindex.py stats --model pyannote
+    python voiceindex.py train --model pyannote --nlist 1024
+"""
+import os
+import json
+import shutil
+import argparse
+import datetime
+import logging
+import contextlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+VOICES_COLLECTION = "voices"
+COUNTERS_COLLECTION = "counters"
+INDEX_DIR = Path(os.getenv('VOICE_INDEX_DIR', Path(__file__).resolve().parent / 'voice_index'))
+# Cosine similarity at which a speaker is taken to be a stored voice, per embedding model
+MATCH_SIMILARITY = {"pyannote": 0.7}
+# Embedding models that separate voices well enough to assign voice IDs and flag fraud
+IDENTIFYING_MODELS = tuple(MATCH_SIMILARITY)
+AUTO_TRAIN_SIZE = 20000
+TRAIN_SAMPLE = 65536
+NPROBE = 16
+SEARCH_K = 10
+# A voice heard on this many calls is an agent, not a customer
+AGENT_MIN_CALLS = 25
+ADD_BLOCK = 65536
+
+
+def default_nlist(count: int) -> int:
+    """About four times the square root of the vector count (at least 16)."""
+    return max(16, int(4 * np.sqrt(count)))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + np.float32(1e-12))
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids of unit vectors by cosine k-means; assignment is one matrix product."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty lists with random vectors rather than leaving them unreachable
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+@contextlib.contextmanager
+def _file_lock(path: Path):
+    """Exclusive lock between processes writing the same index."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class VoiceIndex:
+    """
+    On-disk IVF index of unit-length float32 vectors, each tagged with a voice number.
+
+    Layout of ``directory``::
+
+        meta.json                  dim, nlist and the current generation
+        centroids-<gen>.npy        (nlist, dim) list centroids
+        lists-<gen>/<k>.vec/.ids   list k: float32 rows and int64 voice numbers
+
+    Writers (``add``, ``train``) take a lock file; readers never block.
+    ``train`` writes a new generation and switches ``meta.json`` atomically.
+    """
+
+    def __init__(self, directory, dim: Optional[int] = None):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.meta = None
+        self.centroids = None
+        self._lists = {}
+        self._meta_mtime = None
+
+    @classmethod
+    def for_model(cls, model: str, root: Path = INDEX_DIR) -> "VoiceIndex":
+        return cls(Path(root) / model)
+
+    # ------------------------------------------------------------ layout
+
+    def _list_dir(self, generation: int) -> Path:
+        return self.directory / f"lists-{generation}"
+
+    def _list_path(self, k: int, suffix: str, generation: Optional[int] = None) -> Path:
+        generation = self.meta["generation"] if generation is None else generation
+        return self._list_dir(generation) / f"{k:05d}.{suffix}"
+
+    def _refresh(self) -> bool:
+        """Reload meta.json and the centroids if another process changed them; False if there is no index yet."""
+        path = self.directory / "meta.json"
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime != self._meta_mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self.dim = self.meta["dim"]
+            self.centroids = np.load(self.directory / f"centroids-{self.meta['generation']}.npy")
+            self._lists = {}
+            self._meta_mtime = mtime
+        return True
+
+    def _write_meta(self, meta: Dict) -> None:
+        staging = self.directory / f".meta.json.{os.getpid()}"
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(staging, self.directory / "meta.json")
+
+    def _create(self, dim: int) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._list_dir(0).mkdir(exist_ok=True)
+        # Untrained: one list holds everything and is searched exhaustively
+        np.save(self.directory / "centroids-0.npy", np.zeros((1, dim), dtype=np.float32))
+        self._write_meta({"dim": dim, "nlist": 1, "trained": False, "generation": 0})
+        self._refresh()
+
+    def _list(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and voice numbers of list ``k`` as read-only memmaps, remapped when the list has grown."""
+        vec_path, ids_path = self._list_path(k, "vec"), self._list_path(k, "ids")
+        try:
+            rows = min(vec_path.stat().st_size // (4 * self.dim), ids_path.stat().st_size // 8)
+        except FileNotFoundError:
+            rows = 0
+        cached = self._lists.get(k)
+        if cached is None or len(cached[1]) != rows:
+            if rows == 0:
+                cached = (np.zeros((0, self.dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+            else:
+                cached = (np.memmap(vec_path, dtype=np.float32, mode="r", shape=(rows, self.dim)),
+                          np.memmap(ids_path, dtype=np.int64, mode="r", shape=(rows,)))
+            self._lists[k] = cached
+        return cached
+
+    def __len__(self) -> int:
+        if not self._refresh():
+            return 0
+        return sum(len(self._list(k)[1]) for k in range(self.meta["nlist"]))
+
+    # ------------------------------------------------------------ writes
+
+    def _append(self, vectors: np.ndarray, voices: np.ndarray) -> None:
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        for k in np.unique(assignments):
+            members = assignments == k
+            # Rows first: readers only count rows that also have a voice number
+            with open(self._list_path(int(k), "vec"), "ab") as f:
+                f.write(np.ascontiguousarray(vectors[members]).tobytes())
+            with open(self._list_path(int(k), "ids"), "ab") as f:
+                f.write(voices[members].astype(np.int64).tobytes())
+
+    def add(self, vectors, voices: Iterable[int]) -> None:
+        """Append vectors (one per row) tagged with their voice numbers; trains the index when it first gets big."""
+        vectors = _normalize(vectors)
+        voices = np.asarray(list(voices), dtype=np.int64)
+        if len(vectors) != len(voices):
+            raise ValueError("one voice number per vector is required")
+        if not len(vectors):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with _file_lock(self.directory / ".lock"):
+            if not self._refresh():
+                self._create(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"vector dimension {vectors.shape[1]} does not match the index ({self.dim})")
+            for start in range(0, len(vectors), ADD_BLOCK):
+                self._append(vectors[start:start + ADD_BLOCK], voices[start:start + ADD_BLOCK])
+            if not self.meta["trained"] and len(self) >= AUTO_TRAIN_SIZE:
+                self._train(default_nlist(len(self)))
+
+    def train(self, nlist: Optional[int] = None, seed: int = 0) -> int:
+        """Re-cluster every stored vector into ``nlist`` lists (default from the vector count); returns nlist."""
+        with _file_lock(self.directory / ".lock"):
+            if not self._refresh():
+                raise ValueError(f"No voice index in {self.directory}")
+            return self._train(nlist or default_nlist(len(self)), seed)
+
+    def _train(self, nlist: int, seed: int = 0) -> int:
+        old = self.meta["generation"]
+        sources = [self._list(k) for k in range(self.meta["nlist"])]
+        total = sum(len(ids) for _, ids in sources)
+        nlist = max(1, min(nlist, total))
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(total, size=min(total, TRAIN_SAMPLE), replace=False))
+        offsets = np.cumsum([0] + [len(ids) for _, ids in sources])
+        sample = np.vstack([
+            np.asarray(vecs[sample_rows[(sample_rows >= lo) & (sample_rows < hi)] - lo])
+            for (vecs, _), lo, hi in zip(sources, offsets[:-1], offsets[1:])
+        ])
+        self.centroids = spherical_kmeans(sample, nlist, seed=seed)
+
+        new = old + 1
+        shutil.rmtree(self._list_dir(new), ignore_errors=True)
+        self._list_dir(new).mkdir()
+        self.meta = {**self.meta, "generation": new}
+        for vecs, ids in sources:
+            for start in range(0, len(ids), ADD_BLOCK):
+                self._append(np.asarray(vecs[start:start + ADD_BLOCK]), np.asarray(ids[start:start + ADD_BLOCK]))
+        np.save(self.directory / f"centroids-{new}.npy", self.centroids)
+        self._write_meta({**self.meta, "nlist": nlist, "trained": True})
+
+        # Readers still mapping the old generation keep working on POSIX; elsewhere it goes on the next train
+        self._lists = {}
+        self._meta_mtime = None
+        shutil.rmtree(self._list_dir(old), ignore_errors=True)
+        with contextlib.suppress(OSError):
+            (self.directory / f"centroids-{old}.npy").unlink()
+        self._refresh()
+        logger.info(f"Voice index trained: {total} vectors in {nlist} lists")
+        return nlist
+
+    # ------------------------------------------------------------ reads
+
+    def search(self, vector, k: int = SEARCH_K, nprobe: int = NPROBE) -> List[Tuple[int, float]]:
+        """
+        Best-matching voices for one vector.
+
+        Returns:
+            Up to ``k`` (voice number, cosine similarity) pairs, best first,
+            one per voice
+        """
+        if not self._refresh():
+            return []
+        query = _normalize(vector)[0]
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+
+        scores, voices = [], []
+        for list_id in probe:
+            vecs, ids = self._list(int(list_id))
+            if len(ids):
+                scores.append(vecs @ query)
+                voices.append(ids)
+        if not scores:
+            return []
+        scores, voices = np.concatenate(scores), np.concatenate(voices)
+
+        # Several samples of one voice may rank first; keep each voice's best
+        top = np.argpartition(-scores, k * 4)[:k * 4] if len(scores) > k * 4 else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        hits, seen = [], set()
+        for i in top:
+            voice = int(voices[i])
+            if voice not in seen:
+                seen.add(voice)
+                hits.append((voice, float(scores[i])))
+                if len(hits) == k:
+                    break
+        return hits
+
+
+# ---------------------------------------------------------------- voices
+
+def voice_id(number: int) -> str:
+    return f"V{number:08d}"
+
+
+def _allocate_voices(db, count: int) -> List[int]:
+    """Reserve ``count`` consecutive voice numbers (shared across workers and models)."""
+    from pymongo import ReturnDocument
+
+    counter = db[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": VOICES_COLLECTION}, {"$inc": {"seq": count}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return list(range(counter["seq"] - count + 1, counter["seq"] + 1))
+
+
+def identify_voices(db, voiceprints: Dict[str, List[float]], model: str, file_id,
+                    customer_speaker: Optional[str] = None, index: Optional[VoiceIndex] = None,
+                    threshold: Optional[float] = None) -> Dict:
+    """
+    Match a call's speakers to stored voices and record them as new samples.
+
+    Args:
+        db: Database with the ``voices`` collection
+        voiceprints: Speaker label -> embedding for one call
+        model: Embedding model the voiceprints come from; one of IDENTIFYING_MODELS
+        file_id: The call, remembered on each voice
+        customer_speaker: Speaker known to be the customer (channel-split calls);
+            otherwise the first speaker, in label order from SPEAKER_01, whose
+            voice is not an agent's
+        index: Index to use (default: the model's index under INDEX_DIR)
+        threshold: Match similarity (default MATCH_SIMILARITY for the model)
+
+    Returns:
+        ``{"voiceID", "customer", "fraud", "speakers": {label: {voiceId, similarity, known, fraud}}}``
+        where ``fraud`` is True if the customer is a flagged voice
+
+    Raises:
+        ValueError: If ``model`` cannot tell voices apart (not in IDENTIFYING_MODELS)
+    """
+    if model not in IDENTIFYING_MODELS:
+        raise ValueError(f"{model} voiceprints cannot identify voices; use one of {', '.join(IDENTIFYING_MODELS)}")
+    index = VoiceIndex.for_model(model) if index is None else index
+    threshold = MATCH_SIMILARITY[model] if threshold is None else threshold
+    voices = db[VOICES_COLLECTION]
+    speakers = sorted(voiceprints)
+
+    matches = {}
+    for speaker in speakers:
+        hits = index.search(voiceprints[speaker], k=1)
+        if hits and hits[0][1] >= threshold:
+            matches[speaker] = hits[0]
+    # Two speakers of one call are two voices: only the closer one keeps a shared match
+    for speaker in sorted(matches, key=lambda s: -matches[s][1]):
+        if any(other != speaker and matches[other][0] == matches[speaker][0] and
+               matches[other][1] > matches[speaker][1] for other in matches):
+            del matches[speaker]
+    known = {
+        doc["number"]: doc
+        for doc in voices.find({"number": {"$in": [number for number, _ in matches.values()]}},
+                               {"number": 1, "calls": 1, "fraud": 1})
+    }
+
+    numbers = {speaker: number for speaker, (number, _) in matches.items()}
+    unknown = [speaker for speaker in speakers if speaker not in matches]
+    if unknown:
+        numbers.update(zip(unknown, _allocate_voices(db, len(unknown))))
+    index.add([voiceprints[speaker] for speaker in speakers], [numbers[speaker] for speaker in speakers])
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for speaker in speakers:
+        voices.update_one(
+            {"_id": voice_id(numbers[speaker])},
+            {
+                "$inc": {"calls": 1},
+                "$set": {"lastFileId": file_id, "lastSeen": now},
+                "$setOnInsert": {"number": numbers[speaker], "model": model, "fraud": False,
+                                 "firstFileId": file_id, "createdAt": now},
+            },
+            upsert=True
+        )
+
+    result = {"speakers": {}}
+    for speaker in speakers:
+        doc = known.get(numbers[speaker], {})
+        result["speakers"][speaker] = {
+            "voiceId": voice_id(numbers[speaker]),
+            "similarity": round(matches[speaker][1], 3) if speaker in matches else None,
+            "known": speaker in matches,
+            "fraud": bool(doc.get("fraud")),
+            "calls": doc.get("calls", 0) + 1,
+        }
+
+    if customer_speaker not in result["speakers"]:
+        preferred = sorted(speakers, key=lambda s: (s != "SPEAKER_01", s))
+        customer_speaker = next(
+            (s for s in preferred if result["speakers"][s]["calls"] < AGENT_MIN_CALLS),
+            preferred[0] if preferred else None
+        )
+    result["customer"] = customer_speaker
+    result["voiceID"] = result["speakers"][customer_speaker]["voiceId"] if customer_speaker else None
+    result["fraud"] = bool(customer_speaker and result["speakers"][customer_speaker]["fraud"])
+    return result
+
+
+def flag_voice(db, voice: str, fraud: bool = True, reason: Optional[str] = None) -> bool:
+    """Mark a voice as a known fraudster (or clear it); later calls where it is the customer are flagged."""
+    update = {"fraud": fraud, "fraudUpdatedAt": datetime.datetime.now(datetime.timezone.utc)}
+    if reason:
+        update["fraudReason"] = reason
+    return db[VOICES_COLLECTION].update_one({"_id": voice}, {"$set": update}).matched_count > 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Speaker voiceprint index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    flag_parser = sub.add_parser("flag", help="Mark a voice as a known fraudster")
+    flag_parser.add_argument("voice_id")
+    flag_parser.add_argument("--reason")
+
+    unflag_parser = sub.add_parser("unflag", help="Clear a voice's fraud flag")
+    unflag_parser.add_argument("voice_id")
+
+    stats_parser = sub.add_parser("stats", help="Size and layout of a model's index")
+    stats_parser.add_argument("--model", default="pyannote")
+
+    train_parser = sub.add_parser("train", help="Rebuild a model's index with more lists")
+    train_parser.add_argument("--model", default="pyannote")
+    train_parser.add_argument("--nlist", type=int, help="Number of lists (default: 4 * sqrt(vectors))")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command in ("stats", "train"):
+        index = VoiceIndex.for_model(args.model)
+        if args.command == "train":
+            index.train(args.nlist)
+        count = len(index)
+        print(json.dumps({"model": args.model, "vectors": count, **(index.meta or {})}))
+    else:
+        from pymongo import MongoClient
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+        client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+        try:
+            flagging = args.command == "flag"
+            if flag_voice(client["finsense-ai"], args.voice_id, fraud=flagging,
+                          reason=args.reason if flagging else None):
+                print(f"✓ {args.voice_id} {'flagged as fraud' if flagging else 'cleared'}")
+            else:
+                print(f"⚠ No voice {args.voice_id}")
+        finally:
+            client.close()
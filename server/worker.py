@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""
+Pipeline worker: consumes the durable ``jobs`` queue and runs each file
+through preprocessing, diarization, transcription and extraction.
+
+Uploads and stage outputs live in the content-addressed artifact store
+(artifacts.py), so any worker node can run any stage: inputs are fetched
+by key into a per-job work directory, outputs are put back and their
+keys recorded on the job. Completed stages are recorded on the job, so a
+restarted worker resumes a job after its last completed stage; a stage
+whose output a remaining stage needs but that retention.py has since
+collected is run again first, with the stages after it. ``--reprocess``
+queues a finished call again from a given stage. The worker on the node
+an upload landed on puts it into the store, and the supervisor runs the
+retention policy periodically. Jobs run in child processes, at most one
+per core (or as many as tuning.py found best for the host), with short
+calls scheduled ahead of long ones (see scheduler.py).
+
+Only the node an upload landed on can store it. Every API node runs
+either a full worker or ``worker.py --ingest``; otherwise its uploads
+never reach the store, and jobs waiting for them are reported after
+``SOURCE_WAIT_WARN_MINUTES`` (file status ``waiting_for_upload``).
+
+Examples:
+    python worker.py                      # process jobs until stopped
+    python worker.py --once               # drain runnable jobs, then exit
+    python worker.py --slots 4            # cap concurrency below the core count
+    python worker.py --preload            # start jobs from a forkserver with the models' libraries loaded
+    python worker.py --ingest             # on an API node that runs no worker
+    python worker.py --enqueue 507f1f77bcf86cd799439011
+    python worker.py --reprocess 507f1f77bcf86cd799439011 --from-stage transcribed
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+sys.path.append(os.path.dirname(__file__))
+from jobqueue import JobQueue, STAGES
+from scheduler import SlotScheduler, estimate_audio_seconds, lane_for
+from admission import publish_status, publish_worker, remove_worker
+from startup import job_process_context
+from tuning import active_profile
+from fingerprint import FINGERPRINTS_COLLECTION, FingerprintIndex
+from artifacts import default_cache
+from retention import RETENTION_INTERVAL_MINUTES, GarbageCollector, stage_keys
+
+MONGO_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
+DB_NAME = "finsense-ai"
+COLLECTION_NAME = "fileinfos"
+POLL_INTERVAL = 5
+STATUS_INTERVAL = 5
+# Scratch space for a job's fetched inputs and outputs; removed when the job completes
+WORK_DIR = Path(os.getenv('WORK_DIR', Path(__file__).resolve().parent / 'work'))
+# How long a job waits for another node to put its upload into the artifact store
+SOURCE_WAIT_SECONDS = 30
+# After this long waiting, the job is reported: the upload node is probably not running an ingester
+SOURCE_WAIT_WARN_MINUTES = float(os.getenv('SOURCE_WAIT_WARN_MINUTES', '10'))
+INGEST_BATCH = 20
+# Stage outputs each stage reads
+STAGE_INPUTS = {
+    "preprocessed": [],
+    "diarized": ["preprocessed"],
+    "transcribed": ["preprocessed", "diarized"],
+    "extracted": ["transcribed"],
+}
+# Import torch, whisper, librosa... once at boot instead of in every job process
+PRELOAD = os.getenv('WORKER_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job (our lease expired)."""
+
+
+class SourceUnavailable(Exception):
+    """The upload is on another node and has not reached the artifact store yet."""
+
+
+class LeaseKeeper:
+    """Renew a job lease in the background while a long stage runs."""
+
+    def __init__(self, queue: JobQueue, job_id, worker_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = max(1.0, queue.lease_seconds / 3)
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.queue.heartbeat(self.job_id, self.worker_id):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------------------------------------------------------------- artifacts
+
+def job_dir(file_doc) -> Path:
+    path = WORK_DIR / str(file_doc["_id"])
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def source_path(file_doc) -> str:
+    """Local path of the upload: where it landed if that is this node, else fetched from the store."""
+    address = file_doc.get("fileAddress")
+    if address and os.path.exists(address):
+        return address
+    source = file_doc.get("source")
+    if not source:
+        raise SourceUnavailable(f"Upload {file_doc['_id']} is on {file_doc.get('uploadHost') or 'another node'} "
+                                f"and not in the artifact store yet")
+    return default_cache().materialize(source["key"], job_dir(file_doc) / f"source{Path(source['key']).suffix}")
+
+
+def fetch_cleaned(job, work: Path) -> str:
+    """Local path of the cleaned audio (FLAC or Opus; WAV for jobs from before compression)."""
+    done = job["stages"]["preprocessed"]
+    return fetch(done, work / f"cleaned{Path(done.get('key') or done['path']).suffix}")
+
+
+def fetch(artifacts, dest: Path) -> str:
+    """Local path of a stage's output: the file itself on the node that wrote it, else fetched by key."""
+    path = artifacts.get("path")
+    if path and os.path.exists(path) and os.path.getsize(path) == artifacts.get("size"):
+        return path
+    if artifacts.get("key"):
+        return default_cache().materialize(artifacts["key"], dest)
+    # Recorded before outputs went to the artifact store
+    return path
+
+
+def output_path(path: Path) -> str:
+    """
+    Where a stage writes an output. Fetched inputs are hard links to shared
+    copies, so whatever is at the path is unlinked rather than overwritten.
+    """
+    path.unlink(missing_ok=True)
+    return str(path)
+
+
+def store_output(path: str, **artifacts) -> Dict:
+    stored = default_cache().store.put_file(path)
+    return {"path": path, "key": stored["key"], "size": stored["size"], **artifacts}
+
+
+def artifact_available(artifacts) -> bool:
+    """Whether a completed stage's output can still be read, from the store or this node's cache."""
+    if artifacts.get("key"):
+        cache = default_cache()
+        return cache.has(artifacts["key"]) or cache.store.exists(artifacts["key"])
+    path = artifacts.get("path")
+    return not path or os.path.exists(path)
+
+
+def plan_stages(stages: Dict) -> List[str]:
+    """
+    Stages a job still has to run: everything from the first incomplete
+    stage on, or from an earlier completed stage whose output one of those
+    needs but can no longer be read (collected by retention.py, or lost).
+
+    Re-running a stage does not reproduce its old output (preprocessing
+    blends in the line's current noise profile, so the cleaned audio and
+    every timestamp derived from it change), so the stages after it are
+    re-run as well rather than mixed with outputs of the old run.
+    """
+    start = next((i for i, stage in enumerate(STAGES) if not stages.get(stage)), len(STAGES))
+    # Inputs always come from earlier stages, so ``start`` only moves back
+    moved = True
+    while moved:
+        moved = False
+        for stage in STAGES[start:]:
+            for needed in STAGE_INPUTS[stage]:
+                if STAGES.index(needed) < start and not artifact_available(stages[needed]):
+                    start, moved = STAGES.index(needed), True
+    return STAGES[start:]
+
+
+def ingest_upload(files, file_doc) -> Dict:
+    """Put an upload that landed on this node into the artifact store and record its key."""
+    source = default_cache().store.put_file(file_doc["fileAddress"])
+    files.update_one({"_id": file_doc["_id"]}, {"$set": {"source": source}})
+    return source
+
+
+# ---------------------------------------------------------------- stages
+# Each stage takes the job and file document and returns the artifacts to
+# record on the job. Outputs are put into the artifact store; a completed
+# stage is run again, with the stages after it, only when an output a
+# remaining stage needs is gone (see plan_stages).
+
+def run_preprocess(job, file_doc):
+    from audioprocess import AudioPreprocessor, compress_audio
+
+    work = job_dir(file_doc)
+    processor = AudioPreprocessor()
+    try:
+        cleaned_path = processor.process_pipeline(source_path(file_doc), line_id=file_doc.get("lineId"),
+                                                  output_path=output_path(work / "cleaned.wav"))
+    finally:
+        processor.close_connection()
+
+    if not cleaned_path:
+        raise RuntimeError("Audio preprocessing failed")
+    return store_output(compress_audio(cleaned_path))
+
+
+def run_diarize(job, file_doc, db):
+    from diarization import create_diarizer, save_voiceprints
+    from voiceindex import IDENTIFYING_MODELS
+
+    cleaned_path = fetch_cleaned(job, job_dir(file_doc))
+    output_path(Path(cleaned_path).with_name(f"{Path(cleaned_path).stem}_diarization.seg"))
+    diarizer = create_diarizer()
+    segments = diarizer.diarize(cleaned_path)
+    _, table_path = diarizer.save_results(segments, cleaned_path)
+    artifacts = store_output(table_path, segments=len(segments))
+    if getattr(diarizer, "channel_split", False):
+        artifacts["channelSplit"] = True
+
+    voiceprints_path = save_voiceprints(diarizer, cleaned_path)
+    # A re-run after a resume must not store the call's voices twice
+    if voiceprints_path and not file_doc.get("voiceMatch"):
+        artifacts["voiceprints"] = default_cache().store.put_file(voiceprints_path)["key"]
+        if diarizer.embedding_model not in IDENTIFYING_MODELS:
+            logger.info(f"   {diarizer.embedding_model} voiceprints cannot identify voices, no voiceID assigned")
+            return artifacts
+        try:
+            match = identify_call_voices(db, file_doc, diarizer)
+            artifacts["voiceID"] = match["voiceID"]
+        except Exception as e:
+            logger.warning(f"   Voice lookup failed, continuing without voiceID: {e}")
+    return artifacts
+
+
+def identify_call_voices(db, file_doc, diarizer):
+    """Assign the call's voiceID from the voiceprint index and flag the call if its customer is a known fraud voice."""
+    from voiceindex import identify_voices
+    from stereo import CHANNEL_SPEAKERS
+    from rollups import STATS_COLLECTION, refresh_call_stats
+
+    files = db[COLLECTION_NAME]
+    match = identify_voices(
+        db, diarizer.speaker_embeddings, diarizer.embedding_model, file_doc["_id"],
+        # Channel-split calls put the customer on their own channel
+        customer_speaker=CHANNEL_SPEAKERS[1] if getattr(diarizer, "channel_split", False) else None
+    )
+    update = {"voiceID": match["voiceID"], "voiceMatch": match}
+    if match["fraud"]:
+        update["keyDetails.fraud"] = "yes"
+    files.update_one({"_id": file_doc["_id"]}, {"$set": update})
+    if match["fraud"]:
+        refresh_call_stats(files, db[STATS_COLLECTION], {"_id": file_doc["_id"]})
+        logger.warning(f"   ⚑ Customer is a known fraud voice: {match['voiceID']}")
+    logger.info(f"   Voice {match['voiceID']} ({sum(s['known'] for s in match['speakers'].values())} "
+                f"of {len(match['speakers'])} speaker(s) known)")
+    return match
+
+
+def run_transcribe(job, file_doc, files):
+    from transcript import AUTO_MODEL, TRANSCRIPTION_MODE, main_transcription_pipeline
+    from model_policy import ModelPolicy
+    from progress_sink import MongoProgressSink
+
+    work = job_dir(file_doc)
+    cleaned_path = fetch_cleaned(job, work)
+    table_path = fetch(job["stages"]["diarized"], work / "cleaned_diarization.seg")
+    json_path = output_path(Path(cleaned_path).parent / f"{Path(cleaned_path).stem}_transcript.json")
+    # Admission control may have pinned a smaller model while under load
+    model_name = job.get("modelName") or AUTO_MODEL
+    policy = ModelPolicy() if model_name == AUTO_MODEL else None
+    # Marks the file transcribed, or failed with the partial transcript dropped
+    with MongoProgressSink(files, str(file_doc["_id"])) as sink:
+        transcripts, _ = main_transcription_pipeline(
+            audio_path=cleaned_path,
+            diarization_json_path=table_path,
+            model_name=model_name,
+            mode=TRANSCRIPTION_MODE,
+            save_files=True,
+            on_segment=sink,
+            policy=policy
+        )
+
+    artifacts = store_output(json_path, segments=len(transcripts), modelName=model_name, mode=TRANSCRIPTION_MODE)
+    if policy is not None:
+        artifacts["modelPolicy"] = policy.summary()
+    return artifacts
+
+
+def run_extract(job, file_doc):
+    from getStructuresData import extract as extract_structured_data, file_metadata_from_doc
+    from transcript import build_combined_text
+
+    work = job_dir(file_doc)
+    with open(fetch(job["stages"]["transcribed"], work / "cleaned_transcript.json"), "r", encoding="utf-8") as f:
+        transcripts = json.load(f)
+
+    # The audio itself is not needed: the report only quotes the upload's metadata
+    report = asyncio.run(extract_structured_data(
+        transcript_text=build_combined_text(transcripts),
+        file_id=str(file_doc["_id"]),
+        file_metadata=file_metadata_from_doc(file_doc)
+    ))
+    if report is None:
+        raise RuntimeError("Extraction did not produce a stored report")
+    return {"intent": report.get("intent")}
+
+
+def _run_job_process(job, worker_id: str, threads: int) -> None:
+    """Child process entry point: run one leased job under a thread budget."""
+    # Thread pools read these when torch / numpy are first imported
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    # Ctrl-C stops the supervisor from leasing; running jobs are left to finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    client = MongoClient(MONGO_URI)
+    try:
+        Worker(client[DB_NAME], worker_id=worker_id).process(job)
+    finally:
+        client.close()
+
+
+class Worker:
+    def __init__(self, db, worker_id: str = None, poll_interval: float = POLL_INTERVAL, preload: bool = PRELOAD):
+        self.db = db
+        self.preload = preload
+        self.files = db[COLLECTION_NAME]
+        self.queue = JobQueue(db)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stopping = False
+
+    def stage_runners(self):
+        return {
+            "preprocessed": run_preprocess,
+            "diarized": lambda job, file_doc: run_diarize(job, file_doc, self.db),
+            "transcribed": lambda job, file_doc: run_transcribe(job, file_doc, self.files),
+            "extracted": run_extract
+        }
+
+    def set_file_status(self, file_id, status, **extra):
+        self.files.update_one({"_id": file_id}, {"$set": {"status": status, **extra}})
+
+    def link_if_duplicate(self, file_doc) -> bool:
+        """
+        Fingerprint a new upload and, if it is a copy of an already extracted
+        call, give it that call's results instead of running the pipeline.
+        A weaker match is only recorded as ``possibleDuplicateOf``.
+        """
+        from fingerprint import LINKABLE_MATCHES, fingerprint_file, flag_possible_duplicate, link_duplicate
+        from rollups import STATS_COLLECTION, refresh_call_stats
+
+        try:
+            fingerprint = fingerprint_file(source_path(file_doc))
+        except SourceUnavailable:
+            raise
+        except Exception as e:
+            logger.warning(f"   Fingerprinting failed, processing normally: {e}")
+            return False
+
+        index = FingerprintIndex(self.db[FINGERPRINTS_COLLECTION])
+        original = index.find_duplicate(fingerprint, exclude=file_doc["_id"])
+        index.add(file_doc["_id"], fingerprint)
+        if not original:
+            return False
+        if original["match"] not in LINKABLE_MATCHES:
+            flag_possible_duplicate(self.files, file_doc["_id"], original)
+            logger.info(f"   ≈ possible duplicate of {original['fileId']} "
+                        f"(similarity {original['similarity']}), processing normally")
+            return False
+        if not link_duplicate(self.files, file_doc["_id"], original):
+            return False
+
+        refresh_call_stats(self.files, self.db[STATS_COLLECTION], {"_id": file_doc["_id"]})
+        logger.info(f"   ≡ {original['match']} duplicate of {original['fileId']} "
+                    f"(similarity {original['similarity']}), linked to its results")
+        return True
+
+    def process(self, job) -> None:
+        """Run the remaining stages of a leased job."""
+        job_id = job["_id"]
+        file_doc = self.files.find_one({"_id": job["fileId"]})
+        if not file_doc:
+            # The upload was deleted while queued; nothing left to do
+            logger.warning(f"File {job['fileId']} no longer exists, closing job {job_id}")
+            self.queue.complete(job_id, self.worker_id)
+            return
+
+        logger.info(f"▶ Job {job_id} for {file_doc.get('keyDetails', {}).get('filename')} "
+                    f"(attempt {job.get('attempts', 0) + 1})")
+        self.set_file_status(file_doc["_id"], "processing")
+        runners = self.stage_runners()
+        job.setdefault("stages", {})
+
+        try:
+            # Later stages may run on another node
+            if not file_doc.get("source") and os.path.exists(file_doc.get("fileAddress") or ""):
+                file_doc["source"] = ingest_upload(self.files, file_doc)
+
+            # Only before the first stage: a resumed job was already checked, and a reprocessed one is meant to run
+            if not job["stages"] and not job.get("reprocessedAt") and self.link_if_duplicate(file_doc):
+                self.queue.complete(job_id, self.worker_id)
+                logger.info(f"✅ Job {job_id} complete (duplicate upload)")
+                return
+
+            planned = plan_stages(job["stages"])
+            if planned and job["stages"].get(planned[0]):
+                logger.info(f"   ↺ {planned[0]} output is needed but was collected, re-running from {planned[0]}")
+            for stage in STAGES:
+                if stage not in planned:
+                    logger.info(f"   ↷ {stage} already done")
+                    continue
+
+                started = time.time()
+                with LeaseKeeper(self.queue, job_id, self.worker_id) as keeper:
+                    artifacts = runners[stage](job, file_doc)
+                if keeper.lost:
+                    raise LeaseLost(f"Lease lost during {stage}")
+
+                artifacts["seconds"] = round(time.time() - started, 2)
+                if not self.queue.complete_stage(job_id, self.worker_id, stage, artifacts):
+                    raise LeaseLost(f"Lease lost after {stage}")
+                job["stages"][stage] = artifacts
+                self.set_file_status(file_doc["_id"], stage)
+                logger.info(f"   ✓ {stage} in {artifacts['seconds']}s")
+
+            self.queue.complete(job_id, self.worker_id)
+            # A note from waiting for the upload no longer applies
+            self.files.update_one({"_id": file_doc["_id"]}, {"$unset": {"processingError": ""}})
+            shutil.rmtree(WORK_DIR / str(file_doc["_id"]), ignore_errors=True)
+            logger.info(f"✅ Job {job_id} complete")
+
+        except LeaseLost as e:
+            logger.warning(f"Abandoning job {job_id}: {e}")
+        except SourceUnavailable as e:
+            waited = (job.get("deferrals", 0) + 1) * SOURCE_WAIT_SECONDS
+            if waited >= SOURCE_WAIT_WARN_MINUTES * 60:
+                message = (f"{e} after {waited / 60:.0f} min; run `worker.py --ingest` "
+                           f"on {file_doc.get('uploadHost') or 'the upload node'}")
+                logger.warning(f"   ⏸ {message}")
+                self.set_file_status(file_doc["_id"], "waiting_for_upload", processingError=message)
+            else:
+                logger.info(f"   ⏸ {e}; retrying in {SOURCE_WAIT_SECONDS}s")
+            self.queue.defer(job_id, self.worker_id, SOURCE_WAIT_SECONDS, str(e))
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            status = self.queue.fail(job_id, self.worker_id, repr(e))
+            if status == "dead":
+                self.set_file_status(file_doc["_id"], "failed", processingError=repr(e))
+                logger.error(f"☠ Job {job_id} dead-lettered after repeated failures")
+
+    def annotate_jobs(self) -> None:
+        """Estimate cost and assign a lane to newly queued jobs."""
+        for job in self.queue.unannotated():
+            file_doc = self.files.find_one({"_id": job["fileId"]}, {"keyDetails": 1, "fileAddress": 1, "source": 1}) or {}
+            source = file_doc.get("source")
+            seconds = estimate_audio_seconds(
+                file_doc.get("keyDetails") or {}, file_doc.get("fileAddress"),
+                # Reads just the header, with range requests
+                open_source=(lambda: default_cache().store.open(source["key"])) if source else None
+            )
+            self.queue.annotate(job["_id"], lane_for(seconds), seconds)
+
+    def ingest_uploads(self) -> int:
+        """Put uploads that landed on this node into the artifact store so other nodes can process them."""
+        ingested = 0
+        pending = self.files.find(
+            {"uploadHost": socket.gethostname(), "source": None, "fileAddress": {"$exists": True}},
+            {"fileAddress": 1}, limit=INGEST_BATCH
+        )
+        for file_doc in pending:
+            if not os.path.exists(file_doc["fileAddress"]):
+                continue
+            try:
+                ingest_upload(self.files, file_doc)
+                ingested += 1
+            except Exception as e:
+                logger.warning(f"Could not store upload {file_doc['_id']}: {e}")
+        return ingested
+
+    def run_ingest(self, once: bool = False) -> None:
+        """
+        Only put this node's uploads into the artifact store, without running
+        jobs: for the API node when it runs no full worker. With ``once``,
+        exit when nothing is left to store.
+        """
+        logger.info(f"Ingesting uploads of {socket.gethostname()} into the artifact store")
+        while not self.stopping:
+            ingested = self.ingest_uploads()
+            if ingested:
+                logger.info(f"Stored {ingested} upload(s)")
+            elif once:
+                break
+            if ingested < INGEST_BATCH:
+                time.sleep(self.poll_interval)
+
+    def run(self, once: bool = False, slots: int = None) -> None:
+        """
+        Supervise up to ``slots`` jobs at a time, each in its own process.
+        
+        Each child gets an even share of the cores as its torch/BLAS thread
+        budget, so concurrent jobs do not oversubscribe the machine.
+        """
+        from transcript import check_transcription_mode
+
+        # A bad setting would otherwise fail every job's transcribe stage until it is dead-lettered
+        check_transcription_mode()
+        self.queue.ensure_indexes()
+        FingerprintIndex(self.db[FINGERPRINTS_COLLECTION]).ensure_indexes()
+        scheduler = SlotScheduler(slots=slots)
+        ctx = job_process_context(enabled=self.preload)
+        running = {}
+        logger.info(f"Worker {self.worker_id} started with {scheduler.slots} slot(s) "
+                    f"({scheduler.reserved} reserved for short calls), tuning profile {active_profile()}")
+
+        collector = GarbageCollector(self.db, default_cache().store)
+        collector.ensure_indexes()
+        last_status = last_retention = 0.0
+        while not (self.stopping and not running):
+            # Share capacity and admission limits with the upload route
+            if time.time() - last_status >= STATUS_INTERVAL:
+                publish_worker(self.db, self.worker_id, scheduler.slots, scheduler.total_active)
+                publish_status(self.db)
+                last_status = time.time()
+
+            # Reap finished children
+            for job_id, (proc, lane) in list(running.items()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                scheduler.finished(lane)
+                del running[job_id]
+                if proc.exitcode != 0:
+                    # The child died without recording the failure itself
+                    self.queue.fail(job_id, self.worker_id, f"Worker process exited with code {proc.exitcode}")
+
+            started = False
+            if not self.stopping:
+                self.queue.reap()
+                self.ingest_uploads()
+                self.annotate_jobs()
+                if RETENTION_INTERVAL_MINUTES and time.time() - last_retention >= RETENTION_INTERVAL_MINUTES * 60:
+                    last_retention = time.time()
+                    try:
+                        collector.collect()
+                    except Exception as e:
+                        logger.warning(f"Retention run failed: {e}")
+                for lane in scheduler.lanes_to_try():
+                    job = self.queue.lease(self.worker_id, lane=lane)
+                    if job is None:
+                        continue
+                    threads = scheduler.threads_for_next(waiting=self.queue.count_runnable())
+                    proc = ctx.Process(target=_run_job_process, args=(job, self.worker_id, threads), daemon=False)
+                    proc.start()
+                    scheduler.started(lane)
+                    running[job["_id"]] = (proc, lane)
+                    started = True
+                    logger.info(f"Started job {job['_id']} in {lane} lane "
+                                f"(~{job.get('estimatedSeconds')}s audio, {threads} thread(s))")
+                    break
+
+            if once and not running and not started:
+                break
+            if not started:
+                time.sleep(self.poll_interval if not running else min(1.0, self.poll_interval))
+
+        remove_worker(self.db, self.worker_id)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    def stop(self, *_):
+        logger.info("Stopping after the running jobs finish...")
+        self.stopping = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FinSense AI pipeline worker")
+    parser.add_argument("--once", action="store_true", help="Exit when no job is runnable")
+    parser.add_argument("--worker-id", type=str, help="Worker ID (default: host-pid)")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--slots", type=int, help="Concurrent jobs (default: tuning.json, else one per CPU core)")
+    parser.add_argument("--preload", action="store_true", default=PRELOAD,
+                        help="Preload stage libraries in a forkserver (default: WORKER_PRELOAD)")
+    parser.add_argument("--ingest", action="store_true",
+                        help="Only store this node's uploads in the artifact store (for an API node without a worker)")
+    parser.add_argument("--enqueue", type=str, metavar="FILE_ID", help="Queue a file and exit")
+    parser.add_argument("--retry-dead", type=str, metavar="JOB_ID", help="Requeue a dead-lettered job and exit")
+    parser.add_argument("--reprocess", type=str, metavar="FILE_ID",
+                        help="Queue a finished or dead file again from --from-stage and exit")
+    parser.add_argument("--from-stage", choices=STAGES, default=STAGES[-1],
+                        help="First stage --reprocess runs (default: %(default)s)")
+    args = parser.parse_args()
+
+    mongo_client = MongoClient(MONGO_URI)
+    db = mongo_client[DB_NAME]
+
+    try:
+        if args.enqueue:
+            job_id = JobQueue(db).enqueue(args.enqueue)
+            print(f"✓ Queued job {job_id}" if job_id else "⚠ File already has a job")
+        elif args.retry_dead:
+            ok = JobQueue(db).retry_dead(args.retry_dead)
+            print("✓ Job requeued" if ok else "⚠ No dead job with that ID")
+        elif args.reprocess:
+            dropped = JobQueue(db).reprocess(args.reprocess, args.from_stage)
+            if dropped is None:
+                print("⚠ No finished or dead job for that file")
+            else:
+                # The dropped outputs are no longer on the job, so retention would never find them
+                freed = GarbageCollector(db, default_cache().store).release(
+                    key for record in dropped.values() for key in stage_keys(record))
+                print(f"✓ Queued again from {args.from_stage} "
+                      f"({freed['objects']} superseded output(s), {freed['bytes']} bytes released)")
+        else:
+            worker = Worker(db, worker_id=args.worker_id, poll_interval=args.poll_interval, preload=args.preload)
+            signal.signal(signal.SIGINT, worker.stop)
+            signal.signal(signal.SIGTERM, worker.stop)
+            if args.ingest:
+                worker.run_ingest(once=args.once)
+            else:
+                worker.run(once=args.once, slots=args.slots)
+    finally:
+        mongo_client.close()